@@ -0,0 +1,507 @@
+"""
+Offline backtests of the webhook trading rules.
+
+Replays BUY/SELL signals against historical candles with the rules of
+webhooks.trading: one open position per ticker and timeframe, a fixed
+position_usdt per entry and never selling below the average buy price. Fills
+and P&L are computed with NumPy over whole signal streams, and parameter
+sweeps run on a process pool over memory-mapped candles:
+
+    store = CandleStore.build('candles/', {'BTC-USDT': 'btc_1m.csv', 'ETH-USDT': 'eth_1m.parquet'})
+    for params, summary in sweep(store, {'fast': [5, 10, 20], 'slow': [50, 100]}, position_usdt=100)[:5]:
+        print(params, summary['total_pnl'])
+
+Reading Parquet needs pyarrow.
+"""
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+BUY = 1
+SELL = -1
+
+COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+# Accepted names of the time column, in candle exports and signal files
+TIME_COLUMNS = ('timestamp', 'time', 'open_time', 'date', 'datetime')
+
+# Parameters of the generated crossover signals, the others are passed to backtest
+SIGNAL_PARAMETERS = ('fast', 'slow')
+
+
+def _epoch_ms(values) -> np.ndarray:
+    """Convert datetimes, ISO 8601 strings or epoch seconds/milliseconds to epoch milliseconds"""
+    values = np.asarray(values)
+    if values.dtype.kind in 'US':
+        try:
+            values = values.astype(np.float64)
+        except ValueError:
+            values = values.astype('datetime64[ms]')
+    elif values.dtype.kind == 'O':
+        values = np.array([value.timestamp() if isinstance(value, datetime) else float(value) for value in values])
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[ms]').astype(np.int64)
+    values = values.astype(np.float64)
+    if len(values) and np.nanmax(np.abs(values)) < 1e11:
+        # Seconds, milliseconds since 1973 are larger
+        values = values * 1000
+    return values.astype(np.int64)
+
+
+def _find_column(names: Sequence[str], candidates: Sequence[str]) -> str:
+    lowered = {name.lower(): name for name in names}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    raise ValueError(f"None of the columns {', '.join(candidates)} found in {', '.join(names)}")
+
+
+def _read_csv(path) -> Dict[str, np.ndarray]:
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        columns = list(zip(*reader)) or [()] * len(header)
+    return {name: np.array(column) for name, column in zip(header, columns)}
+
+
+class Candles:
+    """
+    OHLCV candles of one ticker, sorted by their epoch millisecond timestamp.
+    """
+    __slots__ = COLUMNS
+
+    def __init__(self, timestamp, open, high, low, close, volume=None):
+        self.timestamp = np.asarray(timestamp, dtype=np.int64)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.zeros(len(self.timestamp)) if volume is None else np.asarray(volume, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @classmethod
+    def from_columns(cls, columns: Mapping[str, Any]) -> 'Candles':
+        names = list(columns)
+        timestamp = _epoch_ms(columns[_find_column(names, TIME_COLUMNS)])
+        order = np.argsort(timestamp, kind='stable')
+        values = {name: np.asarray(columns[_find_column(names, (name,))], dtype=np.float64)[order]
+                  for name in ('open', 'high', 'low', 'close')}
+        volume = None
+        if any(name.lower() == 'volume' for name in names):
+            volume = np.asarray(columns[_find_column(names, ('volume',))], dtype=np.float64)[order]
+        return cls(timestamp[order], volume=volume, **values)
+
+    @classmethod
+    def from_csv(cls, path) -> 'Candles':
+        """Read a candle export with a time column and open, high, low, close and optionally volume"""
+        return cls.from_columns(_read_csv(path))
+
+    @classmethod
+    def from_parquet(cls, path) -> 'Candles':
+        """Read candles from Parquet, memory-mapping the file"""
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet candles needs pyarrow, pip install pyarrow")
+        table = pq.read_table(path, memory_map=True)
+        return cls.from_columns({name: table.column(name).to_numpy() for name in table.column_names})
+
+    @classmethod
+    def read(cls, path) -> 'Candles':
+        """Read a .csv or .parquet file"""
+        if Path(path).suffix.lower() in ('.parquet', '.pq'):
+            return cls.from_parquet(path)
+        return cls.from_csv(path)
+
+    def save(self, directory):
+        """Write one .npy file per column, see load"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in COLUMNS:
+            np.save(directory / f'{name}.npy', getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap: bool = True) -> 'Candles':
+        """Load candles written by save, memory-mapped so processes share the pages instead of copies"""
+        mode = 'r' if mmap else None
+        return cls(**{name: np.load(Path(directory) / f'{name}.npy', mmap_mode=mode) for name in COLUMNS})
+
+
+class CandleStore:
+    """
+    Candles of many tickers, one directory of .npy columns per ticker.
+
+    Pickles as its path, so worker processes map the files themselves.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._candles: Dict[str, Candles] = {}
+
+    @classmethod
+    def build(cls, directory, sources: Mapping[str, Any]) -> 'CandleStore':
+        """Import CSV or Parquet files, or Candles, by ticker"""
+        for ticker, source in sources.items():
+            candles = source if isinstance(source, Candles) else Candles.read(source)
+            candles.save(Path(directory) / ticker)
+        return cls(directory)
+
+    def tickers(self) -> List[str]:
+        return sorted(path.name for path in self.directory.iterdir() if (path / 'close.npy').exists())
+
+    def get(self, ticker: str) -> Optional[Candles]:
+        candles = self._candles.get(ticker)
+        if candles is None and (self.directory / ticker / 'close.npy').exists():
+            candles = self._candles[ticker] = Candles.load(self.directory / ticker)
+        return candles
+
+    def __getstate__(self):
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+
+class Signals:
+    """
+    A stream of BUY/SELL signals, as arrays.
+    """
+    __slots__ = ('time', 'ticker', 'timeframe', 'side')
+
+    def __init__(self, time, ticker, timeframe, side):
+        """
+        Args:
+            time: Epoch milliseconds the alerts fired at, see from_records for other formats
+            ticker: Trading pair of each signal
+            timeframe: Timeframe of each signal
+            side: BUY (1) or SELL (-1), or the strings
+        """
+        self.time = np.asarray(time, dtype=np.int64)
+        self.ticker = np.asarray(ticker, dtype=str)
+        self.timeframe = np.asarray(timeframe, dtype=str)
+        side = np.asarray(side)
+        if side.dtype.kind in 'USO':
+            side = np.where(np.char.upper(side.astype(str)) == 'BUY', BUY, SELL)
+        self.side = side.astype(np.int8)
+
+    def __len__(self):
+        return len(self.time)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[Any, str, str, str]]) -> 'Signals':
+        """Build from (time, ticker, side, timeframe) tuples, times as datetimes, ISO strings or epoch seconds"""
+        records = list(records)
+        if not records:
+            return cls([], [], [], [])
+        time, ticker, side, timeframe = zip(*records)
+        return cls(_epoch_ms(np.array(time, dtype=object)), ticker, timeframe, side)
+
+    @classmethod
+    def from_csv(cls, path) -> 'Signals':
+        """Read recorded alerts with time, ticker, side and timeframe columns"""
+        columns = _read_csv(path)
+        names = list(columns)
+        return cls(
+            _epoch_ms(columns[_find_column(names, TIME_COLUMNS)]),
+            columns[_find_column(names, ('ticker', 'symbol'))],
+            columns[_find_column(names, ('timeframe',))],
+            columns[_find_column(names, ('side',))],
+        )
+
+    @classmethod
+    def concat(cls, streams: Sequence['Signals']) -> 'Signals':
+        if not streams:
+            return cls([], [], [], [])
+        return cls(*(np.concatenate([getattr(stream, name) for stream in streams]) for name in cls.__slots__))
+
+
+def _moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    sums = np.cumsum(values, dtype=np.float64)
+    averages = np.full(len(values), np.nan)
+    if window <= len(values):
+        averages[window - 1:] = (sums[window - 1:] - np.concatenate(([0.0], sums[:-window]))) / window
+    return averages
+
+
+def crossover_signals(candles: Candles, ticker: str, fast: int, slow: int, timeframe: str = '1m') -> Signals:
+    """
+    Generated signals: BUY when the fast moving average of the close crosses
+    above the slow one, SELL when it crosses back below.
+    """
+    above = _moving_average(candles.close, fast) > _moving_average(candles.close, slow)
+    valid = np.zeros(len(candles), dtype=bool)
+    valid[slow:] = True
+    crossed = np.flatnonzero(valid[1:] & (above[1:] != above[:-1])) + 1
+    return Signals(
+        candles.timestamp[crossed],
+        np.full(len(crossed), ticker),
+        np.full(len(crossed), timeframe),
+        np.where(above[crossed], BUY, SELL),
+    )
+
+
+def _first_at_least(values: np.ndarray, starts: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """
+    For every query, the first index from its start where values reach its threshold.
+
+    len(values) when there's none. Answers all queries at once by descending a
+    sparse table of range maxima, O((n + queries) log n).
+    """
+    n = len(values)
+    levels = max(1, n.bit_length())
+    tables = [np.append(values, -np.inf)]
+    for level in range(1, levels):
+        previous = tables[-1]
+        shifted = np.minimum(np.arange(n + 1) + (1 << (level - 1)), n)
+        tables.append(np.maximum(previous, previous[shifted]))
+    position = starts.astype(np.int64)
+    for level in reversed(range(levels)):
+        skip = tables[level][np.minimum(position, n)] < thresholds
+        position = np.where(skip, position + (1 << level), position)
+    return np.minimum(position, n)
+
+
+def _replay(side: np.ndarray, quote: np.ndarray, slippage: float, sell_below_buy: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Apply the position rules to one ticker and timeframe's signals, in time order.
+
+    Returns the indexes of the signals that opened a position and of those
+    that closed it, -1 for positions still open.
+    """
+    n = len(side)
+    buys = np.flatnonzero(side == BUY)
+    if not len(buys):
+        return buys, buys
+    sell_quotes = np.where(side == SELL, quote, -np.inf)
+    if sell_below_buy:
+        thresholds = np.full(len(buys), np.finfo(np.float64).min)
+    else:
+        # A SELL below the average buy price is ignored and the position stays open
+        thresholds = quote[buys] * (1 + slippage)
+    closes = _first_at_least(sell_quotes, buys + 1, thresholds)
+
+    # BUYs while a position is open are ignored, the next position opens on the first BUY after the close
+    following = np.searchsorted(buys, closes, side='right')
+    next_open = np.where((closes < n) & (following < len(buys)), following, -1).tolist()
+    opened = []
+    current = 0
+    while current >= 0:
+        opened.append(current)
+        current = next_open[current]
+    opened = np.array(opened)
+    closed_by = closes[opened]
+    return buys[opened], np.where(closed_by < n, closed_by, -1)
+
+
+class BacktestResult:
+    """
+    Simulated positions, one array per Position field.
+
+    avg_sell_price is NaN and closed_at -1 for positions still open at the
+    end, they are valued at mark_price, the last close of their ticker.
+    """
+
+    def __init__(self, ticker, timeframe, created_at, closed_at, quantity, avg_buy_price, avg_sell_price, fees,
+                 mark_price):
+        self.ticker = ticker
+        self.timeframe = timeframe
+        self.created_at = created_at
+        self.closed_at = closed_at
+        self.quantity = quantity
+        self.avg_buy_price = avg_buy_price
+        self.avg_sell_price = avg_sell_price
+        self.fees = fees
+        self.mark_price = mark_price
+
+    def __len__(self):
+        return len(self.ticker)
+
+    @property
+    def quantity_usdt(self) -> np.ndarray:
+        return self.avg_buy_price * self.quantity
+
+    @property
+    def closed(self) -> np.ndarray:
+        return self.closed_at >= 0
+
+    @property
+    def pnl(self) -> np.ndarray:
+        """Profit of each closed position net of fees, NaN while open"""
+        return (self.avg_sell_price - self.avg_buy_price) * self.quantity - self.fees
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals like PositionQuerySet.pnl_summary, plus fees, unrealized P&L and max drawdown"""
+        closed = self.closed
+        pnl = self.pnl[closed]
+        holding = self.closed_at[closed] - self.created_at[closed]
+        equity = np.concatenate(([0.0], np.cumsum(pnl[np.argsort(self.closed_at[closed], kind='stable')])))
+        still_open = ~closed
+        return {
+            'positions': len(self),
+            'closed': int(closed.sum()),
+            'wins': int((pnl > 0).sum()),
+            'total_pnl': float(pnl.sum()),
+            'fees': float(self.fees.sum()),
+            'avg_holding_time': timedelta(milliseconds=float(holding.mean())) if len(holding) else None,
+            'win_rate': float((pnl > 0).sum() * 100 / len(pnl)) if len(pnl) else None,
+            'unrealized_pnl': float(((self.mark_price - self.avg_buy_price) * self.quantity)[still_open].sum()),
+            'max_drawdown': float((np.maximum.accumulate(equity) - equity).max()),
+        }
+
+    def records(self) -> List[Dict[str, Any]]:
+        """The positions as dicts with the fields of webhooks.models.Position"""
+        def moment(ms):
+            return datetime.fromtimestamp(ms / 1000, tz=timezone.utc) if ms >= 0 else None
+
+        def decimal(value):
+            return Decimal(repr(float(value))) if not np.isnan(value) else None
+
+        return [
+            {
+                'ticker': str(self.ticker[i]),
+                'timeframe': str(self.timeframe[i]),
+                'quantity': decimal(self.quantity[i]),
+                'quantity_usdt': decimal(self.quantity_usdt[i]),
+                'avg_buy_price': decimal(self.avg_buy_price[i]),
+                'avg_sell_price': decimal(self.avg_sell_price[i]),
+                'created_at': moment(int(self.created_at[i])),
+                'closed_at': moment(int(self.closed_at[i])),
+            }
+            for i in range(len(self))
+        ]
+
+
+def backtest(candles: Mapping[str, Candles], signals: Signals, position_usdt: float = 100, slippage: float = 0.0,
+             fee_rate: float = 0.0, sell_below_buy: bool = False) -> BacktestResult:
+    """
+    Replay signals with the webhook's trading rules.
+
+    Args:
+        candles: Candles by ticker, a dict or a CandleStore; signals fill at the
+            close of the last candle at or before them, signals without one are dropped
+        signals: Signals to replay
+        position_usdt: USDT spent on each entry, like the position_usdt setting
+        slippage: Adverse price move of every fill, as a fraction of the price
+        fee_rate: Fee on the value of every fill, as a fraction
+        sell_below_buy: Let SELLs close positions below the average buy price, the live rules don't
+    """
+    quote = np.full(len(signals), np.nan)
+    marks = {}
+    for ticker in np.unique(signals.ticker):
+        series = candles.get(ticker)
+        if series is None or not len(series):
+            continue
+        rows = np.flatnonzero(signals.ticker == ticker)
+        index = np.searchsorted(series.timestamp, signals.time[rows], side='right') - 1
+        found = index >= 0
+        quote[rows[found]] = series.close[index[found]]
+        marks[ticker] = float(series.close[-1])
+
+    # Each ticker and timeframe is its own stream, replayed in time order
+    _, ticker_codes = np.unique(signals.ticker, return_inverse=True)
+    _, timeframe_codes = np.unique(signals.timeframe, return_inverse=True)
+    order = np.lexsort((signals.time, timeframe_codes, ticker_codes))
+    order = order[~np.isnan(quote[order])]
+    streams = ticker_codes[order] * (timeframe_codes.max(initial=0) + 1) + timeframe_codes[order]
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(streams)) + 1, [len(order)]))
+
+    opens, closes = [], []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        rows = order[start:end]
+        opened, closed = _replay(signals.side[rows], quote[rows], slippage, sell_below_buy)
+        opens.append(rows[opened])
+        closes.append(np.where(closed >= 0, rows[closed], -1))
+    opens = np.concatenate(opens) if opens else np.array([], dtype=np.int64)
+    closes = np.concatenate(closes) if closes else np.array([], dtype=np.int64)
+
+    is_closed = closes >= 0
+    close_rows = np.where(is_closed, closes, 0)
+    # Like open_position: the quantity comes from the quoted price, the fill moves by the slippage
+    quantity = position_usdt / quote[opens]
+    avg_buy_price = quote[opens] * (1 + slippage)
+    avg_sell_price = np.where(is_closed, quote[close_rows] * (1 - slippage), np.nan)
+    fees = fee_rate * quantity * (avg_buy_price + np.where(is_closed, avg_sell_price, 0))
+    ticker = signals.ticker[opens]
+    return BacktestResult(
+        ticker=ticker,
+        timeframe=signals.timeframe[opens],
+        created_at=signals.time[opens],
+        closed_at=np.where(is_closed, signals.time[close_rows], -1),
+        quantity=quantity,
+        avg_buy_price=avg_buy_price,
+        avg_sell_price=avg_sell_price,
+        fees=fees,
+        mark_price=np.array([marks.get(name, np.nan) for name in ticker]),
+    )
+
+
+_sweep = {}
+
+
+def _init_sweep(store: CandleStore, signals: Optional[Signals], tickers: List[str], timeframe: str,
+                fixed: Dict[str, Any]):
+    """Process pool initializer, the shared inputs are sent once per worker instead of per task"""
+    _sweep.update(store=store, signals=signals, tickers=tickers, timeframe=timeframe, fixed=fixed,
+                  generated=(None, None))
+
+
+def _run_combination(params: Dict[str, Any]) -> Dict[str, Any]:
+    params = {**_sweep['fixed'], **params}
+    signals = _sweep['signals']
+    if signals is None:
+        key = tuple(params.pop(name) for name in SIGNAL_PARAMETERS)
+        cached_key, signals = _sweep['generated']
+        if cached_key != key:
+            # Combinations sharing the signal parameters are consecutive, generate once for all of them
+            fast, slow = key
+            signals = Signals.concat([
+                crossover_signals(_sweep['store'].get(ticker), ticker, fast, slow, _sweep['timeframe'])
+                for ticker in _sweep['tickers']
+            ])
+            _sweep['generated'] = (key, signals)
+    return backtest(_sweep['store'], signals, **params).summary()
+
+
+def sweep(store: CandleStore, grid: Mapping[str, Iterable], signals: Signals = None, tickers: List[str] = None,
+          timeframe: str = '1m', workers: int = None, **fixed) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Backtest every combination of the grid's parameters on a process pool.
+
+    Args:
+        store: Candles of the tickers
+        grid: Values to try per parameter of backtest, plus fast and slow, the
+            moving averages of the crossover signals generated when no signals are given
+        signals: Recorded signals to replay instead of generating them
+        tickers: Tickers to generate signals for, default all in the store
+        timeframe: Timeframe of the generated signals
+        workers: Processes to use, default one per core, 1 runs in this process
+        **fixed: Parameters shared by every combination
+
+    Returns (parameters, summary) pairs, best total P&L first.
+    """
+    # Signal parameters vary slowest, so consecutive combinations reuse the generated signals
+    names = sorted(grid, key=lambda name: name not in SIGNAL_PARAMETERS)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if signals is None:
+        missing = [name for name in SIGNAL_PARAMETERS if name not in grid and name not in fixed]
+        if missing:
+            raise ValueError(f"Without signals, {' and '.join(missing)} must be given to generate them")
+    initargs = (store, signals, tickers or store.tickers(), timeframe, fixed)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_sweep(*initargs)
+        summaries = [_run_combination(combination) for combination in combinations]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep, initargs=initargs) as pool:
+            chunksize = max(1, len(combinations) // (workers * 4))
+            summaries = list(pool.map(_run_combination, combinations, chunksize=chunksize))
+    return sorted(zip(combinations, summaries), key=lambda item: item[1]['total_pnl'], reverse=True)
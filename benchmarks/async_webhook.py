@@ -0,0 +1,77 @@
+"""
+Compare the WSGI and ASGI webhook paths during an alert storm.
+
+The WSGI path is driven by a fixed pool of threads, like gunicorn sync workers,
+the ASGI path fires every alert concurrently on one event loop. Both talk to a
+local BingX simulator that answers after --latency seconds.
+
+    python benchmarks/async_webhook.py --alerts 50 --workers 4 --latency 0.1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import WEBHOOK_HEADERS, alert, setup_django, start_exchange, teardown_django
+
+
+def run_wsgi(alerts: int, workers: int) -> float:
+    from django.db import connection
+    from django.test import Client
+
+    def fire(i):
+        try:
+            response = Client().post('/webhook/', alert(f"WSGI{i}-USDT", 'BUY'),
+                                     content_type='text/plain', headers=WEBHOOK_HEADERS)
+            assert response.status_code == 200, response.content
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fire, range(alerts)))
+    return time.perf_counter() - start
+
+
+async def run_asgi(alerts: int) -> float:
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+
+    async def fire(i):
+        response = await client.post('/webhook/async/', alert(f"ASGI{i}-USDT", 'BUY'),
+                                     content_type='text/plain', headers=WEBHOOK_HEADERS)
+        assert response.status_code == 200, response.content
+
+    start = time.perf_counter()
+    await asyncio.gather(*(fire(i) for i in range(alerts)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=50, help='Alerts fired in the storm')
+    parser.add_argument('--workers', type=int, default=4, help='Sync workers available to the WSGI path')
+    parser.add_argument('--latency', type=float, default=0.1, help='Exchange simulator latency in seconds')
+    args = parser.parse_args()
+
+    _, server, url = start_exchange(latency=args.latency)
+    setup_django(exchange_url=url)
+    try:
+        wsgi = run_wsgi(args.alerts, args.workers)
+        asgi = asyncio.run(run_asgi(args.alerts))
+    finally:
+        teardown_django()
+        server.shutdown()
+
+    print(f"{'path':<6} {'alerts':>7} {'seconds':>9} {'alerts/s':>9}")
+    print(f"{'wsgi':<6} {args.alerts:>7} {wsgi:>9.3f} {args.alerts / wsgi:>9.1f}")
+    print(f"{'asgi':<6} {args.alerts:>7} {asgi:>9.3f} {args.alerts / asgi:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure backtest sweep throughput on synthetic minute candles.
+
+Builds a candle store of --tickers random walks of --days days of minute
+candles, then sweeps the crossover strategy over the fast and slow moving
+averages, slippage and fee rates with --workers processes. The candles are
+memory-mapped, every worker shares the same pages.
+
+    python benchmarks/backtest_sweep.py --tickers 20 --days 365 --workers 4
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backtest import CandleStore, Candles, sweep
+
+
+def random_walk(minutes: int, seed: int) -> Candles:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, minutes)))
+    timestamp = 1_700_000_000_000 + np.arange(minutes, dtype=np.int64) * 60_000
+    return Candles(timestamp, close, close * 1.0005, close * 0.9995, close, rng.uniform(1, 10, minutes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=20, help='Tickers in the store')
+    parser.add_argument('--days', type=int, default=365, help='Days of minute candles per ticker')
+    parser.add_argument('--workers', type=int, help='Processes, default one per core')
+    parser.add_argument('--fast', default='5,10,20,40', help='Fast moving averages to try')
+    parser.add_argument('--slow', default='50,100,200', help='Slow moving averages to try')
+    args = parser.parse_args()
+
+    minutes = args.days * 24 * 60
+    directory = tempfile.mkdtemp(prefix='backtest-')
+    try:
+        start = time.perf_counter()
+        store = CandleStore.build(directory, {f'T{i}-USDT': random_walk(minutes, i) for i in range(args.tickers)})
+        built = time.perf_counter() - start
+
+        grid = {
+            'fast': [int(value) for value in args.fast.split(',')],
+            'slow': [int(value) for value in args.slow.split(',')],
+            'slippage': [0, 0.0005],
+            'fee_rate': [0, 0.0005],
+        }
+        start = time.perf_counter()
+        results = sweep(store, grid, workers=args.workers, position_usdt=100)
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+
+    candles = args.tickers * minutes
+    print(f"store: {args.tickers} tickers x {minutes} candles built in {built:.2f}s")
+    print(f"sweep: {len(results)} combinations in {seconds:.2f}s, {len(results) / seconds:.1f} combinations/s, "
+          f"{candles * len(results) / seconds / 1e6:.1f}M candles/s")
+    params, summary = results[0]
+    print(f"best: {params} P&L {summary['total_pnl']:.2f} over {summary['closed']} closed positions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks run against a throwaway test database created from the configured
+DATABASES (use the project's Postgres for representative numbers).
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# One of the TradingView addresses always present in WEBHOOK_IP_ALLOWED
+WEBHOOK_HEADERS = {'X-Forwarded-For': '52.89.214.238'}
+
+# Credentials shared by the app and the exchange simulator
+API_KEY = 'benchmark'
+SECRET_KEY = 'benchmark'
+
+
+def start_exchange(**options):
+    """
+    Serve a BingX simulator over HTTP, options are passed to BingXSimulator.
+
+    Returns the simulator, its server and base URL.
+    """
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    from bingx_simulator import BingXSimulator
+
+    simulator = BingXSimulator(API_KEY, SECRET_KEY, **options)
+    server, url = simulator.serve()
+    return simulator, server, url
+
+
+def setup_django(exchange_url: str = None, telegram_url: str = None):
+    """
+    Configure Django and create the test database.
+
+    Must run before the webhooks app imports bingx_client so the exchange URL is picked up.
+    """
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'liftoff.settings')
+    # The test clients connect from 127.0.0.1, like a proxy forwarding WEBHOOK_HEADERS
+    os.environ.setdefault('TRUSTED_PROXIES', '127.0.0.1')
+    if exchange_url:
+        os.environ['API_KEY'] = API_KEY
+        os.environ['SECRET_KEY'] = SECRET_KEY
+        os.environ['BASE_URL'] = exchange_url
+        os.environ['BASE_URL_DEMO'] = exchange_url
+        # The simulator doesn't enforce BingX's rate limits, so the client doesn't either
+        for group in ('MARKET', 'TRADE', 'ACCOUNT'):
+            os.environ.setdefault(f'BINGX_{group}_RATE', '0')
+    if telegram_url:
+        os.environ['TELEGRAM_API_URL'] = telegram_url
+        os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'benchmark')
+        os.environ.setdefault('TELEGRAM_CHAT_ID', '1')
+
+    import django
+    from django.conf import settings
+    from django.test.utils import setup_test_environment
+
+    django.setup()
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['*']
+
+    from django.db import connection
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    from webhooks.models import Settings
+    Settings.objects.create(key='trading_enabled', value='true')
+    Settings.objects.create(key='position_usdt', value='100')
+
+
+def teardown_django():
+    from django.db import connection
+    connection.creation.destroy_test_db(connection.settings_dict['NAME'], verbosity=0)
+
+
+def alert(ticker: str, side: str, timeframe: str = '1h', alert_id: str = None) -> bytes:
+    body = f"ticker: {ticker}\nside: {side}\ntimeframe: {timeframe}\n"
+    if alert_id:
+        body += f"alert_id: {alert_id}\n"
+    return body.encode('utf-8')
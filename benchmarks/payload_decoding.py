@@ -0,0 +1,48 @@
+"""
+Per-alert cost of decoding and validating webhook payloads in each format.
+
+    python benchmarks/payload_decoding.py --number 20000
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhooks.payload import decode_payload, validate_signal
+
+YAML_BODY = b"ticker: BTC-USDT\nside: BUY\ntimeframe: 60\nuse_demo: false\n"
+JSON_BODY = b'{"ticker": "BTC-USDT", "side": "BUY", "timeframe": "60", "use_demo": false}'
+
+
+def cases():
+    yield 'yaml SafeLoader', lambda: yaml.load(YAML_BODY, Loader=yaml.SafeLoader)
+    if yaml.__with_libyaml__:
+        yield 'yaml CSafeLoader', lambda: yaml.load(YAML_BODY, Loader=yaml.CSafeLoader)
+    yield 'json', lambda: json.loads(JSON_BODY)
+    yield 'decode yaml', lambda: decode_payload(YAML_BODY, 'text/plain')
+    yield 'decode json', lambda: decode_payload(JSON_BODY, 'application/json')
+    yield 'decode+validate yaml', lambda: validate_signal(decode_payload(YAML_BODY, 'text/plain'))
+    yield 'decode+validate json', lambda: validate_signal(decode_payload(JSON_BODY, 'application/json'))
+    decoded = json.loads(JSON_BODY)
+    yield 'validate only', lambda: validate_signal(decoded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20000, help='Calls per measurement')
+    parser.add_argument('--repeat', type=int, default=5, help='Measurements, the best one is reported')
+    args = parser.parse_args()
+
+    print(f"{'case':<22} {'us/call':>9}")
+    for name, func in cases():
+        best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+        print(f"{name:<22} {best / args.number * 1e6:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Measure open-position lookup latency as the Position table grows.
+
+Fills the table with mostly closed positions (one open position per
+ticker/timeframe at most) and times the queries on the webhook hot path and
+the admin changelist, with and without the Position indexes.
+
+    python benchmarks/position_lookup.py --sizes 10000 1000000 10000000
+
+Sizes in the millions should be run against Postgres, where rows are
+generated server side with generate_series.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import setup_django, teardown_django
+
+TICKERS = [f"T{i}-USDT" for i in range(500)]
+TIMEFRAMES = ['5m', '15m', '1h', '4h']
+BATCH_SIZE = 10000
+
+
+def fill(size: int):
+    """Grow the table to `size` rows, leaving one open position per ticker/timeframe"""
+    from django.db import connection
+    from django.utils import timezone
+    from webhooks.models import Position
+
+    existing = Position.objects.count()
+    missing = size - existing
+    if missing <= 0:
+        return
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO webhooks_position
+                    (ticker, timeframe, quantity, quantity_usdt, avg_buy_price, avg_sell_price, demo,
+                     created_at, updated_at, closed_at)
+                SELECT 'T' || (i %% %s) || '-USDT', (ARRAY['5m','15m','1h','4h'])[1 + (i / %s) %% 4],
+                       1, 100, 100, 101, false,
+                       now() - i * interval '1 minute', now(), now() - i * interval '1 minute'
+                FROM generate_series(%s, %s) AS i
+                """,
+                [len(TICKERS), len(TICKERS), existing, size - 1],
+            )
+    else:
+        now = timezone.now()
+        for start in range(existing, size, BATCH_SIZE):
+            Position.objects.bulk_create([
+                Position(
+                    ticker=TICKERS[i % len(TICKERS)],
+                    timeframe=TIMEFRAMES[(i // len(TICKERS)) % len(TIMEFRAMES)],
+                    quantity=1, quantity_usdt=100, avg_buy_price=100, avg_sell_price=101,
+                    closed_at=now,
+                )
+                for i in range(start, min(start + BATCH_SIZE, size))
+            ])
+
+    Position.objects.filter(closed_at__isnull=True).delete()
+    Position.objects.bulk_create([
+        Position(ticker=ticker, timeframe=TIMEFRAMES[0], quantity=1, quantity_usdt=100, avg_buy_price=100)
+        for ticker in TICKERS
+    ])
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE webhooks_position")
+
+
+def set_indexes(enabled: bool):
+    from django.db import connection
+    from webhooks.models import Position
+
+    meta = Position._meta
+    with connection.schema_editor() as schema_editor:
+        for index in meta.indexes:
+            if enabled:
+                schema_editor.add_index(Position, index)
+            else:
+                schema_editor.remove_index(Position, index)
+        for constraint in meta.constraints:
+            if enabled:
+                schema_editor.add_constraint(Position, constraint)
+            else:
+                schema_editor.remove_constraint(Position, constraint)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE webhooks_position")
+
+
+def timed(query, iterations: int) -> float:
+    """Median latency of `query` in milliseconds"""
+    samples = []
+    for _ in range(iterations):
+        ticker = random.choice(TICKERS)
+        timeframe = random.choice(TIMEFRAMES)
+        start = time.perf_counter()
+        query(ticker, timeframe)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def measure(iterations: int):
+    from webhooks.models import Position
+
+    def exists(ticker, timeframe):
+        Position.objects.filter(ticker=ticker, timeframe=timeframe, closed_at__isnull=True).exists()
+
+    def get(ticker, timeframe):
+        try:
+            Position.objects.get(ticker=ticker, timeframe=timeframe, closed_at__isnull=True)
+        except Position.DoesNotExist:
+            pass
+
+    def changelist(ticker, timeframe):
+        list(Position.objects.filter(ticker=ticker).order_by('-created_at')[:100])
+
+    def changelist_unfiltered(ticker, timeframe):
+        list(Position.objects.order_by('-created_at')[:100])
+
+    return {
+        'exists': timed(exists, iterations),
+        'get': timed(get, iterations),
+        'admin ticker': timed(changelist, iterations),
+        'admin all': timed(changelist_unfiltered, iterations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 1000000, 10000000],
+                        help='Table sizes to measure, in increasing order')
+    parser.add_argument('--iterations', type=int, default=200, help='Queries timed per measurement')
+    args = parser.parse_args()
+
+    setup_django()
+    try:
+        print(f"{'rows':>10} {'indexes':>8} " + ' '.join(f"{name:>13}" for name in
+                                                      ('exists', 'get', 'admin ticker', 'admin all')) + '  (median ms)')
+        for size in sorted(args.sizes):
+            fill(size)
+            for enabled in (True, False):
+                if not enabled:
+                    set_indexes(False)
+                results = measure(args.iterations)
+                if not enabled:
+                    set_indexes(True)
+                print(f"{size:>10} {'yes' if enabled else 'no':>8} " +
+                      ' '.join(f"{value:>13.3f}" for value in results.values()))
+    finally:
+        teardown_django()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Stress the per-position locks with conflicting alerts.
+
+Fires --copies identical BUY alerts (each with its own alert_id, so duplicate
+suppression doesn't hide the race) for each of --tickers tickers at once, then
+the same storm of SELLs. Every ticker must end up with exactly one buy and one
+sell order at the exchange. A third round sends one BUY per unrelated ticker to
+show they still run in parallel.
+
+    python benchmarks/position_race.py --tickers 4 --copies 8 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import WEBHOOK_HEADERS, alert, setup_django, start_exchange, teardown_django
+
+
+def storm(alerts, workers: int):
+    from django.db import connection
+    from django.test import Client
+
+    def fire(ticker_side):
+        ticker, side = ticker_side
+        try:
+            response = Client().post('/webhook/', alert(ticker, side, alert_id=uuid.uuid4().hex),
+                                     content_type='text/plain', headers=WEBHOOK_HEADERS)
+            return response.status_code
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(fire, alerts))
+    return Counter(statuses), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=4, help='Tickers receiving conflicting alerts')
+    parser.add_argument('--copies', type=int, default=8, help='Concurrent copies of each alert')
+    parser.add_argument('--latency', type=float, default=0.05, help='Exchange simulator latency in seconds')
+    args = parser.parse_args()
+
+    simulator, server, url = start_exchange(latency=args.latency, volatility=0)
+    setup_django(exchange_url=url)
+    workers = args.tickers * args.copies
+    tickers = [f"RACE{i}-USDT" for i in range(args.tickers)]
+    rounds = []
+    try:
+        for side in ('BUY', 'SELL'):
+            alerts = [(ticker, side) for ticker in tickers for _ in range(args.copies)]
+            statuses, seconds = storm(alerts, workers)
+            rounds.append((f"conflicting {side}", len(alerts), statuses, seconds))
+        alerts = [(f"FREE{i}-USDT", 'BUY') for i in range(workers)]
+        statuses, seconds = storm(alerts, workers)
+        rounds.append(("unrelated BUY", len(alerts), statuses, seconds))
+    finally:
+        teardown_django()
+        server.shutdown()
+
+    print(f"{'round':<17} {'alerts':>7} {'seconds':>8} {'alerts/s':>9}  statuses")
+    for name, count, statuses, seconds in rounds:
+        summary = ', '.join(f"{status}:{n}" for status, n in sorted(statuses.items()))
+        print(f"{name:<17} {count:>7} {seconds:>8.3f} {count / seconds:>9.1f}  {summary}")
+
+    orders = Counter((order['symbol'], order['side']) for order in simulator.orders)
+    raced = {key: n for key, n in orders.items() if key[0].startswith('RACE') and n != 1}
+    print(f"orders per conflicting ticker and side: {'all exactly 1' if not raced else raced}")
+    sys.exit(1 if raced else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Local stand-in for the Telegram Bot API sendMessage and getMe endpoints.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.messages += 1
+        self._reply({'ok': True, 'result': {}})
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self._reply({'ok': True, 'result': {'id': 1, 'is_bot': True, 'username': 'stub_bot'}})
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TelegramStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start_telegram_stub(latency: float = 0.1, host: str = '127.0.0.1', port: int = 0):
+    """
+    Start the stub on a background thread.
+
+    Returns the server and its base URL, server.messages counts delivered messages.
+    """
+    server = TelegramStubServer((host, port), TelegramStubHandler)
+    server.latency = latency
+    server.messages = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
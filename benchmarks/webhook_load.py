@@ -0,0 +1,312 @@
+"""
+End-to-end latency and throughput of the webhook endpoints.
+
+Runs the Django app in-process against the BingX simulator and a Telegram stub and
+fires a BUY/SELL mix at increasing concurrency. Every worker trades its own
+tickers, sending SELL for tickers it holds and BUY otherwise, so positions open
+and close like they do in production; the simulator's price random walk makes some
+SELLs land below the buy price and exercise the Telegram path.
+
+For each concurrency level it reports p50/p95/p99 latency, throughput, DB
+queries per request and a per-stage breakdown (payload parsing, database,
+exchange and everything else). --output writes the results as JSON so runs can
+be compared across changes.
+
+    python benchmarks/webhook_load.py --concurrency 1,4,16 --requests 200 --output load.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import WEBHOOK_HEADERS, alert, setup_django, start_exchange, teardown_django
+from benchmarks.telegram_stub import start_telegram_stub
+
+PATHS = {'wsgi': '/webhook/', 'asgi': '/webhook/async/'}
+STAGES = ('parse', 'db', 'exchange', 'other')
+TICKERS_PER_WORKER = 3
+
+# Per-request accumulator, a mutable dict so updates made in sync_to_async threads are seen
+_sample = contextvars.ContextVar('sample', default=None)
+
+
+def _add(stage: str, elapsed: float, count: int = 0):
+    sample = _sample.get()
+    if sample is not None:
+        sample[stage] += elapsed
+        sample['queries'] += count
+
+
+def instrument():
+    """Patch timers around payload parsing, SQL execution and exchange calls"""
+    from django.db.backends.utils import CursorWrapper
+
+    import bingx_client
+    from webhooks import views
+
+    execute = CursorWrapper._execute_with_wrappers
+
+    def timed_execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return execute(self, *args, **kwargs)
+        finally:
+            _add('db', time.perf_counter() - start, 1)
+
+    CursorWrapper._execute_with_wrappers = timed_execute
+
+    parse_signal = views.parse_signal
+
+    def timed_parse(request):
+        start = time.perf_counter()
+        try:
+            return parse_signal(request)
+        finally:
+            _add('parse', time.perf_counter() - start)
+
+    views.parse_signal = timed_parse
+
+    make_request = bingx_client.BingXClient._make_request
+
+    def timed_request(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return make_request(self, *args, **kwargs)
+        finally:
+            _add('exchange', time.perf_counter() - start)
+
+    bingx_client.BingXClient._make_request = timed_request
+
+    amake_request = bingx_client.AsyncBingXClient._make_request
+
+    async def atimed_request(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await amake_request(self, *args, **kwargs)
+        finally:
+            _add('exchange', time.perf_counter() - start)
+
+    bingx_client.AsyncBingXClient._make_request = atimed_request
+
+
+class Trader:
+    """
+    Picks the next alert for one worker, tracking which of its tickers are open.
+    """
+
+    def __init__(self, prefix: str):
+        self.tickers = [f"{prefix}T{i}-USDT" for i in range(TICKERS_PER_WORKER)]
+        self.open = set()
+
+    def next_alert(self):
+        ticker = random.choice(self.tickers)
+        side = 'SELL' if ticker in self.open else 'BUY'
+        return ticker, side, alert(ticker, side, alert_id=uuid.uuid4().hex)
+
+    def record(self, ticker: str, side: str, status: int):
+        if status == 200:
+            if side == 'BUY':
+                self.open.add(ticker)
+            else:
+                self.open.discard(ticker)
+
+
+def _new_sample():
+    return {'parse': 0.0, 'db': 0.0, 'exchange': 0.0, 'queries': 0}
+
+
+def _finish_sample(sample, status, elapsed):
+    sample['total'] = elapsed
+    sample['other'] = max(elapsed - sample['parse'] - sample['db'] - sample['exchange'], 0.0)
+    sample['status'] = status
+    return sample
+
+
+def run_wsgi(level: int, requests: int):
+    from django.db import connection
+    from django.test import Client
+
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def work(worker):
+        client = Client()
+        trader = Trader(f"W{level}N{worker}")
+        samples = []
+        try:
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return samples
+                ticker, side, body = trader.next_alert()
+                sample = _new_sample()
+                token = _sample.set(sample)
+                start = time.perf_counter()
+                response = client.post(PATHS['wsgi'], body, content_type='text/plain', headers=WEBHOOK_HEADERS)
+                elapsed = time.perf_counter() - start
+                _sample.reset(token)
+                trader.record(ticker, side, response.status_code)
+                samples.append(_finish_sample(sample, response.status_code, elapsed))
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        results = list(pool.map(work, range(level)))
+    return [sample for samples in results for sample in samples], time.perf_counter() - start
+
+
+async def run_asgi(level: int, requests: int):
+    from django.test import AsyncClient
+
+    counter = iter(range(requests))
+
+    async def fire(client, trader):
+        ticker, side, body = trader.next_alert()
+        sample = _new_sample()
+        _sample.set(sample)
+        start = time.perf_counter()
+        response = await client.post(PATHS['asgi'], body, content_type='text/plain', headers=WEBHOOK_HEADERS)
+        elapsed = time.perf_counter() - start
+        trader.record(ticker, side, response.status_code)
+        return _finish_sample(sample, response.status_code, elapsed)
+
+    async def work(worker):
+        client = AsyncClient()
+        trader = Trader(f"A{level}N{worker}")
+        samples = []
+        while next(counter, None) is not None:
+            # A task per request so each gets a fresh context for its sample
+            samples.append(await asyncio.create_task(fire(client, trader)))
+        return samples
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(work(worker) for worker in range(level)))
+    return [sample for samples in results for sample in samples], time.perf_counter() - start
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def distribution(values):
+    values = [value * 1000 for value in values]
+    return {
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'mean': round(sum(values) / len(values), 3) if values else 0.0,
+        'max': round(max(values), 3) if values else 0.0,
+    }
+
+
+def summarize(level: int, samples, seconds: float):
+    queries = [sample['queries'] for sample in samples]
+    return {
+        'concurrency': level,
+        'requests': len(samples),
+        'seconds': round(seconds, 3),
+        'throughput': round(len(samples) / seconds, 2),
+        'latency_ms': distribution([sample['total'] for sample in samples]),
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else 0.0,
+            'max': max(queries) if queries else 0,
+        },
+        'stages_ms': {stage: distribution([sample[stage] for sample in samples]) for stage in STAGES},
+        'statuses': dict(sorted(Counter(str(sample['status']) for sample in samples).items())),
+    }
+
+
+def print_table(path: str, levels):
+    print(f"path: {path}")
+    print(f"{'conc':>5} {'reqs':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8} "
+          + ' '.join(f"{stage:>9}" for stage in STAGES) + "  statuses")
+    for level in levels:
+        latency = level['latency_ms']
+        stages = ' '.join(f"{level['stages_ms'][stage]['mean']:>9.2f}" for stage in STAGES)
+        statuses = ', '.join(f"{status}:{count}" for status, count in level['statuses'].items())
+        print(f"{level['concurrency']:>5} {level['requests']:>6} {level['throughput']:>8.1f} "
+              f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f} "
+              f"{level['queries_per_request']['mean']:>8.1f} {stages}  {statuses}")
+    print("latencies in ms, stages are per-request means in ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', choices=sorted(PATHS), default='wsgi', help='Webhook endpoint to load')
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='Comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='Alerts fired per concurrency level')
+    parser.add_argument('--exchange-latency', type=float, default=0.05, help='BingX simulator latency in seconds')
+    parser.add_argument('--telegram-latency', type=float, default=0.1, help='Telegram stub latency in seconds')
+    parser.add_argument('--volatility', type=float, default=0.002,
+                        help='Relative price move of the simulator per quote')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the alert mix')
+    parser.add_argument('--output', help='Write the results as JSON to this file, - for stdout')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    random.seed(args.seed)
+
+    simulator, exchange, exchange_url = start_exchange(latency=args.exchange_latency, volatility=args.volatility,
+                                                       seed=args.seed)
+    telegram, telegram_url = start_telegram_stub(latency=args.telegram_latency)
+    setup_django(exchange_url=exchange_url, telegram_url=telegram_url)
+    instrument()
+
+    from webhooks.trading import notifier
+
+    results = []
+    try:
+        for level in levels:
+            if args.path == 'asgi':
+                samples, seconds = asyncio.run(run_asgi(level, args.requests))
+            else:
+                samples, seconds = run_wsgi(level, args.requests)
+            results.append(summarize(level, samples, seconds))
+        notifier.flush()
+    finally:
+        teardown_django()
+        exchange.shutdown()
+        telegram.shutdown()
+
+    report = {
+        'config': {
+            'path': args.path,
+            'requests': args.requests,
+            'exchange_latency': args.exchange_latency,
+            'telegram_latency': args.telegram_latency,
+            'volatility': args.volatility,
+            'seed': args.seed,
+        },
+        'levels': results,
+        'exchange_requests': simulator.requests,
+        'exchange_orders': len(simulator.orders),
+        'telegram_messages': telegram.messages,
+    }
+    if args.output == '-':
+        print(json.dumps(report, indent=2))
+        return
+    print_table(args.path, results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Measure how long a fresh worker takes to answer its first alert, cold and warmed up.
+
+Each run starts a new Python process, like gunicorn replacing or adding a
+worker, boots Django against a throwaway database and answers two alerts.
+Cold workers connect to the database, load the settings and contract rules,
+sync the BingX clock and open connections while handling the first alert.
+Warm workers do it in webhooks.warmup before they'd accept traffic. The
+exchange and Telegram stand-ins answer after --latency seconds to stand in
+for network round trips.
+
+    python benchmarks/worker_startup.py --runs 5 --latency 0.05
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BOOT_STARTED = time.perf_counter()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import WEBHOOK_HEADERS, alert, setup_django, start_exchange, teardown_django
+from benchmarks.telegram_stub import start_telegram_stub
+
+
+def child(mode: str):
+    """Boot a worker, optionally warm it up, and time its first two alerts"""
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.environ['BENCHMARK_DATABASE']
+    django.setup()
+    settings.ALLOWED_HOSTS = ['*']
+    from django.test import Client
+
+    boot = time.perf_counter() - BOOT_STARTED
+    warm_up_steps = {}
+    if mode == 'warm':
+        from webhooks.warmup import warm_up
+        warm_up_steps = warm_up()
+
+    alerts = []
+    for ticker in ('FIRST-USDT', 'SECOND-USDT'):
+        start = time.perf_counter()
+        response = Client().post('/webhook/', alert(ticker, 'BUY'), content_type='text/plain',
+                                 headers=WEBHOOK_HEADERS)
+        alerts.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.content
+    print(json.dumps({'boot': boot, 'warm_up': sum(warm_up_steps.values()), 'steps': warm_up_steps,
+                      'first_alert': alerts[0], 'second_alert': alerts[1]}))
+
+
+def run(mode: str) -> dict:
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode], check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Workers started per mode')
+    parser.add_argument('--latency', type=float, default=0.05, help='Exchange and Telegram latency in seconds')
+    parser.add_argument('--output', help='Write the raw results as JSON to this file, - for stdout')
+    parser.add_argument('--child', choices=('cold', 'warm'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    simulator, server, url = start_exchange(latency=args.latency)
+    telegram, telegram_url = start_telegram_stub(latency=args.latency)
+    setup_django(exchange_url=url, telegram_url=telegram_url)
+    from django.db import connection
+    from webhooks.models import Position
+    os.environ['BENCHMARK_DATABASE'] = connection.settings_dict['NAME']
+    connection.close()
+
+    results = {}
+    try:
+        for mode in ('cold', 'warm'):
+            results[mode] = []
+            for _ in range(args.runs):
+                results[mode].append(run(mode))
+                # Every worker starts without positions
+                Position.objects.all().delete()
+    finally:
+        teardown_django()
+        server.shutdown()
+        telegram.shutdown()
+
+    columns = ('boot', 'warm_up', 'first_alert', 'second_alert')
+    print(f"{'mode':<6} " + " ".join(f"{name + ' ms':>16}" for name in columns))
+    for mode, runs in results.items():
+        medians = {name: statistics.median(run[name] for run in runs) * 1000 for name in columns}
+        print(f"{mode:<6} " + " ".join(f"{medians[name]:>16.1f}" for name in columns))
+    steps = results['warm'][0]['steps'] if results['warm'] else {}
+    if steps:
+        print("warm-up steps (first run): " + ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in steps.items()))
+
+    if args.output:
+        report = json.dumps(results, indent=2)
+        if args.output == '-':
+            print(report)
+        else:
+            with open(args.output, 'w') as f:
+                f.write(report)
+
+
+if __name__ == '__main__':
+    main()
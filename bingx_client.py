@@ -1,32 +1,151 @@
+import asyncio
+import itertools
+import json
+import logging
+import random
 import requests
+import httpx
 import time
 import hmac
 import hashlib
+import threading
+import weakref
 from urllib.parse import urlencode
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import os
 from dotenv import load_dotenv
 from decimal import Decimal
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from metrics import EXCHANGE_RETRIES, demo_label, observe_exchange
+from rate_limit import TokenBucket
 
 # Load environment variables
 load_dotenv()
 
-class BingXClient:
+logger = logging.getLogger(__name__)
+
+PRICE_ENDPOINT = '/openApi/swap/v1/ticker/price'
+ORDER_ENDPOINT = '/openApi/swap/v2/trade/order'
+BATCH_ORDERS_ENDPOINT = '/openApi/swap/v2/trade/batchOrders'
+SERVER_TIME_ENDPOINT = '/openApi/swap/v2/server/time'
+CONTRACTS_ENDPOINT = '/openApi/swap/v2/quote/contracts'
+POSITIONS_ENDPOINT = '/openApi/swap/v2/user/positions'
+ALL_ORDERS_ENDPOINT = '/openApi/swap/v2/trade/allOrders'
+
+# Orders BingX accepts in one batchOrders request
+MAX_BATCH_ORDERS = 5
+
+# Orders allOrders returns per page, and the longest time range it accepts in milliseconds
+MAX_ORDERS_PAGE = 1000
+MAX_ORDERS_SPAN = 7 * 24 * 3600 * 1000
+
+# Error codes the client reacts to
+RATE_LIMITED = 100410
+INVALID_TIMESTAMP = 109400
+
+# Endpoints share BingX's rate limits by group, unlisted endpoints count as "account"
+ENDPOINT_GROUPS = {
+    PRICE_ENDPOINT: 'market',
+    SERVER_TIME_ENDPOINT: 'market',
+    CONTRACTS_ENDPOINT: 'market',
+    ORDER_ENDPOINT: 'trade',
+    BATCH_ORDERS_ENDPOINT: 'trade',
+    POSITIONS_ENDPOINT: 'account',
+    ALL_ORDERS_ENDPOINT: 'account',
+}
+
+# Requests per second allowed per account and group, overridden by BINGX_<GROUP>_RATE (0 disables).
+# Buckets are per process, divide by the number of workers sharing an account.
+RATE_LIMITS = {
+    'market': 50,
+    'trade': 10,
+    'account': 20,
+}
+
+# Full jitter backoff between retries, in seconds
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 2.0
+
+
+class BingXError(Exception):
+    """A request BingX answered with a non-zero code"""
+
+    def __init__(self, response: Dict[str, Any]):
+        self.code = response.get('code')
+        self.msg = response.get('msg')
+        super().__init__(f"BingX error {self.code}: {self.msg}")
+
+
+def _data(response: Dict[str, Any]):
+    if response.get('code') != 0:
+        raise BingXError(response)
+    return response['data']
+
+
+class BaseBingXClient:
     """
-    BingX API Client for trading operations
+    Credentials, signing and request building shared by the sync and async clients
     """
-    
-    def __init__(self, api_key: str = None, secret_key: str = None, demo: bool = False):
-        self.api_key = api_key or os.getenv('API_KEY')
-        self.secret_key = secret_key or os.getenv('SECRET_KEY')
+
+    def __init__(self, api_key: str = None, secret_key: str = None, demo: bool = False,
+                 pool_connections: int = None, pool_maxsize: int = None,
+                 timeout: Tuple[float, float] = None, get_retries: int = None, max_retries: int = None,
+                 recv_window: int = None, public: bool = False):
+        """
+        Initialize the BingX client.
+
+        Args:
+            api_key: BingX API key (if not provided, will use environment variable)
+            secret_key: BingX secret key (if not provided, will use environment variable)
+            demo: Whether to use the demo (VST) endpoint
+            pool_connections: Number of connection pools to cache
+            pool_maxsize: Maximum number of keep-alive connections per pool
+            timeout: (connect, read) timeout in seconds
+            get_retries: Number of retries of GET requests failing with a network or server error
+            max_retries: Number of retries of requests rejected before BingX acted on them
+                (rate limits, stale timestamps, connections that couldn't be opened)
+            recv_window: Milliseconds a signed request stays valid after its timestamp
+            public: Only read public market data (prices, contract rules), without credentials
+        """
+        if public:
+            self.api_key = self.secret_key = None
+        else:
+            self.api_key = api_key or os.getenv('API_KEY')
+            self.secret_key = secret_key or os.getenv('SECRET_KEY')
+        self.demo = demo
         if demo:
             self.base_url = os.getenv('BASE_URL_DEMO', 'https://open-api-vst.bingx.com')
         else:
             self.base_url = os.getenv('BASE_URL', 'https://open-api.bingx.com')
-        
-        if not self.api_key or not self.secret_key:
+
+        if not public and (not self.api_key or not self.secret_key):
             raise ValueError("API key and secret key are required")
-    
+
+        if pool_connections is None:
+            pool_connections = int(os.getenv('BINGX_POOL_CONNECTIONS', '4'))
+        if pool_maxsize is None:
+            pool_maxsize = int(os.getenv('BINGX_POOL_MAXSIZE', '10'))
+        if timeout is None:
+            timeout = (
+                float(os.getenv('BINGX_CONNECT_TIMEOUT', '3.05')),
+                float(os.getenv('BINGX_READ_TIMEOUT', '10')),
+            )
+        if get_retries is None:
+            get_retries = int(os.getenv('BINGX_GET_RETRIES', '0'))
+        if max_retries is None:
+            max_retries = int(os.getenv('BINGX_MAX_RETRIES', '3'))
+        if recv_window is None:
+            recv_window = int(os.getenv('BINGX_RECV_WINDOW', '5000'))
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.get_retries = get_retries
+        self.max_retries = max_retries
+        self.recv_window = recv_window
+        self.clock = ServerClock()
+
     def _generate_signature(self, params: str) -> str:
         """Generate HMAC SHA256 signature for API requests"""
         return hmac.new(
@@ -34,62 +153,247 @@ class BingXClient:
             params.encode('utf-8'),
             hashlib.sha256
         ).hexdigest()
-    
+
     def _parse_params(self, params: Dict[str, Any]) -> str:
         """Parse parameters into sorted query string with timestamp"""
         sorted_keys = sorted(params.keys())
         params_str = "&".join(["%s=%s" % (x, params[x]) for x in sorted_keys])
-        
+
         if params_str != "":
-            return params_str + "&timestamp=" + str(int(time.time() * 1000))
+            return params_str + "&timestamp=" + str(self.clock.now())
         else:
-            return params_str + "timestamp=" + str(int(time.time() * 1000))
-    
+            return params_str + "timestamp=" + str(self.clock.now())
+
     def _get_headers(self) -> Dict[str, str]:
         """Generate headers for API requests"""
+        if not self.api_key:
+            return {}
         return {
             'X-BX-APIKEY': self.api_key
         }
-    
-    def _make_request(self, method: str, endpoint: str, params: Dict[str, Any] = None, signed: bool = True) -> Dict[str, Any]:
-        """Make authenticated request to BingX API"""
+
+    def _build_url(self, endpoint: str, params: Dict[str, Any] = None, signed: bool = True) -> str:
+        """Build the request URL, signing the query string when required"""
         if params is None:
             params = {}
-        
-        headers = self._get_headers()
-        
+
         if signed:
+            if not self.secret_key:
+                raise ValueError(f"{endpoint} needs an API key and secret key")
+            if self.recv_window:
+                params = {**params, 'recvWindow': self.recv_window}
             # Parse parameters into sorted query string with timestamp
             params_str = self._parse_params(params)
             # Generate signature
             signature = self._generate_signature(params_str)
             # Build URL with signature
-            url = f"{self.base_url}{endpoint}?{params_str}&signature={signature}"
+            return f"{self.base_url}{endpoint}?{params_str}&signature={signature}"
+
+        # For unsigned requests, just add params to URL
+        if params:
+            query_string = urlencode(params)
+            return f"{self.base_url}{endpoint}?{query_string}"
+        return f"{self.base_url}{endpoint}"
+
+    def _order_params(self, symbol: str, side: str, order_type: str, positionSide: str, quantity: float,
+                      price: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """Build the parameters of an order request"""
+        params = {
+            'symbol': symbol,
+            'side': side,
+            'type': order_type,
+            'positionSide': positionSide,
+            'quantity': str(quantity),
+            **kwargs
+        }
+
+        if price is not None:
+            params['price'] = str(price)
+
+        return params
+
+    def _batch_params(self, orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the parameters of a batchOrders request, orders take the arguments of place_order"""
+        if not 0 < len(orders) <= MAX_BATCH_ORDERS:
+            raise ValueError(f"A batch holds between 1 and {MAX_BATCH_ORDERS} orders, got {len(orders)}")
+        batch = [self._order_params(**order) for order in orders]
+        return {'batchOrders': json.dumps(batch, separators=(',', ':'))}
+
+    def _retry_reason(self, method: str, status: int = None, code: int = None, error: BaseException = None) -> Optional[str]:
+        """
+        Classify a failed attempt, returns why it can be retried or None when it can't.
+
+        Rejections that happen before BingX acts on a request are retried for any
+        method. Server errors and dropped connections are only retried for GETs,
+        an order might have gone through.
+        """
+        if status == 429 or code == RATE_LIMITED:
+            return 'rate_limited'
+        if code == INVALID_TIMESTAMP:
+            return 'timestamp'
+        if error is not None and _never_sent(error):
+            return 'connect'
+        if method == 'GET' and (error is not None or (status or 0) >= 500):
+            return 'server'
+        return None
+
+    def _plan_retry(self, reason: Optional[str], attempt: int, endpoint: str, headers=None) -> Optional[float]:
+        """Seconds to wait before retrying a failed attempt, None when it must not be retried"""
+        if reason is None or attempt >= (self.get_retries if reason == 'server' else self.max_retries):
+            return None
+        EXCHANGE_RETRIES.labels(endpoint, demo_label(self.demo), reason).inc()
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        if reason == 'rate_limited':
+            delay = _retry_after(headers) or delay
+            bucket = get_bucket(self.api_key, endpoint)
+            if bucket is not None:
+                # Hold back every request of the group in this process, not only this one
+                bucket.drain(delay)
+        elif reason == 'timestamp':
+            self.clock.invalidate()
+        return delay
+
+    def _log_failure(self, error: BaseException, response=None):
+        if response is not None:
+            logger.warning(f"Request failed: {error}, response: {response.text}")
         else:
-            # For unsigned requests, just add params to URL
-            if params:
-                query_string = urlencode(params)
-                url = f"{self.base_url}{endpoint}?{query_string}"
-            else:
-                url = f"{self.base_url}{endpoint}"
-        
+            logger.warning(f"Request failed: {error}")
+
+
+class ServerClock:
+    """
+    Offset between the local clock and BingX's, used to timestamp signed requests.
+
+    Refreshed every BINGX_TIME_SYNC_INTERVAL seconds (0 disables syncing) and
+    whenever BingX rejects a timestamp.
+    """
+
+    def __init__(self, sync_interval: float = None):
+        if sync_interval is None:
+            sync_interval = float(os.getenv('BINGX_TIME_SYNC_INTERVAL', '300'))
+        self.sync_interval = sync_interval
+        self.offset = 0.0
+        self.synced_at = None
+        self.lock = threading.Lock()
+
+    def now(self) -> int:
+        """BingX's current time in milliseconds"""
+        return int(time.time() * 1000 + self.offset)
+
+    def stale(self) -> bool:
+        if not self.sync_interval:
+            return False
+        return self.synced_at is None or time.monotonic() - self.synced_at >= self.sync_interval
+
+    def update(self, server_time: int, sent: float, received: float):
+        """Record a server time in milliseconds, read between the local times sent and received"""
+        self.offset = server_time - (sent + received) / 2 * 1000
+        self.synced_at = time.monotonic()
+
+    def postpone(self):
+        """Keep the current offset until the next refresh, after a failed sync"""
+        self.synced_at = time.monotonic()
+
+    def invalidate(self):
+        self.synced_at = None
+
+
+class BingXClient(BaseBingXClient):
+    """
+    BingX API Client for trading operations
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = self._build_session()
+
+    def _build_session(self) -> requests.Session:
+        """Build a keep-alive session with a pooled adapter for the BingX host"""
+        # Retries are decided by _make_request, which knows whether a request is safe to resend
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session = requests.Session()
+        session.headers.update(self._get_headers())
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        """Close the underlying HTTP session and its pooled connections"""
+        self.session.close()
+
+    def _make_request(self, method: str, endpoint: str, params: Dict[str, Any] = None, signed: bool = True) -> Dict[str, Any]:
+        """
+        Make authenticated request to BingX API.
+
+        Waits for the rate limit of the endpoint's group and retries the
+        failures _retry_reason deems safe, with jittered backoff.
+        """
+        method = method.upper()
+        if method not in ('GET', 'POST'):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+        bucket = get_bucket(self.api_key, endpoint)
+
+        for attempt in itertools.count():
+            if signed:
+                self._sync_clock()
+            if bucket is not None:
+                bucket.acquire()
+            # Built on every attempt so retries carry a fresh timestamp
+            url = self._build_url(endpoint, params, signed)
+            start = time.perf_counter()
+
+            try:
+                if method == 'GET':
+                    response = self.session.get(url, timeout=self.timeout)
+                else:
+                    response = self.session.post(url, data={}, timeout=self.timeout)
+
+                response.raise_for_status()
+                data = response.json()
+
+            except requests.exceptions.RequestException as e:
+                response = getattr(e, 'response', None)
+                if response is not None:
+                    observe_exchange(endpoint, method, self.demo, start, outcome='http_error')
+                    delay = self._plan_retry(self._retry_reason(method, status=response.status_code), attempt,
+                                             endpoint, response.headers)
+                else:
+                    observe_exchange(endpoint, method, self.demo, start, outcome='network_error')
+                    delay = self._plan_retry(self._retry_reason(method, error=e), attempt, endpoint)
+                if delay is None:
+                    self._log_failure(e, response)
+                    raise
+                time.sleep(delay)
+                continue
+
+            observe_exchange(endpoint, method, self.demo, start, data)
+            delay = self._plan_retry(self._retry_reason(method, code=_error_code(data)), attempt, endpoint)
+            if delay is None:
+                return data
+            time.sleep(delay)
+
+    def sync_clock(self):
+        """
+        Measure the server clock offset.
+
+        Also opens a pooled connection, workers call it to warm up before their first alert.
+        """
+        sent = time.time()
+        response = self._make_request('GET', SERVER_TIME_ENDPOINT, signed=False)
+        self.clock.update(response['data']['serverTime'], sent, time.time())
+
+    def _sync_clock(self):
+        """Refresh the server clock offset when stale, other threads keep the current one meanwhile"""
+        if not self.clock.stale() or not self.clock.lock.acquire(blocking=False):
+            return
         try:
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=headers)
-            elif method.upper() == 'POST':
-                response = requests.post(url, headers=headers, data={})
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response: {e.response.text}")
-            raise
-    
+            self.sync_clock()
+        except (requests.exceptions.RequestException, KeyError, TypeError) as e:
+            logger.warning(f"Server time sync failed, keeping the current offset: {e}")
+            self.clock.postpone()
+        finally:
+            self.clock.lock.release()
+
     def get_price(self, symbol: str) -> Decimal:
         """
         Get the current price of a symbol
@@ -97,14 +401,57 @@ class BingXClient:
         params = {
             'symbol': symbol
         }
-        response = self._make_request('GET', '/openApi/swap/v1/ticker/price', params)
+        # Market data is public, any client can read it
+        response = self._make_request('GET', PRICE_ENDPOINT, params, signed=False)
         return Decimal(response['data']['price'])
-    
-    def place_order(self, symbol: str, side: str, order_type: str, positionSide: str, quantity: float, 
+
+    def get_prices(self) -> Dict[str, Decimal]:
+        """
+        Get the current price of every symbol in one request
+        """
+        response = self._make_request('GET', PRICE_ENDPOINT, signed=False)
+        return {ticker['symbol']: Decimal(ticker['price']) for ticker in response['data']}
+
+    def get_contracts(self, symbol: str = None) -> List[Dict[str, Any]]:
+        """
+        Get the trading rules (precisions and minimums) of every contract, or of one symbol.
+
+        Empty when BingX doesn't know the symbol.
+        """
+        params = {'symbol': symbol} if symbol else None
+        response = self._make_request('GET', CONTRACTS_ENDPOINT, params, signed=False)
+        return response['data'] if response.get('code') == 0 and response['data'] else []
+
+    def get_positions(self, symbol: str = None) -> List[Dict[str, Any]]:
+        """
+        Get the open positions of the account, or of one symbol.
+
+        Raises BingXError when the request is rejected, unlike an empty account.
+        """
+        params = {'symbol': symbol} if symbol else {}
+        return _data(self._make_request('GET', POSITIONS_ENDPOINT, params)) or []
+
+    def get_orders(self, start_time: int, end_time: int, limit: int = MAX_ORDERS_PAGE,
+                   symbol: str = None) -> List[Dict[str, Any]]:
+        """
+        Get one page of the orders updated between two times
+
+        Args:
+            start_time: Epoch milliseconds, inclusive
+            end_time: Epoch milliseconds, at most MAX_ORDERS_SPAN after start_time
+            limit: Orders per page, at most MAX_ORDERS_PAGE
+            symbol: Only the orders of this trading pair
+        """
+        params = {'startTime': start_time, 'endTime': end_time, 'limit': limit}
+        if symbol:
+            params['symbol'] = symbol
+        return (_data(self._make_request('GET', ALL_ORDERS_ENDPOINT, params)) or {}).get('orders') or []
+
+    def place_order(self, symbol: str, side: str, order_type: str, positionSide: str, quantity: float,
                    price: Optional[float] = None, **kwargs) -> Dict[str, Any]:
         """
         Place a trading order
-        
+
         Args:
             symbol: Trading pair (e.g., 'BTC-USDT')
             side: 'BUY' or 'SELL'
@@ -113,16 +460,260 @@ class BingXClient:
             price: Order price (required for LIMIT orders)
             **kwargs: Additional order parameters
         """
+        params = self._order_params(symbol, side, order_type, positionSide, quantity, price, **kwargs)
+        return self._make_request('POST', ORDER_ENDPOINT, params)
+
+    def place_batch_orders(self, orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Place up to MAX_BATCH_ORDERS orders in one request
+
+        Args:
+            orders: Keyword arguments of place_order for each order, set clientOrderID
+                to match the returned orders back to them
+        """
+        return self._make_request('POST', BATCH_ORDERS_ENDPOINT, self._batch_params(orders))
+
+
+class AsyncBingXClient(BaseBingXClient):
+    """
+    Asyncio BingX API Client, same API as BingXClient but awaitable
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        connect_timeout, read_timeout = self.timeout
+        self.session = httpx.AsyncClient(
+            headers=self._get_headers(),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=self.pool_maxsize, max_keepalive_connections=self.pool_maxsize),
+        )
+
+    async def close(self):
+        """Close the underlying HTTP session and its pooled connections"""
+        await self.session.aclose()
+
+    async def _make_request(self, method: str, endpoint: str, params: Dict[str, Any] = None, signed: bool = True) -> Dict[str, Any]:
+        """Make authenticated request to BingX API, see BingXClient._make_request"""
+        method = method.upper()
+        if method not in ('GET', 'POST'):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+        bucket = get_bucket(self.api_key, endpoint)
+
+        for attempt in itertools.count():
+            if signed:
+                await self._sync_clock()
+            if bucket is not None:
+                await bucket.aacquire()
+            # Built on every attempt so retries carry a fresh timestamp
+            url = self._build_url(endpoint, params, signed)
+            start = time.perf_counter()
+
+            try:
+                if method == 'GET':
+                    response = await self.session.get(url)
+                else:
+                    response = await self.session.post(url, data={})
+
+                response.raise_for_status()
+                data = response.json()
+
+            except httpx.HTTPError as e:
+                if isinstance(e, httpx.HTTPStatusError):
+                    observe_exchange(endpoint, method, self.demo, start, outcome='http_error')
+                    delay = self._plan_retry(self._retry_reason(method, status=e.response.status_code), attempt,
+                                             endpoint, e.response.headers)
+                else:
+                    observe_exchange(endpoint, method, self.demo, start, outcome='network_error')
+                    delay = self._plan_retry(self._retry_reason(method, error=e), attempt, endpoint)
+                if delay is None:
+                    self._log_failure(e, e.response if isinstance(e, httpx.HTTPStatusError) else None)
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            observe_exchange(endpoint, method, self.demo, start, data)
+            delay = self._plan_retry(self._retry_reason(method, code=_error_code(data)), attempt, endpoint)
+            if delay is None:
+                return data
+            await asyncio.sleep(delay)
+
+    async def sync_clock(self):
+        """Measure the server clock offset, see BingXClient.sync_clock"""
+        sent = time.time()
+        response = await self._make_request('GET', SERVER_TIME_ENDPOINT, signed=False)
+        self.clock.update(response['data']['serverTime'], sent, time.time())
+
+    async def _sync_clock(self):
+        """Refresh the server clock offset when stale, see BingXClient._sync_clock"""
+        if not self.clock.stale() or not self.clock.lock.acquire(blocking=False):
+            return
+        try:
+            await self.sync_clock()
+        except (httpx.HTTPError, KeyError, TypeError) as e:
+            logger.warning(f"Server time sync failed, keeping the current offset: {e}")
+            self.clock.postpone()
+        finally:
+            self.clock.lock.release()
+
+    async def get_price(self, symbol: str) -> Decimal:
+        """
+        Get the current price of a symbol
+        """
         params = {
-            'symbol': symbol,
-            'side': side,
-            'type': order_type,
-            'positionSide': positionSide,
-            'quantity': str(quantity),
-            **kwargs
+            'symbol': symbol
         }
-        
-        if price is not None:
-            params['price'] = str(price)
-        
-        return self._make_request('POST', '/openApi/swap/v2/trade/order', params)
+        response = await self._make_request('GET', PRICE_ENDPOINT, params, signed=False)
+        return Decimal(response['data']['price'])
+
+    async def get_contracts(self, symbol: str = None) -> List[Dict[str, Any]]:
+        """
+        Get the trading rules of every contract, or of one symbol, see BingXClient.get_contracts
+        """
+        params = {'symbol': symbol} if symbol else None
+        response = await self._make_request('GET', CONTRACTS_ENDPOINT, params, signed=False)
+        return response['data'] if response.get('code') == 0 and response['data'] else []
+
+    async def get_positions(self, symbol: str = None) -> List[Dict[str, Any]]:
+        """
+        Get the open positions of the account, or of one symbol, see BingXClient.get_positions
+        """
+        params = {'symbol': symbol} if symbol else {}
+        return _data(await self._make_request('GET', POSITIONS_ENDPOINT, params)) or []
+
+    async def get_orders(self, start_time: int, end_time: int, limit: int = MAX_ORDERS_PAGE,
+                         symbol: str = None) -> List[Dict[str, Any]]:
+        """
+        Get one page of the orders updated between two times, see BingXClient.get_orders
+        """
+        params = {'startTime': start_time, 'endTime': end_time, 'limit': limit}
+        if symbol:
+            params['symbol'] = symbol
+        return (_data(await self._make_request('GET', ALL_ORDERS_ENDPOINT, params)) or {}).get('orders') or []
+
+    async def place_order(self, symbol: str, side: str, order_type: str, positionSide: str, quantity: float,
+                          price: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Place a trading order, see BingXClient.place_order
+        """
+        params = self._order_params(symbol, side, order_type, positionSide, quantity, price, **kwargs)
+        return await self._make_request('POST', ORDER_ENDPOINT, params)
+
+    async def place_batch_orders(self, orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Place up to MAX_BATCH_ORDERS orders in one request, see BingXClient.place_batch_orders
+        """
+        return await self._make_request('POST', BATCH_ORDERS_ENDPOINT, self._batch_params(orders))
+
+
+def _never_sent(error: BaseException) -> bool:
+    """Whether a requests or httpx error happened before the request reached BingX"""
+    if isinstance(error, (requests.exceptions.ConnectTimeout, httpx.ConnectError, httpx.ConnectTimeout,
+                          httpx.PoolTimeout)):
+        return True
+    # requests wraps refused connections in a ConnectionError around urllib3's MaxRetryError
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def _error_code(data) -> Optional[int]:
+    return data.get('code') if isinstance(data, dict) else None
+
+
+def _retry_after(headers) -> Optional[float]:
+    try:
+        return float(headers['Retry-After'])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+_clients: Dict[Tuple[bool, str, str], BingXClient] = {}
+_market_clients: Dict[bool, BingXClient] = {}
+_clients_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+_buckets: Dict[Tuple[str, str], Optional[TokenBucket]] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(api_key: str, endpoint: str) -> Optional[TokenBucket]:
+    """
+    Return the rate limit bucket of an account for the group of an endpoint.
+
+    Shared by every sync and async client of the account in this process.
+    None when limiting is disabled for the group.
+    """
+    group = ENDPOINT_GROUPS.get(endpoint, 'account')
+    key = (api_key, group)
+    if key not in _buckets:
+        with _buckets_lock:
+            if key not in _buckets:
+                rate = float(os.getenv(f'BINGX_{group.upper()}_RATE', RATE_LIMITS[group]))
+                _buckets[key] = TokenBucket(rate, max(rate, 1)) if rate > 0 else None
+    return _buckets[key]
+
+
+def _client_key(demo: bool, api_key: Optional[str], secret_key: Optional[str]) -> Tuple[bool, str, str]:
+    return (demo, api_key or os.getenv('API_KEY'), secret_key or os.getenv('SECRET_KEY'))
+
+
+def get_client(demo: bool = False, api_key: str = None, secret_key: str = None) -> BingXClient:
+    """
+    Return the process-wide client for the given account, creating it on first use.
+
+    Clients are keyed by (demo, api_key, secret_key) so their pooled connections
+    are reused across requests handled by the same worker.
+    """
+    key = _client_key(demo, api_key, secret_key)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = BingXClient(key[1], key[2], demo=demo)
+                _clients[key] = client
+    return client
+
+
+def get_market_client(demo: bool = False) -> BingXClient:
+    """
+    Return the process-wide client reading public market data, prices and contract rules.
+
+    It holds no credentials, so price and contract lookups work whichever
+    accounts are configured, environment keys or Account rows.
+    """
+    client = _market_clients.get(demo)
+    if client is None:
+        with _clients_lock:
+            client = _market_clients.get(demo)
+            if client is None:
+                client = BingXClient(demo=demo, public=True)
+                _market_clients[demo] = client
+    return client
+
+
+def get_async_client(demo: bool = False, api_key: str = None, secret_key: str = None) -> AsyncBingXClient:
+    """
+    Async counterpart of get_client.
+
+    httpx connections are bound to the event loop that opened them, so clients
+    are cached per running loop.
+    """
+    key = _client_key(demo, api_key, secret_key)
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(key)
+    if client is None:
+        client = AsyncBingXClient(key[1], key[2], demo=demo)
+        clients[key] = client
+    return client
+
+
+def _reset_clients():
+    """Drop clients inherited from the parent process, their sockets can't be shared"""
+    global _clients_lock, _buckets_lock
+    _clients.clear()
+    _market_clients.clear()
+    _clients_lock = threading.Lock()
+    _buckets.clear()
+    _buckets_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_clients)
@@ -0,0 +1,422 @@
+"""
+Local simulator of the BingX perpetual swap endpoints used by the bot.
+
+Implements the ticker price, contracts, order, batch order, server time,
+positions and order history endpoints with signature verification, contract trading rules, replayable
+price paths, slippage, partial fills and injectable latency and errors. A client can be pointed at it in-process, without sockets, for fast
+tests, or over HTTP for load runs:
+
+    simulator = BingXSimulator('key', 'secret', prices={'BTC-USDT': PricePath([100, 101, 99])})
+    client = BingXClient('key', 'secret')
+    simulator.attach(client)
+
+    server, url = simulator.serve()  # then set BASE_URL=url
+"""
+import csv
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter
+
+from bingx_client import (ALL_ORDERS_ENDPOINT, BATCH_ORDERS_ENDPOINT, CONTRACTS_ENDPOINT, MAX_BATCH_ORDERS,
+                          MAX_ORDERS_PAGE, MAX_ORDERS_SPAN, ORDER_ENDPOINT, POSITIONS_ENDPOINT, PRICE_ENDPOINT,
+                          SERVER_TIME_ENDPOINT)
+
+Reply = Tuple[int, Dict[str, Any]]
+
+# Error codes returned by BingX in the response body
+SIGNATURE_MISMATCH = 100001
+INVALID_API_KEY = 100413
+INVALID_TIMESTAMP = 109400
+INTERNAL_ERROR = 100500
+UNKNOWN_ENDPOINT = 100400
+INVALID_PARAMETERS = 109414
+RATE_LIMITED = 100410
+
+# Trading rules of every symbol, overridden per symbol with the contracts argument
+DEFAULT_CONTRACT = {
+    'quantityPrecision': 4,
+    'pricePrecision': 4,
+    'tradeMinQuantity': '0.0001',
+    'tradeMinUSDT': '2',
+}
+
+
+class PricePath:
+    """
+    A replayable sequence of prices, each quote moves one step forward.
+    """
+
+    def __init__(self, prices: Iterable, loop: bool = True):
+        """
+        Args:
+            prices: Prices in the order they are quoted
+            loop: Start over once exhausted, otherwise the last price sticks
+        """
+        self.prices = [Decimal(str(price)) for price in prices]
+        if not self.prices:
+            raise ValueError("A price path needs at least one price")
+        self.loop = loop
+        self.position = 0
+
+    @classmethod
+    def random_walk(cls, start: float, steps: int = 1000, volatility: float = 0.001, seed: Any = 0) -> 'PricePath':
+        """A seeded random walk, the same seed always yields the same path"""
+        rng = random.Random(seed)
+        price = Decimal(str(start))
+        prices = [price]
+        for _ in range(steps - 1):
+            price = (price * Decimal(1 + rng.uniform(-volatility, volatility))).quantize(Decimal('0.0001'))
+            prices.append(price)
+        return cls(prices)
+
+    @classmethod
+    def from_csv(cls, path: str, column: str = 'close', loop: bool = True) -> 'PricePath':
+        """Replay one column of a CSV file, like a candle export"""
+        with open(path, newline='') as f:
+            return cls([row[column] for row in csv.DictReader(f)], loop=loop)
+
+    @property
+    def current(self) -> Decimal:
+        return self.prices[self.position]
+
+    def advance(self) -> Decimal:
+        if self.position + 1 < len(self.prices):
+            self.position += 1
+        elif self.loop:
+            self.position = 0
+        return self.current
+
+
+class BingXSimulator:
+    """
+    In-memory BingX exchange.
+    """
+
+    def __init__(self, api_key: str, secret_key: str, prices: Dict[str, PricePath] = None,
+                 contracts: Dict[str, Dict[str, Any]] = None, default_price: float = 100.0, volatility: float = 0.001, slippage: float = 0.0,
+                 fill_ratio: float = 1.0, latency: float = 0.0, error_rate: float = 0.0,
+                 recv_window: float = 5000, clock_offset: float = 0, seed: int = 0):
+        """
+        Initialize the simulator.
+
+        Args:
+            api_key: API key requests must carry in X-BX-APIKEY
+            secret_key: Secret used to verify request signatures
+            prices: Price path per symbol
+            contracts: Trading rules per symbol, merged over DEFAULT_CONTRACT
+            default_price: Start of the seeded random walk created for unknown symbols
+            volatility: Step size of those random walks
+            slippage: Adverse price move applied to fills, as a fraction of the price
+            fill_ratio: Fraction of the order quantity that gets executed
+            latency: Seconds each request takes
+            error_rate: Probability of answering a request with an internal error
+            recv_window: Milliseconds a signed request's timestamp stays valid, unless it sends recvWindow
+            clock_offset: Milliseconds the exchange clock runs ahead of the local one
+            seed: Seed of the random walks and injected errors
+        """
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.prices = dict(prices or {})
+        self.contracts = dict(contracts or {})
+        self.default_price = default_price
+        self.volatility = volatility
+        self.slippage = Decimal(str(slippage))
+        self.fill_ratio = Decimal(str(fill_ratio))
+        self.latency = latency
+        self.error_rate = error_rate
+        self.recv_window = recv_window
+        self.clock_offset = clock_offset
+        self.seed = seed
+        self.orders: List[Dict[str, Any]] = []
+        # Open LONG quantity and average price per symbol
+        self.positions: Dict[str, Tuple[Decimal, Decimal]] = {}
+        self.requests = 0
+        self._errors: List[Reply] = []
+        self._rng = random.Random(seed)
+        self._order_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def path(self, symbol: str) -> PricePath:
+        path = self.prices.get(symbol)
+        if path is None:
+            path = PricePath.random_walk(self.default_price, volatility=self.volatility, seed=f"{self.seed}:{symbol}")
+            self.prices[symbol] = path
+        return path
+
+    def contract(self, symbol: str) -> Dict[str, Any]:
+        return {'symbol': symbol, **DEFAULT_CONTRACT, **self.contracts.get(symbol, {})}
+
+    def inject_error(self, code: int = INTERNAL_ERROR, msg: str = 'Internal error', status: int = 200,
+                     count: int = 1):
+        """Answer the next count requests with this error, HTTP statuses other than 200 raise in the client"""
+        with self._lock:
+            self._errors.extend([(status, {'code': code, 'msg': msg, 'data': {}})] * count)
+
+    def handle(self, method: str, url: str, headers: Dict[str, str]) -> Reply:
+        """Answer one request, returns the HTTP status and the JSON body"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            if self._errors:
+                return self._errors.pop(0)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return 500, {'code': INTERNAL_ERROR, 'msg': 'Internal error', 'data': {}}
+
+            parts = urlsplit(url)
+            query = parse_qs(parts.query)
+            if 'signature' in query:
+                error = self._verify(parts.query, query, headers)
+                if error:
+                    return 200, {'code': error[0], 'msg': error[1], 'data': {}}
+
+            if method == 'GET' and parts.path == SERVER_TIME_ENDPOINT:
+                return 200, {'code': 0, 'msg': '', 'data': {'serverTime': self.now()}}
+            if method == 'GET' and parts.path == CONTRACTS_ENDPOINT:
+                return 200, self._contracts(query.get('symbol', [None])[0])
+            if method == 'GET' and parts.path == PRICE_ENDPOINT:
+                return 200, self._ticker(query.get('symbol', [None])[0])
+            signed_endpoint = (method, parts.path) in (('POST', ORDER_ENDPOINT), ('POST', BATCH_ORDERS_ENDPOINT),
+                                                       ('GET', POSITIONS_ENDPOINT), ('GET', ALL_ORDERS_ENDPOINT))
+            if signed_endpoint and 'signature' not in query:
+                return 200, {'code': SIGNATURE_MISMATCH, 'msg': 'Signature is required', 'data': {}}
+            params = {name: values[0] for name, values in query.items()}
+            if method == 'GET' and parts.path == POSITIONS_ENDPOINT:
+                return 200, self._positions(params.get('symbol'))
+            if method == 'GET' and parts.path == ALL_ORDERS_ENDPOINT:
+                return 200, self._all_orders(params)
+            if method == 'POST' and parts.path in (ORDER_ENDPOINT, BATCH_ORDERS_ENDPOINT):
+                if parts.path == BATCH_ORDERS_ENDPOINT:
+                    return 200, self._batch_orders(params)
+                return 200, self._order(params)
+            return 404, {'code': UNKNOWN_ENDPOINT, 'msg': f'Unknown endpoint {method} {parts.path}', 'data': {}}
+
+    def _verify(self, raw_query: str, query: Dict[str, list], headers: Dict[str, str]) -> Optional[Tuple[int, str]]:
+        api_key = next((value for name, value in headers.items() if name.lower() == 'x-bx-apikey'), None)
+        if api_key != self.api_key:
+            return INVALID_API_KEY, 'Incorrect apiKey'
+        signed, _, signature = raw_query.rpartition('&signature=')
+        # Clients sign the raw parameters, the HTTP layer percent-encodes JSON values afterwards
+        signed = unquote(signed)
+        expected = hmac.new(self.secret_key.encode('utf-8'), signed.encode('utf-8'), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(signature, expected):
+            return SIGNATURE_MISMATCH, 'Signature verification failed'
+        timestamp = int(query.get('timestamp', ['0'])[0])
+        recv_window = int(query.get('recvWindow', [self.recv_window])[0])
+        # Like BingX, timestamps may lag by the recvWindow but only run ahead by a second
+        if not -1000 <= self.now() - timestamp <= recv_window:
+            return INVALID_TIMESTAMP, 'Timestamp is outside of the recvWindow'
+        return None
+
+    def now(self) -> int:
+        """Exchange time in milliseconds"""
+        return int(time.time() * 1000 + self.clock_offset)
+
+    def _ticker(self, symbol: Optional[str]) -> Dict[str, Any]:
+        now = self.now()
+        if symbol is None:
+            data = [{'symbol': name, 'price': str(path.advance()), 'time': now} for name, path in self.prices.items()]
+        else:
+            data = {'symbol': symbol, 'price': str(self.path(symbol).advance()), 'time': now}
+        return {'code': 0, 'msg': '', 'data': data}
+
+    def _contracts(self, symbol: Optional[str]) -> Dict[str, Any]:
+        symbols = [symbol] if symbol else sorted(set(self.prices) | set(self.contracts))
+        return {'code': 0, 'msg': '', 'data': [self.contract(name) for name in symbols]}
+
+    def _order_error(self, params: Dict[str, str]) -> Optional[str]:
+        """Why the exchange rejects an order, None when it's valid"""
+        side = params.get('side')
+        quantity = Decimal(params.get('quantity', '0'))
+        if side not in ('BUY', 'SELL') or quantity <= 0:
+            return 'Invalid order parameters'
+        contract = self.contract(params['symbol'])
+        if quantity != quantity.quantize(Decimal(1).scaleb(-int(contract['quantityPrecision']))):
+            return f"Quantity precision is {contract['quantityPrecision']} decimals"
+        if quantity < Decimal(contract['tradeMinQuantity']):
+            return f"Quantity is below the minimum of {contract['tradeMinQuantity']}"
+        if side == 'BUY' and quantity * self.path(params['symbol']).current < Decimal(contract['tradeMinUSDT']):
+            return f"Order value is below the minimum of {contract['tradeMinUSDT']} USDT"
+        return None
+
+    def _order(self, params: Dict[str, str]) -> Dict[str, Any]:
+        error = self._order_error(params)
+        if error:
+            return {'code': INVALID_PARAMETERS, 'msg': error, 'data': {}}
+
+        side = params['side']
+        quantity = Decimal(params['quantity'])
+        # Market orders fill at the last quoted price, moved against the taker by the slippage
+        price = self.path(params['symbol']).current
+        direction = 1 if side == 'BUY' else -1
+        fill_price = (price * (1 + direction * self.slippage)).quantize(Decimal('0.0001'))
+        executed = (quantity * self.fill_ratio).normalize()
+        filled_at = self.now()
+        order = {
+            'symbol': params['symbol'],
+            'orderId': next(self._order_ids),
+            'side': side,
+            'positionSide': params.get('positionSide', 'BOTH'),
+            'type': params.get('type', 'MARKET'),
+            'origQty': params['quantity'],
+            'avgPrice': str(fill_price),
+            'executedQty': str(executed),
+            'status': 'FILLED' if executed == quantity else 'PARTIALLY_FILLED',
+            'time': filled_at,
+            'updateTime': filled_at,
+        }
+        if 'clientOrderID' in params:
+            order['clientOrderID'] = params['clientOrderID']
+        self.orders.append(order)
+        self._fill(params['symbol'], side, executed, fill_price)
+        return {'code': 0, 'msg': '', 'data': {'order': order}}
+
+    def _fill(self, symbol: str, side: str, quantity: Decimal, price: Decimal):
+        held, avg_price = self.positions.get(symbol, (Decimal(0), Decimal(0)))
+        if side == 'BUY':
+            self.positions[symbol] = (held + quantity, (held * avg_price + quantity * price) / (held + quantity))
+        elif held - quantity > 0:
+            self.positions[symbol] = (held - quantity, avg_price)
+        else:
+            self.positions.pop(symbol, None)
+
+    def close_by_hand(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Sell the whole position of a symbol like a user would on the website, returns the order"""
+        with self._lock:
+            held, _ = self.positions.get(symbol, (Decimal(0), Decimal(0)))
+            if not held:
+                return None
+            return self._order({'symbol': symbol, 'side': 'SELL', 'positionSide': 'LONG',
+                                'quantity': str(held)})['data']['order']
+
+    def _positions(self, symbol: Optional[str]) -> Dict[str, Any]:
+        data = [
+            {'symbol': name, 'positionSide': 'LONG', 'positionAmt': str(held), 'availableAmt': str(held),
+             'avgPrice': str(avg_price.quantize(Decimal('0.0001')))}
+            for name, (held, avg_price) in sorted(self.positions.items()) if symbol in (None, name)
+        ]
+        return {'code': 0, 'msg': '', 'data': data}
+
+    def _all_orders(self, params: Dict[str, str]) -> Dict[str, Any]:
+        try:
+            start, end = int(params['startTime']), int(params['endTime'])
+            limit = int(params.get('limit', 500))
+        except (KeyError, ValueError):
+            return {'code': INVALID_PARAMETERS, 'msg': 'startTime and endTime are required', 'data': {}}
+        if not 0 <= end - start <= MAX_ORDERS_SPAN or not 0 < limit <= MAX_ORDERS_PAGE:
+            return {'code': INVALID_PARAMETERS, 'msg': 'Invalid time range or limit', 'data': {}}
+        # Oldest first, a full page is continued from the update time of its last order
+        orders = [order for order in sorted(self.orders, key=lambda order: (order['updateTime'], order['orderId']))
+                  if start <= order['updateTime'] <= end and params.get('symbol') in (None, order['symbol'])]
+        return {'code': 0, 'msg': '', 'data': {'orders': orders[:limit]}}
+
+    def _batch_orders(self, params: Dict[str, str]) -> Dict[str, Any]:
+        try:
+            batch = json.loads(params.get('batchOrders', ''))
+        except ValueError:
+            batch = None
+        if not isinstance(batch, list) or not 0 < len(batch) <= MAX_BATCH_ORDERS:
+            return {'code': INVALID_PARAMETERS, 'msg': f'batchOrders must hold 1 to {MAX_BATCH_ORDERS} orders',
+                    'data': {}}
+        batch = [{name: str(value) for name, value in order.items()} for order in batch]
+        # The batch is rejected as a whole, nothing is filled when one order is invalid
+        for order in batch:
+            error = self._order_error(order)
+            if error:
+                return {'code': INVALID_PARAMETERS, 'msg': error, 'data': {}}
+        orders = [self._order(order)['data']['order'] for order in batch]
+        return {'code': 0, 'msg': '', 'data': {'orders': orders}}
+
+    def attach(self, client):
+        """
+        Route a BingXClient or AsyncBingXClient to the simulator in-process.
+
+        The client's clock is synced directly, so injected errors hit the calls under test.
+        """
+        now = time.time()
+        client.clock.update(self.now(), now, now)
+        if isinstance(client.session, httpx.AsyncClient):
+            client.session = httpx.AsyncClient(headers=client.session.headers,
+                                               transport=httpx.MockTransport(self._httpx_reply))
+        else:
+            client.session.mount(client.base_url, SimulatorAdapter(self))
+        return client
+
+    def _httpx_reply(self, request: httpx.Request) -> httpx.Response:
+        status, body = self.handle(request.method, str(request.url), dict(request.headers))
+        return httpx.Response(status, json=body)
+
+    def serve(self, host: str = '127.0.0.1', port: int = 0):
+        """
+        Serve the simulator over HTTP from a background thread.
+
+        Returns the server and its base URL; call server.shutdown() when done.
+        """
+        server = SimulatorServer((host, port), SimulatorRequestHandler)
+        server.simulator = self
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f"http://{host}:{server.server_address[1]}"
+
+
+class SimulatorAdapter(BaseAdapter):
+    """
+    requests transport adapter answering from a simulator instead of the network.
+    """
+
+    def __init__(self, simulator: BingXSimulator):
+        super().__init__()
+        self.simulator = simulator
+
+    def send(self, request, **kwargs):
+        status, body = self.simulator.handle(request.method, request.url, dict(request.headers))
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode('utf-8')
+        response.headers['Content-Type'] = 'application/json'
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        status, body = self.server.simulator.handle(self.command, self.path, dict(self.headers))
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SimulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections during a burst
+    request_queue_size = 1024
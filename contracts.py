@@ -0,0 +1,251 @@
+"""
+In-process cache of contract trading rules.
+
+BingX rejects orders whose quantity isn't a multiple of the contract's step
+size or falls below its minimums. The rules of every contract are loaded in
+one request and reloaded in the background on a schedule, so orders can be
+quantized and checked locally instead of costing a rejected round trip.
+
+A failed or empty load keeps the current rules and isn't retried before
+CONTRACT_CACHE_RETRY_INTERVAL, and symbols the exchange doesn't know are
+remembered for CONTRACT_CACHE_MISS_TTL, so an outage or a typo in an alert
+doesn't turn every order into extra requests.
+"""
+import logging
+import os
+import threading
+import time
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
+from typing import Any, Dict, List, Optional
+
+from bingx_client import get_market_client
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidOrder(ValueError):
+    """An order the exchange is sure to reject"""
+
+
+class ContractSpec:
+    """
+    Trading rules of a perpetual contract.
+    """
+    __slots__ = ('symbol', 'step_size', 'tick_size', 'min_quantity', 'min_notional')
+
+    def __init__(self, symbol: str, step_size: Decimal, tick_size: Decimal, min_quantity: Decimal = Decimal(0),
+                 min_notional: Decimal = Decimal(0)):
+        """
+        Args:
+            symbol: Trading pair (e.g., 'BTC-USDT')
+            step_size: Quantities must be a multiple of it
+            tick_size: Prices must be a multiple of it
+            min_quantity: Smallest quantity of an order
+            min_notional: Smallest value in USDT of an opening order
+        """
+        self.symbol = symbol
+        self.step_size = step_size
+        self.tick_size = tick_size
+        self.min_quantity = min_quantity
+        self.min_notional = min_notional
+
+    @classmethod
+    def from_api(cls, contract: Dict[str, Any]) -> 'ContractSpec':
+        """Build the rules from an entry of the contracts endpoint"""
+        return cls(
+            symbol=contract['symbol'],
+            step_size=Decimal(1).scaleb(-int(contract['quantityPrecision'])),
+            tick_size=Decimal(1).scaleb(-int(contract['pricePrecision'])),
+            min_quantity=Decimal(str(contract.get('tradeMinQuantity') or 0)),
+            min_notional=Decimal(str(contract.get('tradeMinUSDT') or 0)),
+        )
+
+    def quantize_quantity(self, quantity) -> Decimal:
+        """Round a quantity down to the step size, so an order never exceeds what was asked for"""
+        return Decimal(quantity).quantize(self.step_size, rounding=ROUND_DOWN)
+
+    def quantize_price(self, price, rounding: str = ROUND_HALF_UP) -> Decimal:
+        """Round a price to the tick size"""
+        return Decimal(price).quantize(self.tick_size, rounding=rounding)
+
+    def order_quantity(self, quantity, price: Decimal, opening: bool = True) -> Decimal:
+        """
+        Quantize the quantity of an order and check it against the minimums.
+
+        Raises InvalidOrder when the exchange would reject the order. Closing
+        orders skip the minimum value, a position must stay closable after
+        its price fell.
+        """
+        quantity = self.quantize_quantity(quantity)
+        if quantity <= 0 or quantity < self.min_quantity:
+            raise InvalidOrder(f"Quantity {quantity} is below the minimum of {self.min_quantity} for {self.symbol}")
+        if opening and quantity * price < self.min_notional:
+            raise InvalidOrder(
+                f"Order value {(quantity * price).quantize(Decimal('0.01'))} USDT is below the minimum of "
+                f"{self.min_notional} USDT for {self.symbol}"
+            )
+        return quantity
+
+    def __repr__(self):
+        return f'ContractSpec({self.symbol} step {self.step_size} tick {self.tick_size})'
+
+
+class ContractCache:
+    """
+    Trading rules per symbol, loaded in bulk and reloaded in the background.
+    """
+
+    def __init__(self, client, refresh_interval: float = None, retry_interval: float = None,
+                 miss_ttl: float = None):
+        """
+        Initialize the contract cache.
+
+        Args:
+            client: BingX client the rules are loaded with
+            refresh_interval: Seconds between bulk reloads (0 loads once)
+            retry_interval: Seconds before a failed bulk load is tried again
+            miss_ttl: Seconds a symbol the exchange has no rules for isn't asked about again
+        """
+        self.client = client
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv('CONTRACT_CACHE_REFRESH_INTERVAL', '3600'))
+        if retry_interval is None:
+            retry_interval = float(os.getenv('CONTRACT_CACHE_RETRY_INTERVAL', '30'))
+        if miss_ttl is None:
+            miss_ttl = float(os.getenv('CONTRACT_CACHE_MISS_TTL', '60'))
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.miss_ttl = miss_ttl
+        self._specs: Dict[str, ContractSpec] = {}
+        # Symbol to when the exchange last had no rules for it
+        self._misses: Dict[str, float] = {}
+        self._loaded_at: Optional[float] = None
+        self._failed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self):
+        """
+        Reload the rules of every contract in one request.
+
+        Raises ValueError when the exchange returns none, the client can't tell that from a failed request.
+        """
+        specs = {}
+        for contract in self.client.get_contracts():
+            spec = ContractSpec.from_api(contract)
+            specs[spec.symbol] = spec
+        if not specs:
+            raise ValueError("Exchange returned no contracts")
+        self._specs = specs
+        self._misses = {}
+        self._loaded_at = time.monotonic()
+        self._failed_at = None
+
+    def stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return bool(self.refresh_interval) and time.monotonic() - self._loaded_at >= self.refresh_interval
+
+    def due(self) -> bool:
+        """Whether a bulk load should run, stale rules wait retry_interval after a failed load"""
+        if self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_interval:
+            return False
+        return self.stale()
+
+    def _missed(self, symbol: str) -> bool:
+        missed_at = self._misses.get(symbol)
+        return missed_at is not None and time.monotonic() - missed_at < self.miss_ttl
+
+    def get(self, symbol: str) -> Optional[ContractSpec]:
+        """
+        Get the rules of a symbol, None when the exchange can't tell.
+
+        The first call loads every contract, later reloads run in the background
+        while the current rules keep being served.
+        """
+        if self._loaded_at is None:
+            if self.due():
+                with self._lock:
+                    if self._loaded_at is None and self.due():
+                        self._load_logged()
+        elif self.due():
+            self.refresh_in_background()
+        spec = self._specs.get(symbol)
+        if spec is None and not self._missed(symbol):
+            try:
+                # Listed after the last reload, or unknown to the exchange
+                spec = self._store(self.client.get_contracts(symbol), symbol)
+            except Exception as e:
+                logger.warning(f"Failed to load the contract rules of {symbol}: {e}")
+                self._misses[symbol] = time.monotonic()
+        return spec
+
+    async def aget(self, symbol: str, client) -> Optional[ContractSpec]:
+        """
+        Async counterpart of get, symbols missing from the cache are fetched with the given async client
+        """
+        if self.due():
+            self.refresh_in_background()
+        spec = self._specs.get(symbol)
+        if spec is None and not self._missed(symbol):
+            try:
+                spec = self._store(await client.get_contracts(symbol), symbol)
+            except Exception as e:
+                logger.warning(f"Failed to load the contract rules of {symbol}: {e}")
+                self._misses[symbol] = time.monotonic()
+        return spec
+
+    def _store(self, contracts: List[Dict[str, Any]], symbol: str) -> Optional[ContractSpec]:
+        for contract in contracts:
+            spec = ContractSpec.from_api(contract)
+            self._specs[spec.symbol] = spec
+        spec = self._specs.get(symbol)
+        if spec is None:
+            self._misses[symbol] = time.monotonic()
+        return spec
+
+    def refresh_in_background(self):
+        """Start a bulk reload unless one is running already"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._load_logged, name='contract-cache-refresh', daemon=True)
+            self._thread.start()
+
+    def _load_logged(self):
+        try:
+            self.load()
+        except Exception as e:
+            # The current rules keep being served, or orders go out unchecked until a load succeeds
+            self._failed_at = time.monotonic()
+            logger.warning(f"Contract rules load failed, retrying in {self.retry_interval:g}s: {e}")
+
+
+_caches: Dict[bool, ContractCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_contract_cache(demo: bool = False) -> ContractCache:
+    """
+    Return the process-wide contract cache for the live or demo endpoint.
+    """
+    cache = _caches.get(demo)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(demo)
+            if cache is None:
+                cache = ContractCache(get_market_client(demo=demo))
+                _caches[demo] = cache
+    return cache
+
+
+def _reset_caches():
+    """Refresh threads don't survive a fork, start over in the child"""
+    global _caches_lock
+    _caches.clear()
+    _caches_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_caches)
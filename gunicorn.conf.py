@@ -0,0 +1,42 @@
+"""
+Gunicorn settings, read from the working directory.
+
+    gunicorn liftoff.wsgi
+    gunicorn liftoff.asgi:application -k uvicorn.workers.UvicornWorker
+
+The app is imported once in the master, so recycled and added workers fork
+with Django already loaded, and each worker warms up before it accepts its
+first request.
+"""
+import os
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true') == 'true'
+
+
+def post_worker_init(worker):
+    """Warm the worker up, it only starts accepting requests once this returns"""
+    if 'uvicorn' in worker.cfg.worker_class_str.lower():
+        # The ASGI application warms up in its lifespan startup, on the worker's event loop
+        return
+    from webhooks.warmup import WARM_UP, warm_up
+
+    if WARM_UP:
+        warm_up()
+
+
+def child_exit(server, worker):
+    """Drop the metrics of a worker that went away from the multiprocess directory"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    """Write the audit events and send the Telegram messages still queued, in the exiting worker"""
+    from webhooks.audit import audit_log
+    from webhooks.trading import notifier
+
+    audit_log.flush()
+    if not notifier.flush(timeout=float(os.getenv('TELEGRAM_FLUSH_TIMEOUT', '10'))):
+        server.log.warning("Telegram messages still queued when the worker exited were dropped")
@@ -5,6 +5,13 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Serve it with ``gunicorn liftoff.asgi:application -k uvicorn.workers.UvicornWorker``
+to run ``webhook/async/`` natively on the event loop. Workers warm up during the
+lifespan startup, before they accept connections. DB_CONN_MAX_AGE defaults to 0
+here: queries run in sync_to_async threads, each with its own connection, and a
+persistent one is only closed when its thread serves another request, so they
+pile up until Postgres runs out of connections.
 """
 
 import os
@@ -12,5 +19,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'liftoff.settings')
+# Read when the settings load, in get_asgi_application
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+django_application = get_asgi_application()
+
+from webhooks.warmup import with_warm_up  # noqa: E402 needs the apps loaded
 
-application = get_asgi_application()
+application = with_warm_up(django_application)
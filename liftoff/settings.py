@@ -40,7 +40,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'liftoff.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,6 +88,11 @@ DATABASES = {
         'PASSWORD': os.environ["PGPASSWORD"],
         'HOST': os.environ["PGHOST"],
         'PORT': os.environ["PGPORT"],
+        # Keep connections across requests under WSGI, the warm one opened at worker start included.
+        # liftoff.asgi defaults this to 0: there the ORM runs in sync_to_async threads, connections
+        # are per thread and the ones left open by threads that don't serve the next request leak
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -152,6 +157,13 @@ TRADINGVIEW_IPS = [
 ]
 WEBHOOK_IP_ALLOWED += TRADINGVIEW_IPS
 
+# Addresses allowed to read /metrics and /stats/ besides logged in staff users, nobody else when empty
+METRICS_IP_ALLOWED = [ip for ip in os.getenv("METRICS_IP_ALLOWED", "").split(",") if ip]
+
+# Reverse proxies in front of the app, addresses or networks like 10.0.0.0/8. X-Forwarded-For is only
+# read on requests coming from them, otherwise any client could pick the address it's checked against
+TRUSTED_PROXIES = [proxy.strip() for proxy in os.getenv("TRUSTED_PROXIES", "").split(",") if proxy.strip()]
+
 # Telegram Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
@@ -0,0 +1,102 @@
+"""
+Prometheus metrics of the webhook hot path, the BingX client and Telegram delivery.
+
+Observing a histogram costs a few microseconds, so timers stay on in production.
+Under gunicorn set PROMETHEUS_MULTIPROC_DIR to a writable, empty directory so
+the /metrics endpoint aggregates every worker instead of the one answering.
+"""
+import logging
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Webhook latency is dominated by exchange round trips, buckets go from 1ms to 10s
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+WEBHOOK_SECONDS = Histogram(
+    'webhook_request_seconds', 'Time to answer a webhook alert',
+    ['view', 'side', 'demo', 'status'], buckets=BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    'webhook_stage_seconds', 'Time spent in each stage of handling a webhook alert',
+    ['stage', 'demo', 'outcome'], buckets=BUCKETS,
+)
+EXCHANGE_SECONDS = Histogram(
+    'bingx_request_seconds', 'BingX API round trips',
+    ['endpoint', 'method', 'demo', 'outcome'], buckets=BUCKETS,
+)
+EXCHANGE_ERRORS = Counter(
+    'bingx_errors', 'Requests rejected by BingX, by error code',
+    ['endpoint', 'demo', 'code'],
+)
+EXCHANGE_RETRIES = Counter(
+    'bingx_retries', 'BingX requests retried, by the reason they failed',
+    ['endpoint', 'demo', 'reason'],
+)
+TELEGRAM_SECONDS = Histogram(
+    'telegram_send_seconds', 'Telegram sendMessage round trips',
+    ['outcome'], buckets=BUCKETS,
+)
+TELEGRAM_DROPPED = Counter('telegram_dropped_messages', 'Telegram messages given up on', ['reason'])
+AUDIT_EVENTS = Counter('audit_events', 'Audit events by what became of them: written, dropped or failed', ['outcome'])
+EXITS = Counter('position_exits', 'Take-profit, stop-loss and trailing-stop exits fired, by outcome', ['reason', 'outcome'])
+
+def demo_label(demo: bool) -> str:
+    return 'demo' if demo else 'live'
+
+
+class stage:
+    """
+    Time a block as one stage of the webhook handler.
+
+        with stage('price', client.demo):
+            price = get_price_cache(client.demo).get_price(ticker)
+
+    The outcome label is "error" when the block raises, demo and outcome can be
+    set on the timer inside the block once they are known.
+    """
+    __slots__ = ('name', 'demo', 'outcome', 'start')
+
+    def __init__(self, name: str, demo: bool = False):
+        self.name = name
+        self.demo = demo
+        self.outcome = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        outcome = 'error' if exc_type else self.outcome or 'ok'
+        STAGE_SECONDS.labels(self.name, demo_label(self.demo), outcome).observe(time.perf_counter() - self.start)
+
+
+def observe_exchange(endpoint: str, method: str, demo: bool, start: float, response=None, outcome: str = None):
+    """
+    Record a BingX round trip.
+
+    Responses carrying a non-zero code are counted as rejections by code. Their
+    message embeds order details at times, so it's logged rather than made a label.
+    """
+    if outcome is None:
+        code = response.get('code', 0) if isinstance(response, dict) else 0
+        if code:
+            outcome = 'rejected'
+            EXCHANGE_ERRORS.labels(endpoint, demo_label(demo), str(code)).inc()
+            logger.warning(f"BingX rejected {endpoint} ({demo_label(demo)}) with code {code}: {response.get('msg')}")
+        else:
+            outcome = 'ok'
+    EXCHANGE_SECONDS.labels(endpoint, method, demo_label(demo), outcome).observe(time.perf_counter() - start)
+
+
+def render():
+    """Return the exposition payload and its content type"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+    return generate_latest(registry), CONTENT_TYPE_LATEST
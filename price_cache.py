@@ -0,0 +1,230 @@
+"""
+In-process cache of last traded prices.
+
+A background poller keeps the prices of the symbols we trade fresh, so the
+webhook handler can read them from memory instead of making a REST round trip
+per alert. Entries older than their max age fall back to the REST endpoint.
+Listeners subscribed to a cache are called with every price it receives.
+"""
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from bingx_client import get_market_client
+
+logger = logging.getLogger(__name__)
+
+
+class PriceFeed:
+    """
+    Source of last prices for a set of symbols.
+    """
+
+    def fetch(self, symbols: Iterable[str]) -> Dict[str, Decimal]:
+        raise NotImplementedError
+
+
+class BingXPriceFeed(PriceFeed):
+    """
+    Polls the BingX ticker endpoint, all symbols in one request.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def fetch(self, symbols: Iterable[str]) -> Dict[str, Decimal]:
+        prices = self.client.get_prices()
+        return {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+
+class FakePriceFeed(PriceFeed):
+    """
+    Local feed for tests, serves whatever prices were set on it.
+    """
+
+    def __init__(self, prices: Dict[str, Decimal] = None):
+        self.prices = dict(prices or {})
+
+    def set_price(self, symbol: str, price: Decimal):
+        self.prices[symbol] = Decimal(price)
+
+    def fetch(self, symbols: Iterable[str]) -> Dict[str, Decimal]:
+        return {symbol: self.prices[symbol] for symbol in symbols if symbol in self.prices}
+
+
+class PriceCache:
+    """
+    Last price per symbol with per-entry staleness limits and REST fallback.
+    """
+
+    def __init__(self, client, feed: PriceFeed = None, max_age: float = None, poll_interval: float = None):
+        """
+        Initialize the price cache.
+
+        Args:
+            client: BingX client used for REST fallbacks
+            feed: Source polled in the background (defaults to the BingX ticker endpoint)
+            max_age: Seconds after which an entry is too old to be served
+            poll_interval: Seconds between feed polls (0 disables the poller)
+        """
+        self.client = client
+        self.feed = feed or BingXPriceFeed(client)
+        if max_age is None:
+            max_age = float(os.getenv('PRICE_CACHE_MAX_AGE', '2'))
+        if poll_interval is None:
+            poll_interval = float(os.getenv('PRICE_CACHE_POLL_INTERVAL', '1'))
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        self._entries: Dict[str, Tuple[Decimal, float]] = {}
+        self._max_ages: Dict[str, float] = {}
+        self._symbols = set()
+        self._listeners: List[Callable[[str, Decimal], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def set_max_age(self, symbol: str, max_age: float):
+        """Override the staleness limit of a single symbol"""
+        self._max_ages[symbol] = max_age
+
+    def track(self, *symbols: str):
+        """Add symbols to the set refreshed by the poller"""
+        with self._lock:
+            self._symbols.update(symbols)
+
+    def subscribe(self, listener: Callable[[str, Decimal], None]):
+        """Call listener(symbol, price) with every price received, from the thread that received it"""
+        self._listeners.append(listener)
+
+    def update(self, symbol: str, price: Decimal, received_at: float = None):
+        """Store the last price of a symbol"""
+        if received_at is None:
+            received_at = time.monotonic()
+        self._entries[symbol] = (price, received_at)
+        for listener in self._listeners:
+            try:
+                listener(symbol, price)
+            except Exception:
+                # A failing listener must not keep the price from being served
+                logger.exception(f"Price listener failed on {symbol}")
+
+    def get_cached(self, symbol: str) -> Optional[Decimal]:
+        """Return the cached price, or None when missing or too old"""
+        entry = self._entries.get(symbol)
+        if entry is None:
+            return None
+        price, received_at = entry
+        if time.monotonic() - received_at > self._max_ages.get(symbol, self.max_age):
+            return None
+        return price
+
+    def get_price(self, symbol: str) -> Decimal:
+        """
+        Get the current price of a symbol, from memory when fresh enough
+        """
+        price = self.get_cached(symbol)
+        if price is None:
+            self.track(symbol)
+            self.ensure_started()
+            price = self.client.get_price(symbol)
+            self.update(symbol, price)
+        return price
+
+    def get_prices(self, symbols: Iterable[str]) -> Dict[str, Decimal]:
+        """
+        Get the current price of several symbols, refreshing stale ones with a single bulk request
+        """
+        prices = {symbol: self.get_cached(symbol) for symbol in symbols}
+        missing = [symbol for symbol, price in prices.items() if price is None]
+        if missing:
+            self.track(*missing)
+            self.ensure_started()
+            received_at = time.monotonic()
+            for symbol, price in self.client.get_prices().items():
+                self.update(symbol, price, received_at)
+                if symbol in prices:
+                    prices[symbol] = price
+            for symbol in missing:
+                if prices[symbol] is None:
+                    # Not listed by the bulk endpoint, ask for it alone
+                    prices[symbol] = self.client.get_price(symbol)
+                    self.update(symbol, prices[symbol])
+        return prices
+
+    async def aget_price(self, symbol: str, client) -> Decimal:
+        """
+        Async counterpart of get_price, falls back to the given async client
+        """
+        price = self.get_cached(symbol)
+        if price is None:
+            self.track(symbol)
+            self.ensure_started()
+            price = await client.get_price(symbol)
+            self.update(symbol, price)
+        return price
+
+    def poll(self):
+        """Refresh every tracked symbol from the feed once"""
+        with self._lock:
+            symbols = list(self._symbols)
+        if not symbols:
+            return
+        received_at = time.monotonic()
+        for symbol, price in self.feed.fetch(symbols).items():
+            self.update(symbol, price, received_at)
+
+    def ensure_started(self):
+        """Start the background poller unless it runs already or is disabled"""
+        if self.poll_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='price-cache-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                # Entries age out and fall back to REST until the feed recovers
+                logger.warning(f"Price feed poll failed: {e}")
+
+
+_caches: Dict[bool, PriceCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_price_cache(demo: bool = False) -> PriceCache:
+    """
+    Return the process-wide price cache for the live or demo endpoint.
+    """
+    cache = _caches.get(demo)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(demo)
+            if cache is None:
+                cache = PriceCache(get_market_client(demo=demo))
+                _caches[demo] = cache
+    return cache
+
+
+def _reset_caches():
+    """Poller threads don't survive a fork, start over in the child"""
+    global _caches_lock
+    _caches.clear()
+    _caches_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_caches)
@@ -3,65 +3,259 @@ Telegram client for sending trading bot notifications.
 """
 import os
 import logging
+import queue
+import threading
+import time
 import requests
 from typing import Optional
+from requests.adapters import HTTPAdapter
+from metrics import TELEGRAM_DROPPED, TELEGRAM_SECONDS
+from rate_limit import TokenBucket
 logger = logging.getLogger(__name__)
 
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+
+def _retry_after(response: requests.Response, default: float) -> float:
+    """Seconds a 429 asks to wait, the default when its body doesn't say"""
+    try:
+        retry_after = float(response.json()['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return default
+    return retry_after if retry_after >= 0 else default
+
 
 class TelegramClient:
     """
     A client for sending notifications via Telegram Bot API.
     """
-    
-    def __init__(self, bot_token: Optional[str] = None, chat_id: Optional[str] = None):
+
+    def __init__(self, bot_token: Optional[str] = None, chat_id: Optional[str] = None, timeout: float = 10):
         """
         Initialize the Telegram client.
-        
+
         Args:
             bot_token: Telegram bot token (if not provided, will use environment variable)
             chat_id: Telegram chat ID (if not provided, will use environment variable)
+            timeout: Request timeout in seconds
         """
         self.bot_token = bot_token or os.getenv('TELEGRAM_BOT_TOKEN')
         self.chat_id = chat_id or os.getenv('TELEGRAM_CHAT_ID')
-        self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
-        
+        api_url = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+        self.base_url = f"{api_url}/bot{self.bot_token}"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=2)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
         if not self.bot_token:
             logger.warning("TELEGRAM_BOT_TOKEN not found in environment variables")
         if not self.chat_id:
             logger.warning("TELEGRAM_CHAT_ID not found in environment variables")
-    
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.bot_token and self.chat_id)
+
+    def get_me(self) -> requests.Response:
+        """
+        Call getMe and return the raw response, raising on network errors.
+
+        Checks the token and opens the pooled connection ahead of the first message.
+        """
+        return self.session.get(f"{self.base_url}/getMe", timeout=self.timeout)
+
+    def post_message(self, text: str, parse_mode: str = "HTML", disable_notification: bool = False) -> requests.Response:
+        """
+        Send a text message and return the raw response, raising on network errors.
+        """
+        url = f"{self.base_url}/sendMessage"
+        data = {
+            'chat_id': self.chat_id,
+            'text': text,
+            'disable_notification': disable_notification
+        }
+
+        if parse_mode:
+            data['parse_mode'] = parse_mode
+
+        return self.session.post(url, data=data, timeout=self.timeout)
+
     def send_message(self, text: str, parse_mode: str = "HTML", disable_notification: bool = False) -> bool:
         """
         Send a text message to the configured chat.
-        
+
         Args:
             text: Message text to send
             parse_mode: Parse mode for the message (HTML, Markdown, or None)
             disable_notification: Whether to disable notification sound
-            
+
         Returns:
             bool: True if message was sent successfully, False otherwise
         """
-        if not self.bot_token or not self.chat_id:
+        if not self.configured:
             logger.error("Telegram bot token or chat ID not configured")
             return False
-        
-        url = f"{self.base_url}/sendMessage"
-        data = {
-            'chat_id': self.chat_id,
-            'text': text,
-            'disable_notification': disable_notification
-        }
-        
-        if parse_mode:
-            data['parse_mode'] = parse_mode
-        
+
         try:
-            response = requests.post(url, data=data, timeout=10)
+            response = self.post_message(text, parse_mode, disable_notification)
             response.raise_for_status()
             logger.info(f"Telegram message sent successfully: {text[:50]}...")
             return True
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to send Telegram message: {e}")
             return False
-    
\ No newline at end of file
+
+
+class TelegramDispatcher:
+    """
+    Outbox that delivers Telegram messages from a background thread.
+
+    Callers enqueue and return immediately. The worker coalesces bursts into
+    fewer messages, paces them with a token bucket to stay under Telegram's
+    per-chat limits and retries failures with exponential backoff.
+    """
+
+    def __init__(self, client: TelegramClient, coalesce_window: float = 0.5, rate: float = 1.0,
+                 burst: int = 1, max_retries: int = 5, max_queue: int = 1000):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            client: Telegram client used for delivery
+            coalesce_window: Seconds to wait for more messages before sending a batch
+            rate: Messages per second allowed to the chat
+            burst: Messages that may be sent back to back before pacing kicks in
+            max_retries: Delivery attempts before a message is dropped
+            max_queue: Pending messages kept before new ones are dropped
+        """
+        self.client = client
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+        self.bucket = TokenBucket(rate, burst)
+        self._start_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.max_queue)
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, text: str):
+        """Queue a message for delivery, never blocks"""
+        if not self.client.configured:
+            logger.error("Telegram bot token or chat ID not configured")
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            TELEGRAM_DROPPED.labels('queue_full').inc()
+            logger.error(f"Telegram outbox full, dropping message: {text[:50]}...")
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every queued message has been delivered or dropped.
+
+        Returns False when messages were still pending after timeout seconds.
+        """
+        if self._queue.unfinished_tasks:
+            # A worker that died would never drain the queue
+            self._ensure_started()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            # Forked from a process that already had a worker, it didn't survive
+            self._reset()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is not None:
+                    logger.error("Telegram dispatcher thread died, starting a new one")
+                self._thread = threading.Thread(target=self._run, name='telegram-dispatcher', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        """Block for a message, then collect whatever arrives within the coalesce window"""
+        batch = [self._queue.get()]
+        length = len(batch[0])
+        deadline = time.monotonic() + self.coalesce_window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                text = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if length + len(text) + 2 > MAX_MESSAGE_LENGTH:
+                # Doesn't fit, send what we have and start the next batch with it
+                self._deliver(batch)
+                batch, length = [], 0
+            batch.append(text)
+            length += len(text) + 2
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._next_batch()
+                self._deliver(batch)
+            except Exception:
+                # _deliver already accounted for its batch, keep serving the queue
+                logger.exception("Telegram dispatcher failed")
+
+    def _deliver(self, batch):
+        text = "\n\n".join(batch)
+        try:
+            self._send(text)
+        except Exception:
+            TELEGRAM_DROPPED.labels('error').inc()
+            logger.exception(f"Dropping Telegram message after an unexpected error: {text[:50]}...")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _send(self, text: str):
+        for attempt in range(self.max_retries):
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.client.post_message(text)
+            except requests.exceptions.RequestException as e:
+                TELEGRAM_SECONDS.labels('network_error').observe(time.perf_counter() - start)
+                logger.warning(f"Failed to send Telegram message (attempt {attempt + 1}): {e}")
+                time.sleep(2 ** attempt)
+                continue
+            TELEGRAM_SECONDS.labels('ok' if response.ok else str(response.status_code)).observe(
+                time.perf_counter() - start
+            )
+
+            if response.ok:
+                logger.info(f"Telegram message sent successfully: {text[:50]}...")
+                return
+            if response.status_code == 429:
+                retry_after = _retry_after(response, 2 ** attempt)
+                logger.warning(f"Telegram rate limit hit, retrying in {retry_after}s")
+                self.bucket.drain(retry_after)
+            elif response.status_code >= 500:
+                logger.warning(f"Telegram error {response.status_code} (attempt {attempt + 1})")
+                time.sleep(2 ** attempt)
+            else:
+                TELEGRAM_DROPPED.labels('rejected').inc()
+                logger.error(f"Failed to send Telegram message: {response.status_code} {response.text}")
+                return
+        TELEGRAM_DROPPED.labels('retries_exhausted').inc()
+        logger.error(f"Dropping Telegram message after {self.max_retries} attempts: {text[:50]}...")
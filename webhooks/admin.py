@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import Settings, Position
+from django import forms
+from django.contrib import admin, messages
+from .export import filter_positions, stream_positions
+from .models import Account, AuditEvent, PnlRollup, Settings, Position, WebhookJob
 
 @admin.register(Settings)
 class SettingsAdmin(admin.ModelAdmin):
@@ -14,17 +16,80 @@ class SettingsAdmin(admin.ModelAdmin):
         }),
     )
 
+class OutcomeFilter(admin.SimpleListFilter):
+    title = 'outcome'
+    parameter_name = 'outcome'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('open', 'Open'),
+            ('win', 'Win'),
+            ('loss', 'Loss'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'open':
+            return queryset.filter(closed_at__isnull=True)
+        if self.value() == 'win':
+            return queryset.filter(pnl__gt=0)
+        if self.value() == 'loss':
+            return queryset.filter(pnl__lte=0)
+        return queryset
+
+
+class AccountForm(forms.ModelForm):
+    # Write-only, the stored secret is never rendered back
+    secret_key = forms.CharField(
+        widget=forms.PasswordInput(render_value=False), required=False,
+        help_text='Leave blank to keep the current secret key.',
+    )
+
+    class Meta:
+        model = Account
+        fields = '__all__'
+
+    def clean_secret_key(self):
+        secret_key = self.cleaned_data['secret_key']
+        if secret_key:
+            return secret_key
+        if not self.instance.pk:
+            raise forms.ValidationError('This field is required.')
+        return self.instance.secret_key
+
+
+@admin.register(Account)
+class AccountAdmin(admin.ModelAdmin):
+    form = AccountForm
+    list_display = ('name', 'demo', 'enabled', 'position_usdt', 'created_at')
+    list_filter = ('demo', 'enabled')
+    search_fields = ('name',)
+    ordering = ('name',)
+
+    fieldsets = (
+        ('Account', {
+            'fields': ('name', 'demo', 'enabled', 'position_usdt')
+        }),
+        ('Credentials', {
+            'fields': ('api_key', 'secret_key')
+        }),
+    )
+
+
 @admin.register(Position)
 class PositionAdmin(admin.ModelAdmin):
-    list_display = ('ticker', 'formatted_quantity_usdt', 'formatted_avg_buy_price', 'formatted_avg_sell_price', 'formatted_profit', 'formatted_profit_rate', 'created_at', 'closed_at', 'trade_completion_time')
-    list_filter = ('ticker', 'timeframe', 'created_at')
+    list_display = ('ticker', 'account', 'formatted_quantity_usdt', 'formatted_avg_buy_price', 'formatted_avg_sell_price', 'formatted_profit', 'formatted_profit_rate', 'created_at', 'closed_at', 'trade_completion_time')
+    list_filter = (OutcomeFilter, 'account', 'ticker', 'timeframe', 'created_at')
+    list_select_related = ('account',)
     search_fields = ('ticker', 'timeframe')
     ordering = ('-created_at',)
     readonly_fields = ('created_at', 'closed_at')
+    # Counting millions of rows on every page load is slower than the page itself
+    show_full_result_count = False
+    actions = ('export_csv', 'export_parquet')
     
     fieldsets = (
         ('Position Details', {
-            'fields': ('ticker', 'timeframe')
+            'fields': ('account', 'ticker', 'timeframe', 'demo')
         }),
         ('Quantities', {
             'fields': ('quantity', 'quantity_usdt')
@@ -32,6 +97,10 @@ class PositionAdmin(admin.ModelAdmin):
         ('Prices', {
             'fields': ('avg_buy_price', 'avg_sell_price')
         }),
+        ('Exits', {
+            'fields': ('take_profit', 'stop_loss', 'trailing_stop'),
+            'description': 'Watched by the run_exits command. The trailing stop is a fraction, e.g. 0.05 for 5%.',
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at', 'closed_at'),
             'classes': ('collapse',)
@@ -62,28 +131,89 @@ class PositionAdmin(admin.ModelAdmin):
     
     def formatted_profit(self, obj):
         """Format profit to 2 decimal places"""
-        profit = obj.profit()
-        if profit is None:
+        if obj.pnl is None:
             return '-'
-        return f"{profit:.2f}"
+        return f"{obj.pnl:.2f}"
     formatted_profit.short_description = 'Profit (USDT)'
+    formatted_profit.admin_order_field = 'pnl'
     
     def formatted_profit_rate(self, obj):
         """Format profit rate to 2 decimal places with % sign"""
-        profit_rate = obj.profit_rate()
-        if profit_rate is None:
+        if obj.pnl_rate is None:
             return '-'
-        return f"{profit_rate:.2f}%"
+        return f"{obj.pnl_rate:.2f}%"
     formatted_profit_rate.short_description = 'Profit Rate'
+    formatted_profit_rate.admin_order_field = 'pnl_rate'
     
     def trade_completion_time(self, obj):
-        """Format trade completion time to 2 decimal places with % sign"""
-        if obj.closed_at is None:
+        """Time between opening and closing the position"""
+        if obj.holding_time is None:
             return '-'
-        return obj.closed_at - obj.created_at
+        return obj.holding_time
     trade_completion_time.short_description = 'Trade Completion Time'
+    trade_completion_time.admin_order_field = 'holding_time'
+
+    def get_queryset(self, request):
+        # Profit columns are computed by the database so they sort and filter in SQL
+        return super().get_queryset(request).with_pnl()
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None:
+            response.context_data['pnl_summary'] = changelist.queryset.pnl_summary()
+        return response
+    
+    def export(self, request, queryset, fmt):
+        try:
+            return stream_positions(request, filter_positions(queryset), fmt)
+        except ImportError as e:
+            self.message_user(request, str(e), messages.ERROR)
+
+    @admin.action(description='Export selected positions as CSV')
+    def export_csv(self, request, queryset):
+        return self.export(request, queryset, 'csv')
+
+    @admin.action(description='Export selected positions as Parquet')
+    def export_parquet(self, request, queryset):
+        return self.export(request, queryset, 'parquet')
     
     def get_readonly_fields(self, request, obj=None):
         if obj:  # editing an existing object
             return self.readonly_fields + ('created_at',)
         return self.readonly_fields
+
+
+@admin.register(WebhookJob)
+class WebhookJobAdmin(admin.ModelAdmin):
+    list_display = ('id', '__str__', 'status', 'result_status', 'created_at', 'claimed_at', 'finished_at')
+    list_filter = ('status',)
+    ordering = ('-created_at',)
+    readonly_fields = ('body', 'signal', 'status', 'result', 'result_status', 'created_at', 'claimed_at', 'finished_at')
+
+
+@admin.register(PnlRollup)
+class PnlRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'ticker', 'timeframe', 'account', 'demo', 'realized_pnl', 'trades', 'wins', 'volume')
+    list_filter = ('timeframe', 'day', 'demo', 'account')
+    search_fields = ('ticker',)
+    ordering = ('-day', 'ticker')
+    readonly_fields = ('account', 'demo', 'ticker', 'timeframe', 'day', 'realized_pnl', 'trades', 'wins', 'volume')
+
+
+@admin.register(AuditEvent)
+class AuditEventAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'source', 'side', 'ticker', 'timeframe', 'status', 'outcome', 'duration_ms')
+    list_filter = ('kind', 'outcome', 'demo')
+    search_fields = ('ticker',)
+    ordering = ('-created_at',)
+    # Counting millions of rows on every page load is slower than the page itself
+    show_full_result_count = False
+    readonly_fields = ('created_at', 'kind', 'source', 'demo', 'ticker', 'timeframe', 'side', 'request', 'response',
+                       'status', 'outcome', 'duration_ms')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,283 @@
+"""
+Audit trail of received alerts and of the orders sent to the exchange.
+
+Request threads only put events on a queue, a background thread writes them
+with bulk_create in batches of up to AUDIT_BATCH_SIZE, at least every
+AUDIT_FLUSH_INTERVAL seconds. When the database can't keep up and the queue
+fills, events are dropped and counted rather than slowing alerts down.
+
+On Postgres the table is partitioned by month of created_at: the
+audit_partitions command creates the coming months and drops the months
+past retention as a whole instead of deleting rows.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, List, Optional
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from metrics import AUDIT_EVENTS
+from webhooks.models import AuditEvent
+from webhooks.payload import Signal
+
+logger = logging.getLogger(__name__)
+
+# Set to false to stop recording
+AUDIT_LOG = os.getenv('AUDIT_LOG', 'true') == 'true'
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', '1'))
+AUDIT_MAX_QUEUE = int(os.getenv('AUDIT_MAX_QUEUE', '10000'))
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', '90'))
+
+TABLE = AuditEvent._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+class AuditLog:
+    """
+    Buffered writer of AuditEvents.
+    """
+
+    def __init__(self, enabled: bool = AUDIT_LOG, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, max_queue: int = AUDIT_MAX_QUEUE):
+        """
+        Initialize the audit log.
+
+        Args:
+            enabled: Record events at all
+            batch_size: Events written per INSERT
+            flush_interval: Seconds an event may wait for more to share its INSERT
+            max_queue: Events kept waiting before new ones are dropped
+        """
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._start_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.max_queue)
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, kind: str, outcome: str, start: float = None, **fields):
+        """
+        Queue an event, never blocks.
+
+        Args:
+            kind: AuditEvent.ALERT, ORDER or BATCH_ORDER
+            outcome: What came of it, e.g. ok or error
+            start: perf_counter() value the timing started at
+            **fields: Other AuditEvent fields
+        """
+        if not self.enabled:
+            return
+        if start is not None:
+            fields['duration_ms'] = (time.perf_counter() - start) * 1000
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(AuditEvent(kind=kind, outcome=outcome, created_at=timezone.now(), **fields))
+        except queue.Full:
+            AUDIT_EVENTS.labels('dropped').inc()
+
+    def alert(self, view: str, body: bytes, signal, response, start: float):
+        """Record an alert and the answer it got"""
+        fields = {}
+        if isinstance(signal, Signal):
+            fields.update(ticker=signal.ticker, timeframe=signal.timeframe, side=signal.side, demo=signal.use_demo)
+        elif isinstance(signal, list):
+            fields.update(side='batch', demo=any(item.use_demo for item in signal))
+        try:
+            answer = json.loads(response.content)
+        except ValueError:
+            answer = None
+        self.record(
+            AuditEvent.ALERT,
+            'ok' if response.status_code < 400 else 'rejected',
+            start,
+            source=view,
+            request=body.decode('utf-8', errors='replace'),
+            response=answer,
+            status=response.status_code,
+            **fields,
+        )
+
+    def order(self, kind: str, demo: bool, account, request, response: Optional[Dict[str, Any]], start: float,
+              error: Exception = None):
+        """Record an order or a batch of orders with the exchange response, or the error that prevented one"""
+        fields = {}
+        if kind == AuditEvent.ORDER:
+            fields.update(ticker=request['symbol'], side=request['side'])
+        if error is not None:
+            outcome, response = 'error', {'error': str(error)}
+        else:
+            outcome = 'ok' if response.get('code') == 0 else 'rejected'
+            fields['status'] = response.get('code')
+        self.record(kind, outcome, start, source=account.name if account is not None else '', demo=demo,
+                    request=request, response=response, **fields)
+
+    def flush(self):
+        """Write every queued event from the calling thread, e.g. before a worker exits"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            # Forked from a process that already had a writer, it didn't survive
+            self._reset()
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def _drain(self) -> List[AuditEvent]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _next_batch(self) -> List[AuditEvent]:
+        """Block for an event, then collect more until the batch is full or the flush interval passed"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[AuditEvent]):
+        for attempt in range(2):
+            try:
+                AuditEvent.objects.bulk_create(batch, batch_size=self.batch_size)
+                AUDIT_EVENTS.labels('written').inc(len(batch))
+                return
+            except Exception as e:
+                if attempt or connection.in_atomic_block:
+                    AUDIT_EVENTS.labels('failed').inc(len(batch))
+                    logger.error(f"Failed to write {len(batch)} audit events: {e}")
+                    return
+                # A dropped connection is reopened on the next attempt
+                connection.close()
+
+
+audit_log = AuditLog()
+
+
+def _month(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def _bound(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month: date) -> str:
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def _partitions(cursor) -> List[str]:
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits"
+        " JOIN pg_class parent ON parent.oid = pg_inherits.inhparent"
+        " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+        " WHERE parent.relname = %s",
+        [TABLE],
+    )
+    return [name for name, in cursor.fetchall()]
+
+
+def _partition_month(name: str) -> Optional[date]:
+    try:
+        return datetime.strptime(name[len(f'{TABLE}_p'):], '%Y%m').date()
+    except ValueError:
+        return None
+
+
+def create_partitions(months_ahead: int = 2, today: date = None) -> List[str]:
+    """
+    Create the monthly partitions from the current month to months_ahead months later, Postgres only.
+
+    Rows of the month that went to the default partition are moved into the new one.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    month = _month(today or timezone.now().date())
+    created = []
+    with connection.cursor() as cursor:
+        existing = set(_partitions(cursor))
+        for _ in range(months_ahead + 1):
+            name, end = partition_name(month), _next_month(month)
+            if name not in existing:
+                with transaction.atomic():
+                    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS)')
+                    cursor.execute(
+                        f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE created_at >= %s AND created_at < %s'
+                        f' RETURNING *) INSERT INTO "{name}" SELECT * FROM moved',
+                        [_bound(month), _bound(end)],
+                    )
+                    cursor.execute(
+                        f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+                        [_bound(month), _bound(end)],
+                    )
+                created.append(name)
+            month = end
+    return created
+
+
+def drop_expired(retention_days: int = AUDIT_RETENTION_DAYS) -> Dict[str, Any]:
+    """
+    Remove the events older than retention_days.
+
+    On Postgres the monthly partitions entirely past retention are detached and
+    dropped, what's left over is deleted row by row.
+    """
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    dropped = []
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for name in _partitions(cursor):
+                month = _partition_month(name)
+                if month is not None and _bound(_next_month(month)) <= cutoff:
+                    with transaction.atomic():
+                        cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+                        cursor.execute(f'DROP TABLE "{name}"')
+                    dropped.append(name)
+    deleted, _ = AuditEvent.objects.filter(created_at__lt=cutoff).delete()
+    return {'dropped': dropped, 'deleted': deleted}
@@ -0,0 +1,437 @@
+"""
+Take-profit, stop-loss and trailing-stop exits evaluated on every price tick.
+
+The exit levels of a position are set from the take_profit_pct, stop_loss_pct
+and trailing_stop_pct settings when it opens, and can be edited in the admin.
+The run_exits command keeps them in a TriggerBook fed by the ticks of the
+price caches. A fired exit sells through the same close path as a SELL alert,
+below the average buy price included.
+
+Per ticker, the book keeps:
+
+- take-profits in a min-heap, fired while the lowest is at or below the price;
+- stop-losses in a max-heap, fired while the highest is at or above the price;
+- trailing stops in groups sharing the highest price seen since they were
+  added, heaped by that high and by the stop of their tightest trail. A new
+  high merges the groups below it into the largest one, so a rising market
+  costs one heap operation per tick rather than one per position.
+
+Entries are removed lazily: they carry the version of their position's levels
+and are skipped once it changed, closed or fired. A tick costs O(log n + fired)
+amortized, the book is compacted when stale entries outnumber the live ones.
+
+The high of a trailing stop lives in memory only, kept when the levels of the
+position are edited. After a restart it starts over from the average buy price.
+"""
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from heapq import heapify, heappop, heappush
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.db.models import Q
+from django.utils import timezone
+
+from metrics import EXITS
+from price_cache import get_price_cache
+from webhooks.locks import PositionLockTimeout, position_lock
+from webhooks.models import Position
+from webhooks.settings_cache import trading_settings
+from webhooks.trading import Result, _account_client, _lock_timeout, close_position, notifier
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two reads of the positions changed in the meantime
+EXIT_SYNC_INTERVAL = float(os.getenv('EXIT_SYNC_INTERVAL', '5'))
+
+# Positions updated this long before the last sync are read again, a transaction may commit late
+SYNC_OVERLAP = timedelta(seconds=30)
+
+TAKE_PROFIT = 'take_profit'
+STOP_LOSS = 'stop_loss'
+TRAILING_STOP = 'trailing_stop'
+
+_HAS_EXITS = Q(take_profit__isnull=False) | Q(stop_loss__isnull=False) | Q(trailing_stop__isnull=False)
+
+
+class Exit:
+    """
+    Exit level a tick reached.
+    """
+    __slots__ = ('position_id', 'ticker', 'reason', 'level', 'price')
+
+    def __init__(self, position_id: int, ticker: str, reason: str, level: Decimal, price: Decimal):
+        self.position_id = position_id
+        self.ticker = ticker
+        self.reason = reason
+        self.level = level
+        self.price = price
+
+    def __str__(self):
+        return f'{self.reason} of {self.ticker} at {self.level.normalize():f} (price {self.price.normalize():f})'
+
+
+class _Group:
+    """Trailing stops sharing the highest price seen since they were added"""
+    __slots__ = ('high', 'entries', 'version', 'dead', 'parent')
+
+    def __init__(self, high: Decimal):
+        self.high = high
+        # (trail, position id, version), the tightest trail first
+        self.entries: List[Tuple[Decimal, int, int]] = []
+        self.version = 0
+        self.dead = False
+        # Group the entries were merged into
+        self.parent: Optional['_Group'] = None
+
+
+class _Ticker:
+    """Exit levels of the positions of one ticker"""
+    __slots__ = ('take_profits', 'stop_losses', 'groups', 'highs', 'stops', 'live')
+
+    def __init__(self):
+        # (level, position id, version)
+        self.take_profits: List[Tuple[Decimal, int, int]] = []
+        # (-level, position id, version)
+        self.stop_losses: List[Tuple[Decimal, int, int]] = []
+        # Current high of every live group
+        self.groups: Dict[Decimal, _Group] = {}
+        # (high, sequence, group), skipped once the group moved to another high
+        self.highs: List[Tuple[Decimal, int, _Group]] = []
+        # (-stop, sequence, group, group version)
+        self.stops: List[Tuple[Decimal, int, _Group, int]] = []
+        self.live = 0
+
+    def size(self) -> int:
+        return (len(self.take_profits) + len(self.stop_losses)
+                + sum(len(group.entries) for group in self.groups.values()))
+
+
+class TriggerBook:
+    """
+    Exit levels of long positions, indexed per ticker so that a tick only visits the levels it reaches.
+    """
+
+    def __init__(self):
+        self._tickers: Dict[str, _Ticker] = {}
+        # Position id to its ticker, the version of its entries and how many there are
+        self._positions: Dict[int, Tuple[str, int, int]] = {}
+        # Group a trailing stop was added to, followed through merges by high_of
+        self._trailing: Dict[int, _Group] = {}
+        self._versions = itertools.count(1)
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, position_id: int):
+        return position_id in self._positions
+
+    def tickers(self) -> Set[str]:
+        return {ticker for ticker, _, _ in self._positions.values()}
+
+    def high_of(self, position_id: int) -> Optional[Decimal]:
+        """Highest price the trailing stop of a position has seen, None without one"""
+        group = self._trailing.get(position_id)
+        if group is None:
+            return None
+        while group.parent is not None:
+            group = group.parent
+        self._trailing[position_id] = group
+        return group.high
+
+    def add(self, position_id: int, ticker: str, avg_buy_price: Decimal, take_profit: Decimal = None,
+            stop_loss: Decimal = None, trailing_stop: Decimal = None, high: Decimal = None):
+        """
+        Watch the exit levels of a position, replacing those it had.
+
+        Args:
+            position_id: Position the levels belong to
+            ticker: Symbol whose ticks are checked against them
+            avg_buy_price: Price a trailing stop starts trailing from
+            take_profit: Sell once the price is at or above this level
+            stop_loss: Sell once the price is at or below this level
+            trailing_stop: Sell once the price fell this fraction below its highest, e.g. 0.05
+            high: Highest price seen already, e.g. by the trailing stop this one replaces
+        """
+        self.discard(position_id)
+        if trailing_stop is not None and trailing_stop <= 0:
+            trailing_stop = None
+        levels = [level for level in (take_profit, stop_loss, trailing_stop) if level is not None]
+        if not levels:
+            return
+        version = next(self._versions)
+        self._positions[position_id] = (ticker, version, len(levels))
+        book = self._tickers.get(ticker)
+        if book is None:
+            book = self._tickers[ticker] = _Ticker()
+        book.live += len(levels)
+        if take_profit is not None:
+            heappush(book.take_profits, (take_profit, position_id, version))
+        if stop_loss is not None:
+            heappush(book.stop_losses, (-stop_loss, position_id, version))
+        if trailing_stop is not None:
+            high = max(high, avg_buy_price) if high is not None else avg_buy_price
+            group = book.groups.get(high)
+            if group is None:
+                group = book.groups[high] = _Group(high)
+                heappush(book.highs, (high, next(self._sequence), group))
+            heappush(group.entries, (trailing_stop, position_id, version))
+            self._trailing[position_id] = group
+            self._push_stop(book, group)
+
+    def discard(self, position_id: int):
+        """Stop watching a position, its entries are dropped when reached"""
+        entry = self._positions.pop(position_id, None)
+        self._trailing.pop(position_id, None)
+        if entry is not None:
+            ticker, _, count = entry
+            self._tickers[ticker].live -= count
+
+    def on_price(self, ticker: str, price: Decimal) -> List[Exit]:
+        """Fire the exits a tick reached, each position fires at most once and is no longer watched after"""
+        book = self._tickers.get(ticker)
+        if book is None:
+            return []
+        fired = []
+        while book.take_profits and book.take_profits[0][0] <= price:
+            level, position_id, version = heappop(book.take_profits)
+            if self._live(position_id, version):
+                fired.append(self._fire(position_id, ticker, TAKE_PROFIT, level, price))
+        while book.stop_losses and -book.stop_losses[0][0] >= price:
+            level, position_id, version = heappop(book.stop_losses)
+            if self._live(position_id, version):
+                fired.append(self._fire(position_id, ticker, STOP_LOSS, -level, price))
+        self._raise(book, price)
+        while book.stops and -book.stops[0][0] >= price:
+            _, _, group, version = heappop(book.stops)
+            if group.dead or version != group.version:
+                continue
+            while group.entries:
+                trail, position_id, version = group.entries[0]
+                if not self._live(position_id, version):
+                    heappop(group.entries)
+                    continue
+                level = group.high * (1 - trail)
+                if level < price:
+                    break
+                heappop(group.entries)
+                fired.append(self._fire(position_id, ticker, TRAILING_STOP, level, price))
+            self._push_stop(book, group)
+        return fired
+
+    def compact(self):
+        """Rebuild the heaps of the tickers where stale entries outnumber the live ones"""
+        for ticker, book in list(self._tickers.items()):
+            if not book.live:
+                del self._tickers[ticker]
+                continue
+            if book.size() <= 2 * book.live + 32:
+                continue
+            book.take_profits = [entry for entry in book.take_profits if self._live(entry[1], entry[2])]
+            book.stop_losses = [entry for entry in book.stop_losses if self._live(entry[1], entry[2])]
+            heapify(book.take_profits)
+            heapify(book.stop_losses)
+            groups = list(book.groups.values())
+            book.groups, book.highs, book.stops = {}, [], []
+            for group in groups:
+                group.entries = [entry for entry in group.entries if self._live(entry[1], entry[2])]
+                heapify(group.entries)
+                if group.entries:
+                    book.groups[group.high] = group
+                    heappush(book.highs, (group.high, next(self._sequence), group))
+                self._push_stop(book, group)
+
+    def _live(self, position_id: int, version: int) -> bool:
+        entry = self._positions.get(position_id)
+        return entry is not None and entry[1] == version
+
+    def _fire(self, position_id: int, ticker: str, reason: str, level: Decimal, price: Decimal) -> Exit:
+        self.discard(position_id)
+        return Exit(position_id, ticker, reason, level, price)
+
+    def _push_stop(self, book: _Ticker, group: _Group):
+        """Queue the group at the stop of its tightest live trail, or retire it once empty"""
+        while group.entries and not self._live(group.entries[0][1], group.entries[0][2]):
+            heappop(group.entries)
+        group.version += 1
+        if not group.entries:
+            group.dead = True
+            if book.groups.get(group.high) is group:
+                del book.groups[group.high]
+            return
+        stop = group.high * (1 - group.entries[0][0])
+        heappush(book.stops, (-stop, next(self._sequence), group, group.version))
+
+    def _raise(self, book: _Ticker, price: Decimal):
+        """Move the groups below a new high to it, merged into the largest of them"""
+        merged = []
+        while book.highs and book.highs[0][0] < price:
+            high, _, group = heappop(book.highs)
+            if group.dead or high != group.high:
+                continue
+            book.groups.pop(high, None)
+            merged.append(group)
+        if not merged:
+            return
+        current = book.groups.pop(price, None)
+        if current is not None:
+            merged.append(current)
+        target = max(merged, key=lambda group: len(group.entries))
+        for group in merged:
+            if group is target:
+                continue
+            group.dead = True
+            group.parent = target
+            for entry in group.entries:
+                if self._live(entry[1], entry[2]):
+                    heappush(target.entries, entry)
+        book.groups[price] = target
+        if target.high != price:
+            target.high = price
+            heappush(book.highs, (price, next(self._sequence), target))
+        self._push_stop(book, target)
+
+
+def close_exit(exit: Exit) -> Result:
+    """
+    Sell the position of a fired exit, like a SELL alert but below the average buy price too.
+    """
+    with_account = Position.objects.select_related('account')
+    position = with_account.filter(pk=exit.position_id, closed_at__isnull=True).first()
+    if position is None:
+        logger.warning(f"Position of {exit} is no longer open")
+        return {'status': 'Position does not exist'}, 400
+    if not trading_settings.trading_enabled:
+        logger.warning(f"Trading is not enabled, not closing on {exit}")
+        return {'status': 'Trading is not enabled'}, 400
+
+    account, ticker, time_frame = position.account, position.ticker, position.timeframe
+    client = _account_client(account, position.demo)
+    try:
+        with position_lock(account, ticker, time_frame):
+            # An alert may have closed it and opened another one since the tick
+            if not Position.objects.filter(pk=position.pk, closed_at__isnull=True).exists():
+                return {'status': 'Position does not exist'}, 400
+            result = close_position(client, ticker, time_frame, account, below_buy=True)
+    except PositionLockTimeout:
+        return _lock_timeout(ticker, time_frame)
+    if result[1] == 200:
+        logger.info(f"Closed {position} on {exit}")
+        notifier.enqueue(f"Closed {ticker} {time_frame} on {exit}")
+    return result
+
+
+class ExitEngine:
+    """
+    Keeps a TriggerBook per endpoint in sync with the open positions and closes those whose exits fire.
+
+    Ticks may arrive on any thread, the exits they fire are queued and closed by run_fired.
+    """
+
+    def __init__(self, sync_interval: float = EXIT_SYNC_INTERVAL):
+        """
+        Initialize the exit engine.
+
+        Args:
+            sync_interval: Seconds between two reads of the changed positions
+        """
+        self.sync_interval = sync_interval
+        self.books: Dict[bool, TriggerBook] = {False: TriggerBook(), True: TriggerBook()}
+        self._fired: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._synced = float('-inf')
+        # Positions whose exit failed, watched again from the next sync
+        self._retry: Set[int] = set()
+        # Positions whose exit fired and isn't closed yet, not watched again meanwhile
+        self._pending: Set[int] = set()
+        # Levels each watched position was added with
+        self._levels: Dict[int, Tuple] = {}
+        self._subscribed: Set[bool] = set()
+
+    def watch(self, position: Position):
+        """Add a position to its book or update it when its levels changed, remove it once closed"""
+        book = self.books[position.demo]
+        if position.closed_at is None and position.has_exits():
+            levels = (position.ticker, position.avg_buy_price, position.take_profit, position.stop_loss,
+                      position.trailing_stop)
+            if position.pk in self._pending or (self._levels.get(position.pk) == levels and position.pk in book):
+                return
+            self._levels[position.pk] = levels
+            # The trailing stop keeps the high it reached
+            book.add(position.pk, *levels, high=book.high_of(position.pk))
+        else:
+            self._levels.pop(position.pk, None)
+            book.discard(position.pk)
+
+    def sync(self):
+        """Read the positions changed since the last sync, every open one with exits the first time"""
+        started = timezone.now()
+        if self._synced_at is None:
+            positions = Position.objects.filter(_HAS_EXITS, closed_at__isnull=True)
+        else:
+            positions = Position.objects.filter(
+                Q(updated_at__gte=self._synced_at - SYNC_OVERLAP) | Q(pk__in=self._retry)
+            )
+        self._retry = set()
+        positions = positions.only('ticker', 'avg_buy_price', 'demo', 'take_profit', 'stop_loss', 'trailing_stop',
+                                   'closed_at')
+        with self._lock:
+            for position in positions.iterator():
+                self.watch(position)
+            for book in self.books.values():
+                book.compact()
+            tickers = {demo: book.tickers() for demo, book in self.books.items()}
+        self._synced_at = started
+        self._synced = time.monotonic()
+
+        for demo, symbols in tickers.items():
+            if not symbols:
+                continue
+            cache = get_price_cache(demo)
+            if demo not in self._subscribed:
+                cache.subscribe(lambda symbol, price, demo=demo: self.on_tick(demo, symbol, price))
+                self._subscribed.add(demo)
+            cache.track(*symbols)
+
+    def on_tick(self, demo: bool, symbol: str, price: Decimal):
+        with self._lock:
+            fired = self.books[demo].on_price(symbol, price)
+            self._pending.update(exit.position_id for exit in fired)
+        for exit in fired:
+            self._fired.put(exit)
+
+    def run_fired(self) -> List[Tuple[Exit, Result]]:
+        """Close the positions of the exits fired so far"""
+        results = []
+        while True:
+            try:
+                exit = self._fired.get_nowait()
+            except queue.Empty:
+                return results
+            try:
+                result = close_exit(exit)
+            except Exception as e:
+                logger.exception(f"Failed to close on {exit}")
+                result = {'status': 'error', 'error': str(e)}, 500
+            EXITS.labels(exit.reason, 'closed' if result[1] == 200 else 'failed').inc()
+            with self._lock:
+                self._pending.discard(exit.position_id)
+            if result[1] != 200:
+                self._retry.add(exit.position_id)
+            results.append((exit, result))
+
+    def run_once(self) -> List[Tuple[Exit, Result]]:
+        """Sync when due, poll the prices of the watched tickers and close what fired"""
+        if time.monotonic() - self._synced >= self.sync_interval:
+            self.sync()
+        for demo, book in self.books.items():
+            if len(book):
+                get_price_cache(demo).poll()
+        return self.run_fired()
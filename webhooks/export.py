@@ -0,0 +1,219 @@
+"""
+Streaming export of the position history as CSV or Parquet.
+
+Rows are read with a server-side cursor, EXPORT_CHUNK_SIZE at a time, and
+each chunk is encoded and sent before the next one is fetched, so memory
+stays flat however many positions are exported. Profit and profit rate are
+computed by the database, like in the admin.
+
+Parquet needs pyarrow, imported only when a Parquet export is requested.
+"""
+import csv
+import io
+import os
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Context, Decimal
+from typing import Any, Iterator, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from webhooks.models import Position
+
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Exported column, then the queryset field it's read from
+COLUMNS = [
+    ('id', 'id'),
+    ('account', 'account__name'),
+    ('ticker', 'ticker'),
+    ('timeframe', 'timeframe'),
+    ('quantity', 'quantity'),
+    ('quantity_usdt', 'quantity_usdt'),
+    ('avg_buy_price', 'avg_buy_price'),
+    ('avg_sell_price', 'avg_sell_price'),
+    ('profit', 'pnl'),
+    ('profit_rate', 'pnl_rate'),
+    ('created_at', 'created_at'),
+    ('closed_at', 'closed_at'),
+]
+
+# Decimal columns are written to Parquet with the scale of the model fields
+PRECISION = 38
+DECIMAL_PLACES = 20
+SCALE = Decimal(1).scaleb(-DECIMAL_PLACES)
+_CONTEXT = Context(prec=PRECISION)
+
+
+def filter_positions(queryset=None, start: date = None, end: date = None, ticker: str = None,
+                     timeframe: str = None):
+    """
+    Positions opened between two UTC days included, oldest first, annotated with their profit.
+
+    Args:
+        queryset: Positions to filter, all of them by default
+        start: First day, no lower bound when None
+        end: Last day, no upper bound when None
+        ticker: Only this ticker
+        timeframe: Only this timeframe
+    """
+    queryset = Position.objects.all() if queryset is None else queryset
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=datetime.combine(start, time(), tzinfo=dt_timezone.utc))
+    if end is not None:
+        queryset = queryset.filter(
+            created_at__lt=datetime.combine(end + timedelta(days=1), time(), tzinfo=dt_timezone.utc)
+        )
+    if ticker:
+        queryset = queryset.filter(ticker=ticker)
+    if timeframe:
+        queryset = queryset.filter(timeframe=timeframe)
+    return queryset.with_pnl().order_by('created_at', 'id')
+
+
+def _chunks(queryset, chunk_size: int) -> Iterator[List[Tuple[Any, ...]]]:
+    """Rows of the positions in lists of chunk_size, read through a server-side cursor"""
+    chunk = []
+    rows = queryset.values_list(*(field for _, field in COLUMNS)).iterator(chunk_size=chunk_size)
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _text(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, Decimal):
+        return f'{value.normalize():f}'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_chunks(queryset, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Encode the positions as CSV, one piece per chunk of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in COLUMNS])
+    for chunk in _chunks(queryset, chunk_size):
+        writer.writerows([_text(value) for value in row] for row in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # Only the header when there's nothing to export
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file handing out what was written since the last take, and keeping the offset Parquet needs"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _parquet_schema():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("Exporting Parquet needs pyarrow, pip install pyarrow")
+    money = pa.decimal128(PRECISION, DECIMAL_PLACES)
+    moment = pa.timestamp('us', tz='UTC')
+    types = {
+        'id': pa.int64(), 'account': pa.string(), 'ticker': pa.string(), 'timeframe': pa.string(),
+        'created_at': moment, 'closed_at': moment,
+    }
+    return pa.schema([(name, types.get(name, money)) for name, _ in COLUMNS])
+
+
+def _scaled(value: Optional[Decimal]) -> Optional[Decimal]:
+    if value is None:
+        return None
+    return Decimal(value).quantize(SCALE, context=_CONTEXT)
+
+
+def parquet_chunks(queryset, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Encode the positions as Parquet, one row group per chunk of rows"""
+    schema = _parquet_schema()
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    decimals = {index for index, field in enumerate(schema) if pa.types.is_decimal(field.type)}
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in _chunks(queryset, chunk_size):
+            columns = [
+                [_scaled(value) for value in column] if index in decimals else list(column)
+                for index, column in enumerate(zip(*chunk))
+            ]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+async def _aiterate(chunks: Iterator[bytes]):
+    """
+    Serve a sync generator chunk by chunk under ASGI.
+
+    Django 4.2 reads a sync iterator into a list before sending it
+    asynchronously, which would hold the whole export in memory.
+    """
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Release the server-side cursor when the client went away mid-export
+        await sync_to_async(chunks.close)()
+
+
+def stream_positions(request, queryset, fmt: str) -> StreamingHttpResponse:
+    """
+    Stream positions as an attachment.
+
+    Args:
+        request: Request being answered, the response streams asynchronously under ASGI
+        queryset: Positions as returned by filter_positions
+        fmt: csv or parquet
+    """
+    encode = parquet_chunks if fmt == 'parquet' else csv_chunks
+    if fmt == 'parquet':
+        # Fail before the response starts rather than mid-stream
+        _parquet_schema()
+    chunks = encode(queryset, EXPORT_CHUNK_SIZE)
+    if isinstance(request, ASGIRequest):
+        chunks = _aiterate(chunks)
+    response = StreamingHttpResponse(chunks, content_type=FORMATS[fmt])
+    filename = f'positions-{timezone.now():%Y%m%d-%H%M%S}.{fmt}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
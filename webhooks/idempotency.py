@@ -0,0 +1,173 @@
+"""
+Duplicate alert suppression.
+
+Alerts are keyed on their optional ``alert_id`` or on a hash of the normalized
+signal and the time of the bar it fired on, so the same signal on the next bar
+isn't mistaken for a duplicate. The first copy seen within the dedupe window
+claims the key in the AlertReceipt table and runs; later copies get the stored
+result back without reaching the exchange. Finished results are also kept in a
+bounded in-memory LRU so repeated duplicates don't hit the database either.
+
+Only successful results are stored, an alert that failed releases its key so
+TradingView's retry or the next copy runs again.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Awaitable, Callable, Optional
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from webhooks.models import AlertReceipt
+from webhooks.trading import Result
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = ({'status': 'Duplicate alert is still being processed'}, 409)
+
+# Receipts older than this many windows are purged every PURGE_EVERY claims
+PURGE_AFTER_WINDOWS = 10
+PURGE_EVERY = 1000
+
+
+def alert_key(ticker: str, side: str, time_frame: str, use_demo: bool = False, alert_id: str = None,
+              bar_time: str = None) -> str:
+    """Idempotency key of an alert"""
+    if alert_id:
+        normalized = f"id|{alert_id}"
+    else:
+        normalized = f"signal|{ticker.upper()}|{side.upper()}|{time_frame}|{bool(use_demo)}|{bar_time or ''}"
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def succeeded(result: Result) -> bool:
+    """Whether a result is worth answering duplicates with, 207 is a signal that failed on some accounts"""
+    _, status = result
+    return 200 <= status < 300 and status != 207
+
+
+class AlertDeduplicator:
+    """
+    Runs each alert at most once per dedupe window, across workers.
+    """
+
+    def __init__(self, window: float = None, max_entries: int = 1024):
+        """
+        Initialize the deduplicator.
+
+        Args:
+            window: Seconds during which a repeated alert is considered a duplicate
+            max_entries: Results kept in the in-memory LRU
+        """
+        if window is None:
+            window = float(os.getenv('WEBHOOK_DEDUPE_WINDOW', '30'))
+        self.window = timedelta(seconds=window)
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._claims = 0
+
+    def _cached(self, key: str) -> Optional[Result]:
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            received_at, result = entry
+            if timezone.now() - received_at > self.window:
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            return result
+
+    def _remember(self, key: str, received_at, result: Result):
+        with self._lock:
+            self._results[key] = (received_at, result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def begin(self, key: str) -> Optional[Result]:
+        """
+        Claim the key for this alert.
+
+        Returns None when the alert must run, or the result to answer a duplicate with.
+        """
+        result = self._cached(key)
+        if result is not None:
+            logger.info(f"Duplicate alert {key[:12]} answered from memory")
+            return result
+
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                AlertReceipt.objects.create(key=key, received_at=now)
+        except IntegrityError:
+            receipt = AlertReceipt.objects.filter(key=key).first()
+            if receipt is None:
+                # Released by the failed original in the meantime, claim it again
+                return self.begin(key)
+            if now - receipt.received_at > self.window:
+                # The previous alert is outside the window, take the key over unless another worker just did
+                reclaimed = AlertReceipt.objects.filter(pk=receipt.pk, received_at=receipt.received_at).update(
+                    received_at=now, response=None, status=None
+                )
+                if reclaimed:
+                    return None
+                receipt.refresh_from_db()
+            if receipt.response is None:
+                logger.info(f"Duplicate alert {key[:12]} is still in progress")
+                return IN_PROGRESS
+            result = (receipt.response, receipt.status)
+            self._remember(key, receipt.received_at, result)
+            logger.info(f"Duplicate alert {key[:12]} answered with the original result")
+            return result
+
+        self._claims += 1
+        if self._claims % PURGE_EVERY == 0:
+            AlertReceipt.objects.filter(received_at__lt=now - self.window * PURGE_AFTER_WINDOWS).delete()
+        return None
+
+    def finish(self, key: str, result: Result):
+        """Store the result of a claimed alert for its duplicates, or release the key when it failed"""
+        if not succeeded(result):
+            self.abandon(key)
+            return
+        payload, status = result
+        AlertReceipt.objects.filter(key=key).update(response=payload, status=status)
+        self._remember(key, timezone.now(), result)
+
+    def abandon(self, key: str):
+        """Release the key of an alert that failed, so it can be sent again"""
+        AlertReceipt.objects.filter(key=key, response__isnull=True).delete()
+
+    def run(self, key: str, func: Callable[[], Result]) -> Result:
+        result = self.begin(key)
+        if result is not None:
+            return result
+        try:
+            result = func()
+        except Exception:
+            self.abandon(key)
+            raise
+        self.finish(key, result)
+        return result
+
+    async def arun(self, key: str, func: Callable[[], Awaitable[Result]]) -> Result:
+        result = await sync_to_async(self.begin)(key)
+        if result is not None:
+            return result
+        try:
+            result = await func()
+        except Exception:
+            await sync_to_async(self.abandon)(key)
+            raise
+        await sync_to_async(self.finish)(key, result)
+        return result
+
+
+deduplicator = AlertDeduplicator()
@@ -0,0 +1,100 @@
+"""
+Durable queue of webhook alerts.
+
+The queued endpoint only validates and stores alerts so TradingView gets its
+answer in milliseconds; the process_webhooks command claims them with
+SELECT ... FOR UPDATE SKIP LOCKED and runs the usual BUY/SELL logic.
+On SIGTERM the workers finish the job they're running and exit, jobs left
+running by a worker that died are failed once their lease expires.
+"""
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from webhooks.models import WebhookJob
+from webhooks.payload import Signal
+from webhooks.trading import dispatch_signal
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(body: bytes, signal: Signal) -> WebhookJob:
+    return WebhookJob.objects.create(
+        body=body.decode('utf-8'),
+        signal={'ticker': signal.ticker, 'side': signal.side, 'timeframe': signal.timeframe,
+                'use_demo': signal.use_demo},
+    )
+
+
+def expire_stale_jobs(lease: float) -> int:
+    """
+    Fail jobs whose worker died while running them.
+
+    They are not retried, the order may already have reached the exchange.
+    """
+    cutoff = timezone.now() - timedelta(seconds=lease)
+    expired = WebhookJob.objects.filter(status=WebhookJob.RUNNING, claimed_at__lt=cutoff).update(
+        status=WebhookJob.FAILED,
+        result={'status': 'Worker lost while running the job'},
+        finished_at=timezone.now(),
+    )
+    if expired:
+        logger.error(f"Marked {expired} stale webhook jobs as failed")
+    return expired
+
+
+def claim_job() -> Optional[WebhookJob]:
+    """Claim the oldest pending job, skipping rows locked by other workers"""
+    with transaction.atomic():
+        job = (
+            WebhookJob.objects.select_for_update(skip_locked=True)
+            .filter(status=WebhookJob.PENDING)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = WebhookJob.RUNNING
+        job.claimed_at = timezone.now()
+        job.save(update_fields=['status', 'claimed_at'])
+    return job
+
+
+def run_job(job: WebhookJob):
+    signal = job.signal
+    try:
+        payload, status = dispatch_signal(signal['ticker'], signal['side'], signal['timeframe'],
+                                          signal.get('use_demo', False))
+    except Exception as e:
+        logger.exception(f"Webhook job {job.pk} failed")
+        job.status = WebhookJob.FAILED
+        job.result = {'status': 'error', 'error': str(e)}
+    else:
+        job.status = WebhookJob.DONE
+        job.result = payload
+        job.result_status = status
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'result_status', 'finished_at'])
+
+
+def process_next_job() -> bool:
+    """Claim and run one job, returns False when the queue is empty"""
+    job = claim_job()
+    if job is None:
+        return False
+    try:
+        run_job(job)
+    except Exception:
+        # The result couldn't be saved, most likely on a dropped connection. Fail the job on a
+        # new one rather than leave it running until its lease expires
+        connection.close()
+        WebhookJob.objects.filter(pk=job.pk, status=WebhookJob.RUNNING).update(
+            status=WebhookJob.FAILED,
+            result={'status': 'Result of the job could not be recorded'},
+            finished_at=timezone.now(),
+        )
+        raise
+    return True
@@ -0,0 +1,118 @@
+"""
+Per-position locks serializing alerts for the same account, ticker and timeframe.
+
+The check for an open position, the order and the Position write must not
+interleave with another alert for the same position, or two workers could both
+buy. On Postgres the lock is a session-level advisory lock, so it works across
+processes and hosts without holding a transaction open during the exchange
+round trip. Other databases fall back to an in-process lock. Alerts for other
+positions never wait.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from typing import Iterable, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+
+# Seconds an alert waits for the lock of its position before giving up
+POSITION_LOCK_TIMEOUT = float(os.getenv('POSITION_LOCK_TIMEOUT', '30'))
+
+# Polling backoff while waiting, in seconds
+MIN_WAIT = 0.005
+MAX_WAIT = 0.1
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+class PositionLockTimeout(Exception):
+    """Another alert held the position's lock for longer than the timeout"""
+
+
+def lock_key(account, ticker: str, time_frame: str) -> int:
+    """Signed 64-bit advisory lock key of a position"""
+    account_id = account.pk if account is not None else 0
+    digest = hashlib.blake2b(f"position|{account_id}|{ticker}|{time_frame}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _local_lock(key: int) -> threading.Lock:
+    with _local_locks_guard:
+        return _local_locks.setdefault(key, threading.Lock())
+
+
+def _try_acquire(key: int) -> bool:
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [key])
+            return cursor.fetchone()[0]
+    return _local_lock(key).acquire(blocking=False)
+
+
+def _release(key: int):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [key])
+    else:
+        _local_lock(key).release()
+
+
+def _backoff(wait: float) -> float:
+    return min(wait * 2, MAX_WAIT)
+
+
+@contextmanager
+def position_lock(account, ticker: str, time_frame: str, timeout: Optional[float] = None):
+    """
+    Hold the lock of a position for the duration of the block.
+
+    Raises PositionLockTimeout when it can't be acquired within the timeout.
+    """
+    key = lock_key(account, ticker, time_frame)
+    deadline = time.monotonic() + (POSITION_LOCK_TIMEOUT if timeout is None else timeout)
+    wait = MIN_WAIT
+    while not _try_acquire(key):
+        if time.monotonic() >= deadline:
+            raise PositionLockTimeout(f"Timed out waiting for the lock of {ticker} {time_frame}")
+        time.sleep(wait)
+        wait = _backoff(wait)
+    try:
+        yield
+    finally:
+        _release(key)
+
+
+@contextmanager
+def position_locks(account, positions: Iterable[Tuple[str, str]], timeout: Optional[float] = None):
+    """Hold the locks of several (ticker, timeframe) positions, taken in a fixed order to avoid deadlocks"""
+    with ExitStack() as stack:
+        for ticker, time_frame in sorted(set(positions)):
+            stack.enter_context(position_lock(account, ticker, time_frame, timeout))
+        yield
+
+
+@asynccontextmanager
+async def aposition_lock(account, ticker: str, time_frame: str, timeout: Optional[float] = None):
+    """
+    Async counterpart of position_lock.
+
+    Waiting happens on the event loop, the lock calls run on the thread that
+    owns the async ORM connection so lock and unlock use the same session.
+    """
+    key = lock_key(account, ticker, time_frame)
+    deadline = time.monotonic() + (POSITION_LOCK_TIMEOUT if timeout is None else timeout)
+    wait = MIN_WAIT
+    while not await sync_to_async(_try_acquire)(key):
+        if time.monotonic() >= deadline:
+            raise PositionLockTimeout(f"Timed out waiting for the lock of {ticker} {time_frame}")
+        await asyncio.sleep(wait)
+        wait = _backoff(wait)
+    try:
+        yield
+    finally:
+        await sync_to_async(_release)(key)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from webhooks.audit import AUDIT_RETENTION_DAYS, create_partitions, drop_expired
+
+
+class Command(BaseCommand):
+    help = "Create the coming monthly partitions of the audit log and remove events past retention, run daily"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=2,
+                            help='Months after the current one to create partitions for')
+        parser.add_argument('--retention-days', type=int, default=AUDIT_RETENTION_DAYS,
+                            help='Days of events to keep, 0 keeps everything')
+
+    def handle(self, *args, **options):
+        created = create_partitions(options['months_ahead'])
+        self.stdout.write(f"Created {len(created)} audit partitions{': ' + ', '.join(created) if created else ''}")
+        if options['retention_days']:
+            expired = drop_expired(options['retention_days'])
+            self.stdout.write(f"Dropped {len(expired['dropped'])} audit partitions, deleted {expired['deleted']} events")
@@ -0,0 +1,70 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backtest import CandleStore, Signals, sweep
+from webhooks.settings_cache import trading_settings
+
+
+def _numbers(kind):
+    def parse(value):
+        try:
+            return [kind(item) for item in value.split(',') if item]
+        except ValueError:
+            raise CommandError(f"Invalid list: {value}")
+    return parse
+
+
+class Command(BaseCommand):
+    help = "Backtest the trading rules on historical candles, sweeping strategy parameters"
+
+    def add_arguments(self, parser):
+        parser.add_argument('store', help='Candle store directory, see --import')
+        parser.add_argument('--import', dest='sources', nargs='+', default=[],
+                            help='CSV or Parquet candle files named after their ticker (BTC-USDT.csv) to add to the store')
+        parser.add_argument('--signals', help='CSV of recorded alerts to replay instead of crossover signals')
+        parser.add_argument('--tickers', type=_numbers(str), help='Comma separated tickers, default the whole store')
+        parser.add_argument('--timeframe', default='1m', help='Timeframe of the generated signals')
+        parser.add_argument('--fast', type=_numbers(int), default=[10], help='Fast moving averages to try')
+        parser.add_argument('--slow', type=_numbers(int), default=[50], help='Slow moving averages to try')
+        parser.add_argument('--slippage', type=_numbers(float), default=[0.0], help='Slippages to try, as fractions')
+        parser.add_argument('--fee-rate', type=_numbers(float), default=[0.0], help='Fee rates to try, as fractions')
+        parser.add_argument('--position-usdt', type=float,
+                            help='USDT per position, default the position_usdt setting')
+        parser.add_argument('--sell-below-buy', action='store_true',
+                            help='Let SELLs close positions below the average buy price')
+        parser.add_argument('--workers', type=int, help='Processes to use, default one per core')
+        parser.add_argument('--top', type=int, default=10, help='Combinations to print')
+
+    def handle(self, *args, **options):
+        if options['sources']:
+            sources = {Path(path).stem: path for path in options['sources']}
+            CandleStore.build(options['store'], sources)
+            self.stdout.write(f"Imported {', '.join(sources)}")
+        store = CandleStore(options['store'])
+        if not store.directory.is_dir():
+            raise CommandError(f"No candle store at {options['store']}")
+
+        position_usdt = options['position_usdt']
+        if position_usdt is None:
+            position_usdt = float(trading_settings.position_usdt)
+        grid = {'slippage': options['slippage'], 'fee_rate': options['fee_rate']}
+        signals = None
+        if options['signals']:
+            signals = Signals.from_csv(options['signals'])
+        else:
+            grid.update(fast=options['fast'], slow=options['slow'])
+
+        results = sweep(store, grid, signals=signals, tickers=options['tickers'], timeframe=options['timeframe'],
+                        workers=options['workers'], position_usdt=position_usdt,
+                        sell_below_buy=options['sell_below_buy'])
+
+        self.stdout.write(f"{len(results)} combinations, {position_usdt} USDT per position")
+        for params, summary in results[:options['top']]:
+            described = ' '.join(f"{name}={value}" for name, value in params.items())
+            win_rate = f"{summary['win_rate']:.1f}%" if summary['win_rate'] is not None else '-'
+            self.stdout.write(
+                f"{described}: {summary['closed']}/{summary['positions']} closed, win rate {win_rate}, "
+                f"P&L {summary['total_pnl']:.2f}, unrealized {summary['unrealized_pnl']:.2f}, "
+                f"fees {summary['fees']:.2f}, max drawdown {summary['max_drawdown']:.2f}"
+            )
@@ -0,0 +1,83 @@
+import logging
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from webhooks.jobs import expire_stale_jobs, process_next_job
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Run a pool of workers executing alerts accepted by the queued webhook endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of worker threads')
+        parser.add_argument('--poll-interval', type=float, default=0.2,
+                            help='Seconds an idle worker waits before polling the queue again')
+        parser.add_argument('--lease', type=float, default=300,
+                            help='Seconds after which a running job is considered lost')
+        parser.add_argument('--sweep-interval', type=float, default=30,
+                            help='Seconds between two sweeps of the jobs left running by a lost worker')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        expire_stale_jobs(options['lease'])
+
+        workers = [
+            threading.Thread(target=self.work, args=(options['poll_interval'], options['once']),
+                             name=f'webhook-worker-{i}')
+            for i in range(options['workers'])
+        ]
+        # Workers finish the job they're running before exiting, its order may be on its way
+        previous = {}
+        if threading.current_thread() is threading.main_thread():
+            previous = {signum: signal.signal(signum, self.shutdown) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for worker in workers:
+                worker.start()
+            self.stdout.write(f"Started {len(workers)} webhook workers")
+
+            while any(worker.is_alive() for worker in workers):
+                deadline = time.monotonic() + options['sweep_interval']
+                for worker in workers:
+                    worker.join(timeout=max(deadline - time.monotonic(), 0))
+                if not options['once'] and not self.stop.is_set():
+                    try:
+                        expire_stale_jobs(options['lease'])
+                    except Exception:
+                        logger.exception("Failed to expire stale webhook jobs")
+                        connection.close()
+        finally:
+            self.stop.set()
+            for worker in workers:
+                if worker.is_alive():
+                    worker.join()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            connection.close()
+
+    def shutdown(self, signum, frame):
+        if not self.stop.is_set():
+            self.stdout.write(f"Stopping webhook workers on {signal.Signals(signum).name}")
+        self.stop.set()
+
+    def work(self, poll_interval, once):
+        try:
+            while not self.stop.is_set():
+                try:
+                    processed = process_next_job()
+                except Exception:
+                    logger.exception("Webhook worker failed to run a job")
+                    connection.close()
+                    processed = False
+                if not processed:
+                    if once:
+                        return
+                    self.stop.wait(poll_interval)
+        finally:
+            connection.close()
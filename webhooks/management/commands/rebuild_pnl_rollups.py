@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from webhooks.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily P&L rollups from the closed positions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date on (YYYY-MM-DD), default rebuilds everything')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['since']}")
+        rows = rebuild(since)
+        self.stdout.write(f"Rebuilt {rows} P&L rollup rows")
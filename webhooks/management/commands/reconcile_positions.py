@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from webhooks.reconcile import reconcile_accounts
+
+
+class Command(BaseCommand):
+    help = "Reconcile open positions with BingX, closing those sold on the exchange and flagging other mismatches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--include-demo', action='store_true',
+                            help='Also reconcile the demo endpoint, for deployments trading demo alerts')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report, without closing positions or moving the cursors')
+        parser.add_argument('--lookback-hours', type=float,
+                            help='Read the orders this far back instead of from the stored cursor')
+
+    def handle(self, *args, **options):
+        reports = reconcile_accounts(options['include_demo'], options['dry_run'], options['lookback_hours'])
+        for report in reports:
+            if 'error' in report:
+                self.stderr.write(f"{report['account']}: failed, {report['error']}")
+                continue
+            self.stdout.write(
+                f"{report['account']}: {report['positions']} open positions, {report['orders']} orders read, "
+                f"{len(report['closed'])} closed, {len(report['flagged'])} flagged"
+            )
+            for closed in report['closed']:
+                self.stdout.write(f"  closed {closed}")
+            for flagged in report['flagged']:
+                self.stdout.write(f"  flagged {flagged}")
@@ -0,0 +1,41 @@
+import logging
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from webhooks.exits import EXIT_SYNC_INTERVAL, ExitEngine
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Watch the take-profit, stop-loss and trailing-stop levels of open positions on every price tick "
+            "and close the positions whose levels are reached. Run a single instance.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=1,
+                            help='Seconds between two polls of the prices of the watched tickers')
+        parser.add_argument('--sync-interval', type=float, default=EXIT_SYNC_INTERVAL,
+                            help='Seconds between two reads of the positions changed in the meantime')
+        parser.add_argument('--once', action='store_true', help='Poll once and exit')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        engine = ExitEngine(options['sync_interval'])
+        self.stdout.write("Watching position exits")
+        try:
+            while not self.stop.is_set():
+                try:
+                    for exit, (payload, status) in engine.run_once():
+                        self.stdout.write(f"{exit}: {payload['status']}")
+                except Exception:
+                    logger.exception("Exit engine pass failed")
+                    connection.close()
+                if options['once']:
+                    return
+                self.stop.wait(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping exit engine")
+        finally:
+            connection.close()
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+def remove_duplicate_keys(apps, schema_editor):
+    """Keep the most recent row of each key so the unique constraint can be added"""
+    Settings = apps.get_model("webhooks", "Settings")
+    seen = set()
+    for setting in Settings.objects.order_by("key", "-id"):
+        if setting.key in seen:
+            setting.delete()
+        else:
+            seen.add(setting.key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webhooks", "0004_position_closed_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="settings",
+            name="key",
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+def merge_duplicate_open_positions(apps, schema_editor):
+    """
+    Merge open positions of the same ticker and timeframe into the oldest so the unique constraint can be added.
+
+    Each one was bought on the exchange, the merged position holds their
+    total quantity at their average buy price so the next SELL closes it all.
+    """
+    Position = apps.get_model("webhooks", "Position")
+    duplicates = (
+        Position.objects.filter(closed_at__isnull=True)
+        .values("ticker", "timeframe")
+        .annotate(count=models.Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        positions = list(
+            Position.objects.filter(
+                ticker=duplicate["ticker"], timeframe=duplicate["timeframe"], closed_at__isnull=True
+            ).order_by("created_at", "id")
+        )
+        kept = positions[0]
+        quantity = sum(position.quantity for position in positions)
+        if quantity:
+            kept.avg_buy_price = sum(position.quantity * position.avg_buy_price for position in positions) / quantity
+        kept.quantity = quantity
+        kept.quantity_usdt = sum(position.quantity_usdt for position in positions)
+        kept.save(update_fields=["quantity", "quantity_usdt", "avg_buy_price"])
+        Position.objects.filter(pk__in=[position.pk for position in positions[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webhooks", "0005_settings_key_unique"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_open_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="position",
+            index=models.Index(fields=["-created_at"], name="position_created_at_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="position",
+            index=models.Index(
+                fields=["ticker", "timeframe", "-created_at"],
+                name="position_ticker_tf_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="position",
+            index=models.Index(
+                fields=["timeframe", "-created_at"], name="position_timeframe_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="position",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("closed_at__isnull", True)),
+                fields=("ticker", "timeframe"),
+                name="unique_open_position",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webhooks", "0007_webhookjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AlertReceipt",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("response", models.JSONField(blank=True, null=True)),
+                ("status", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("received_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
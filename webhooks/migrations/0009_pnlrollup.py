@@ -0,0 +1,49 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webhooks", "0008_alertreceipt"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PnlRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ticker", models.CharField(max_length=255)),
+                ("timeframe", models.CharField(max_length=255)),
+                ("day", models.DateField()),
+                (
+                    "realized_pnl",
+                    models.DecimalField(decimal_places=20, default=0, max_digits=30),
+                ),
+                ("trades", models.PositiveIntegerField(default=0)),
+                ("wins", models.PositiveIntegerField(default=0)),
+                (
+                    "volume",
+                    models.DecimalField(decimal_places=20, default=0, max_digits=30),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["day"], name="pnlrollup_day_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="pnlrollup",
+            constraint=models.UniqueConstraint(
+                fields=("ticker", "timeframe", "day"), name="unique_pnl_rollup"
+            ),
+        ),
+    ]
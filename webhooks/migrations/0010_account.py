@@ -0,0 +1,75 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webhooks", "0009_pnlrollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Account",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("api_key", models.CharField(max_length=255)),
+                ("secret_key", models.CharField(max_length=255)),
+                ("demo", models.BooleanField(default=False)),
+                ("enabled", models.BooleanField(default=True)),
+                (
+                    "position_usdt",
+                    models.DecimalField(
+                        blank=True, decimal_places=20, max_digits=30, null=True
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="position",
+            name="account",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="positions",
+                to="webhooks.account",
+            ),
+        ),
+        migrations.RemoveConstraint(
+            model_name="position",
+            name="unique_open_position",
+        ),
+        migrations.AddConstraint(
+            model_name="position",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("account__isnull", True), ("closed_at__isnull", True)
+                ),
+                fields=("ticker", "timeframe"),
+                name="unique_open_position",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="position",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("account__isnull", False), ("closed_at__isnull", True)
+                ),
+                fields=("account", "ticker", "timeframe"),
+                name="unique_open_account_position",
+            ),
+        ),
+    ]
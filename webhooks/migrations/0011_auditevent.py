@@ -0,0 +1,106 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:35
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def partition_by_month(apps, schema_editor):
+    """
+    Recreate the (empty) table partitioned by range of created_at, Postgres only.
+
+    Unique keys of a partitioned table must include the partition key, so the
+    primary key becomes (id, created_at), and ids come from a plain sequence as
+    identity columns aren't supported on partitioned tables before Postgres 17.
+    Rows land in the default partition until audit_partitions creates monthly ones.
+    The indexes aren't created here: CreateModel defers them to the end of the
+    migration, when they're built on the partitioned table.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    AuditEvent = apps.get_model("webhooks", "AuditEvent")
+    table = schema_editor.quote_name(AuditEvent._meta.db_table)
+    sequence = schema_editor.quote_name(f"{AuditEvent._meta.db_table}_id_seq")
+    schema_editor.execute(f"ALTER TABLE {table} RENAME TO unpartitioned_auditevent")
+    schema_editor.execute(
+        f"CREATE TABLE {table} (LIKE unpartitioned_auditevent INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+    )
+    schema_editor.execute("DROP TABLE unpartitioned_auditevent")
+    schema_editor.execute(f"CREATE SEQUENCE {sequence} OWNED BY {table}.id")
+    schema_editor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+    schema_editor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)")
+    schema_editor.execute(
+        f"CREATE TABLE {schema_editor.quote_name(AuditEvent._meta.db_table + '_default')} "
+        f"PARTITION OF {table} DEFAULT"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webhooks", "0010_account"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuditEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("alert", "Alert"),
+                            ("order", "Order"),
+                            ("batch_order", "Batch order"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("source", models.CharField(blank=True, max_length=255)),
+                ("demo", models.BooleanField(default=False)),
+                ("ticker", models.CharField(blank=True, max_length=255)),
+                ("timeframe", models.CharField(blank=True, max_length=255)),
+                ("side", models.CharField(blank=True, max_length=16)),
+                (
+                    "request",
+                    models.JSONField(
+                        blank=True,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                    ),
+                ),
+                (
+                    "response",
+                    models.JSONField(
+                        blank=True,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                    ),
+                ),
+                ("status", models.IntegerField(blank=True, null=True)),
+                ("outcome", models.CharField(max_length=16)),
+                ("duration_ms", models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["created_at"], name="auditevent_created_at_idx"
+                    ),
+                    models.Index(
+                        fields=["ticker", "created_at"], name="auditevent_ticker_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(partition_by_month, migrations.RunPython.noop),
+    ]
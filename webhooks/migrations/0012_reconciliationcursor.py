@@ -0,0 +1,56 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webhooks", "0011_auditevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReconciliationCursor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("demo", models.BooleanField(default=False)),
+                ("order_time", models.BigIntegerField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "account",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="webhooks.account",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="reconciliationcursor",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("account__isnull", True)),
+                fields=("demo",),
+                name="unique_environment_cursor",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="reconciliationcursor",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("account__isnull", False)),
+                fields=("account", "demo"),
+                name="unique_account_cursor",
+            ),
+        ),
+    ]
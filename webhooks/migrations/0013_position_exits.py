@@ -0,0 +1,43 @@
+# Generated by Django 4.2.24 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webhooks", "0012_reconciliationcursor"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="position",
+            name="demo",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="position",
+            name="stop_loss",
+            field=models.DecimalField(
+                blank=True, decimal_places=20, max_digits=30, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="position",
+            name="take_profit",
+            field=models.DecimalField(
+                blank=True, decimal_places=20, max_digits=30, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="position",
+            name="trailing_stop",
+            field=models.DecimalField(
+                blank=True, decimal_places=20, max_digits=30, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="position",
+            index=models.Index(fields=["updated_at"], name="position_updated_at_idx"),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.24 on 2026-10-18 06:48
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncDate
+
+
+def split_rollups_by_account(apps, schema_editor):
+    """
+    Recompute the existing rollups per account and live or demo flag.
+
+    They summed every account's positions, the rows are rebuilt from the
+    closed positions like rebuild_pnl_rollups does.
+    """
+    PnlRollup = apps.get_model("webhooks", "PnlRollup")
+    Position = apps.get_model("webhooks", "Position")
+    if not PnlRollup.objects.exists():
+        return
+    money = models.DecimalField(max_digits=30, decimal_places=20)
+    rows = (
+        Position.objects.filter(closed_at__isnull=False, avg_sell_price__isnull=False)
+        .annotate(day=TruncDate("closed_at", tzinfo=datetime.timezone.utc))
+        .values("account_id", "demo", "ticker", "timeframe", "day")
+        .annotate(
+            realized_pnl=models.Sum(
+                (models.F("avg_sell_price") - models.F("avg_buy_price")) * models.F("quantity"), output_field=money
+            ),
+            trades=models.Count("pk"),
+            wins=models.Count("pk", filter=models.Q(avg_sell_price__gt=models.F("avg_buy_price"))),
+            volume=models.Sum(
+                models.F("quantity") * (models.F("avg_buy_price") + models.F("avg_sell_price")), output_field=money
+            ),
+        )
+        .order_by()
+    )
+    PnlRollup.objects.all().delete()
+    PnlRollup.objects.bulk_create((PnlRollup(**row) for row in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webhooks", "0013_position_exits"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="pnlrollup",
+            name="unique_pnl_rollup",
+        ),
+        migrations.AddField(
+            model_name="pnlrollup",
+            name="account",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="pnl_rollups",
+                to="webhooks.account",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pnlrollup",
+            name="demo",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name="pnlrollup",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("account__isnull", True)),
+                fields=("demo", "ticker", "timeframe", "day"),
+                name="unique_pnl_rollup",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="pnlrollup",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("account__isnull", False)),
+                fields=("account", "demo", "ticker", "timeframe", "day"),
+                name="unique_account_pnl_rollup",
+            ),
+        ),
+        migrations.RunPython(split_rollups_by_account, migrations.RunPython.noop),
+    ]
@@ -1,19 +1,108 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Avg, Count, DecimalField, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import NullIf
+from django.utils import timezone
 
 class Settings(models.Model):
-    key = models.CharField(max_length=255)
+    key = models.CharField(max_length=255, unique=True)
     value = models.CharField(max_length=255)
 
+class Account(models.Model):
+    """
+    BingX (sub-)account signals are mirrored to.
+
+    When no enabled account matches a signal's live/demo flag, it trades the
+    account configured by the API_KEY and SECRET_KEY environment variables.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    api_key = models.CharField(max_length=255)
+    secret_key = models.CharField(max_length=255)
+    demo = models.BooleanField(default=False)
+    enabled = models.BooleanField(default=True)
+    # Overrides the position_usdt setting for this account
+    position_usdt = models.DecimalField(max_digits=30, decimal_places=20, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class PositionQuerySet(models.QuerySet):
+    def with_pnl(self):
+        """
+        Annotate profit, profit rate and holding time as SQL expressions.
+
+        They are NULL for open positions, like Position.profit() and profit_rate().
+        """
+        price_change = F('avg_sell_price') - F('avg_buy_price')
+        return self.annotate(
+            pnl=ExpressionWrapper(
+                price_change * F('quantity'), output_field=DecimalField(max_digits=30, decimal_places=20)
+            ),
+            pnl_rate=ExpressionWrapper(
+                price_change * 100 / NullIf(F('avg_buy_price'), 0),
+                output_field=DecimalField(max_digits=30, decimal_places=20),
+            ),
+            holding_time=ExpressionWrapper(F('closed_at') - F('created_at'), output_field=DurationField()),
+        )
+
+    def pnl_summary(self):
+        """Totals of the positions in the queryset, computed in one aggregate query"""
+        summary = self.with_pnl().aggregate(
+            positions=Count('pk'),
+            closed=Count('pk', filter=Q(closed_at__isnull=False)),
+            wins=Count('pk', filter=Q(pnl__gt=0)),
+            total_pnl=Sum('pnl'),
+            avg_holding_time=Avg('holding_time'),
+        )
+        summary['win_rate'] = summary['wins'] * 100 / summary['closed'] if summary['closed'] else None
+        return summary
+
+
 class Position(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, null=True, blank=True, related_name='positions')
     ticker = models.CharField(max_length=255)
     timeframe = models.CharField(max_length=255)
     quantity = models.DecimalField(max_digits=30, decimal_places=20)
     quantity_usdt = models.DecimalField(max_digits=30, decimal_places=20)
     avg_buy_price = models.DecimalField(max_digits=30, decimal_places=20)
     avg_sell_price = models.DecimalField(max_digits=30, decimal_places=20, null=True, blank=True)
+    # Endpoint the position was opened on, exits are sold there
+    demo = models.BooleanField(default=False)
+    # Exit levels watched by the run_exits command, see webhooks.exits
+    take_profit = models.DecimalField(max_digits=30, decimal_places=20, null=True, blank=True)
+    stop_loss = models.DecimalField(max_digits=30, decimal_places=20, null=True, blank=True)
+    # Fraction of the highest price since opening the price may fall by, e.g. 0.05
+    trailing_stop = models.DecimalField(max_digits=30, decimal_places=20, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     closed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = PositionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Only one position can be open per account, ticker and timeframe. NULLs are
+            # distinct in unique indexes, so the environment account needs its own constraint
+            models.UniqueConstraint(
+                fields=['ticker', 'timeframe'],
+                condition=models.Q(closed_at__isnull=True, account__isnull=True),
+                name='unique_open_position',
+            ),
+            models.UniqueConstraint(
+                fields=['account', 'ticker', 'timeframe'],
+                condition=models.Q(closed_at__isnull=True, account__isnull=False),
+                name='unique_open_account_position',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['-created_at'], name='position_created_at_idx'),
+            models.Index(fields=['ticker', 'timeframe', '-created_at'], name='position_ticker_tf_idx'),
+            models.Index(fields=['timeframe', '-created_at'], name='position_timeframe_idx'),
+            # The exit engine syncs the positions changed since its last pass
+            models.Index(fields=['updated_at'], name='position_updated_at_idx'),
+        ]
     
     def profit(self):
         """Calculate profit in USDT"""
@@ -29,6 +118,164 @@ class Position(models.Model):
             return None
         return ((self.avg_sell_price - self.avg_buy_price) / self.avg_buy_price) * 100
     
+    def has_exits(self) -> bool:
+        return self.take_profit is not None or self.stop_loss is not None or self.trailing_stop is not None
+
     def __str__(self):
         return f'{self.ticker} {self.timeframe}'
-    
\ No newline at end of file
+
+
+class WebhookJob(models.Model):
+    """
+    Alert accepted by the queued webhook endpoint, executed by process_webhooks.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    body = models.TextField()
+    signal = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    result = models.JSONField(null=True, blank=True)
+    result_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers only ever scan jobs that are waiting or in flight
+            models.Index(
+                fields=['status', 'created_at'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='webhookjob_claimable_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.signal.get("side")} {self.signal.get("ticker")} {self.signal.get("timeframe")}'
+
+
+class AlertReceipt(models.Model):
+    """
+    Idempotency record of a processed alert, keyed on its id or payload hash.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    response = models.JSONField(null=True, blank=True)
+    status = models.PositiveSmallIntegerField(null=True, blank=True)
+    received_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class PnlRollup(models.Model):
+    """
+    Realized P&L per account, ticker, timeframe and UTC day, kept up to date as positions close.
+    """
+    # Null for the account configured by the environment variables
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, null=True, blank=True, related_name='pnl_rollups')
+    demo = models.BooleanField(default=False)
+    ticker = models.CharField(max_length=255)
+    timeframe = models.CharField(max_length=255)
+    day = models.DateField()
+    realized_pnl = models.DecimalField(max_digits=30, decimal_places=20, default=0)
+    trades = models.PositiveIntegerField(default=0)
+    wins = models.PositiveIntegerField(default=0)
+    # USDT traded over both legs of the closed positions
+    volume = models.DecimalField(max_digits=30, decimal_places=20, default=0)
+
+    class Meta:
+        constraints = [
+            # One row per account and day, the environment account needs its own constraint like Position's
+            models.UniqueConstraint(
+                fields=['demo', 'ticker', 'timeframe', 'day'],
+                condition=models.Q(account__isnull=True),
+                name='unique_pnl_rollup',
+            ),
+            models.UniqueConstraint(
+                fields=['account', 'demo', 'ticker', 'timeframe', 'day'],
+                condition=models.Q(account__isnull=False),
+                name='unique_account_pnl_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='pnlrollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.ticker} {self.timeframe} {self.day} {self.account or ("demo" if self.demo else "live")}'
+
+
+class AuditEvent(models.Model):
+    """
+    Append-only record of a received alert or an order sent to the exchange.
+
+    Written in batches by webhooks.audit. On Postgres the table is partitioned
+    by month of created_at, see the audit_partitions command.
+    """
+    ALERT = 'alert'
+    ORDER = 'order'
+    BATCH_ORDER = 'batch_order'
+    KIND_CHOICES = [
+        (ALERT, 'Alert'),
+        (ORDER, 'Order'),
+        (BATCH_ORDER, 'Batch order'),
+    ]
+
+    created_at = models.DateTimeField(default=timezone.now)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    # View that received an alert, account name of an order
+    source = models.CharField(max_length=255, blank=True)
+    demo = models.BooleanField(default=False)
+    ticker = models.CharField(max_length=255, blank=True)
+    timeframe = models.CharField(max_length=255, blank=True)
+    side = models.CharField(max_length=16, blank=True)
+    # Raw alert body, or the order parameters
+    request = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    response = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    # HTTP status of the answer to an alert, BingX code of an order response
+    status = models.IntegerField(null=True, blank=True)
+    outcome = models.CharField(max_length=16)
+    duration_ms = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='auditevent_created_at_idx'),
+            models.Index(fields=['ticker', 'created_at'], name='auditevent_ticker_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.side} {self.ticker} {self.outcome}'
+
+
+class ReconciliationCursor(models.Model):
+    """
+    Where the last reconciliation of an account against BingX stopped reading its order history.
+    """
+    # None for the account configured in the environment
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, null=True, blank=True)
+    demo = models.BooleanField(default=False)
+    # Exchange time in epoch milliseconds the orders were read up to
+    order_time = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['demo'], condition=models.Q(account__isnull=True), name='unique_environment_cursor',
+            ),
+            models.UniqueConstraint(
+                fields=['account', 'demo'], condition=models.Q(account__isnull=False), name='unique_account_cursor',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.account or "environment"} {"demo" if self.demo else "live"}'
@@ -0,0 +1,148 @@
+"""
+Decoding and validation of webhook payloads.
+
+JSON bodies take the json fast path, YAML bodies use libyaml's CSafeLoader
+when PyYAML was built with it. The decoded mapping is validated into a small
+slotted Signal instead of being passed around as a raw dict. A list of mappings
+is accepted as a batch of signals.
+"""
+import json
+from datetime import date, datetime, time, timezone
+from typing import Any, List, Optional, Union
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+SIDES = ('BUY', 'SELL')
+
+# Signals accepted in one list payload
+MAX_SIGNALS = 50
+
+
+class InvalidPayload(ValueError):
+    """The body decoded fine but doesn't describe a valid signal"""
+
+
+class Signal:
+    """
+    A validated trading signal.
+    """
+    __slots__ = ('ticker', 'side', 'timeframe', 'use_demo', 'alert_id', 'bar_time')
+
+    def __init__(self, ticker: str, side: str, timeframe: str, use_demo: bool = False, alert_id: str = None,
+                 bar_time: str = None):
+        self.ticker = ticker
+        self.side = side
+        self.timeframe = timeframe
+        self.use_demo = use_demo
+        self.alert_id = alert_id
+        # TradingView's {{time}}, the bar the alert fired on
+        self.bar_time = bar_time
+
+    def __eq__(self, other):
+        if not isinstance(other, Signal):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f'Signal({self.side} {self.ticker} {self.timeframe}{" demo" if self.use_demo else ""})'
+
+
+def decode_payload(body: bytes, content_type: str = '') -> Any:
+    """
+    Decode a JSON or YAML body.
+
+    Raises json.JSONDecodeError or yaml.YAMLError on malformed bodies.
+    """
+    # JSON is the fast path, YAML remains the default for TradingView's plain text alerts
+    if 'json' in content_type or body.lstrip()[:1] in (b'{', b'['):
+        return json.loads(body)
+    return yaml.load(body, Loader=YamlLoader)
+
+
+def _text(data: dict, name: str, required: bool = True):
+    value = data.get(name)
+    if value is None or value == '':
+        if required:
+            raise InvalidPayload(f"Missing required field: {name}")
+        return None
+    # TradingView intervals like 60 decode as integers
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        raise InvalidPayload(f"Field {name} must be a string")
+    return value
+
+
+def _bar_time(data: dict) -> Optional[str]:
+    """
+    TradingView's {{time}} as one string however it was written.
+
+    YAML decodes an unquoted timestamp to a datetime, the same moment quoted
+    or sent as JSON stays a string; both normalize to the UTC ISO format so
+    they give the same dedupe key. Epoch milliseconds are kept as digits.
+    """
+    value = data.get('time')
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, time())
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat()
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    raise InvalidPayload("Field time must be a timestamp")
+
+
+def validate_signal(data: Any) -> Signal:
+    """Validate a decoded payload into a Signal"""
+    if not isinstance(data, dict):
+        raise InvalidPayload("Payload must be a mapping")
+
+    side = _text(data, 'side')
+    if side not in SIDES:
+        raise InvalidPayload(f"Field side must be one of {', '.join(SIDES)}")
+
+    use_demo = data.get('use_demo', False)
+    if not isinstance(use_demo, bool):
+        raise InvalidPayload("Field use_demo must be a boolean")
+
+    return Signal(
+        ticker=_text(data, 'ticker'),
+        side=side,
+        timeframe=_text(data, 'timeframe'),
+        use_demo=use_demo,
+        alert_id=_text(data, 'alert_id', required=False),
+        bar_time=_bar_time(data),
+    )
+
+
+def parse_payload(body: bytes, content_type: str = '') -> Signal:
+    return validate_signal(decode_payload(body, content_type))
+
+
+def parse_signals(body: bytes, content_type: str = '') -> Union[Signal, List[Signal]]:
+    """Parse a body holding either one signal or a list of signals"""
+    data = decode_payload(body, content_type)
+    if not isinstance(data, list):
+        return validate_signal(data)
+    if not 0 < len(data) <= MAX_SIGNALS:
+        raise InvalidPayload(f"A batch holds between 1 and {MAX_SIGNALS} signals")
+    signals = []
+    for index, item in enumerate(data):
+        try:
+            signals.append(validate_signal(item))
+        except InvalidPayload as e:
+            raise InvalidPayload(f"Signal {index}: {e}")
+    return signals
@@ -0,0 +1,212 @@
+"""
+Reconciliation of the open Position rows against the account state on BingX.
+
+A SELL whose fill wasn't recorded, or a position closed by hand on BingX,
+leaves a Position open that the exchange no longer holds, and the next alert
+for it makes a doomed order. A pass reads the open positions of an account in
+one request and its orders since the stored cursor in a few paginated ones,
+then diffs them against the open rows, read in one query:
+
+- rows of a ticker BingX no longer holds are closed at the price of the SELL
+  that closed it, found in the orders;
+- every other difference is flagged, in the log and on Telegram.
+
+Positions record the endpoint they were opened on, each endpoint an account
+trades is diffed against its own positions only.
+"""
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from bingx_client import MAX_ORDERS_PAGE, MAX_ORDERS_SPAN
+from webhooks.locks import PositionLockTimeout, position_lock
+from webhooks.models import Account, Position, ReconciliationCursor
+from webhooks.rollups import close_position_record
+from webhooks.trading import _account_client, enabled_accounts, notifier
+
+logger = logging.getLogger(__name__)
+
+# How far back the first pass of an account reads its orders
+RECONCILE_LOOKBACK_HOURS = float(os.getenv('RECONCILE_LOOKBACK_HOURS', '24'))
+
+# Orders are read again this many milliseconds before the cursor, BingX may list an order after later ones
+CURSOR_OVERLAP = 60_000
+
+# Milliseconds a SELL may seem to precede the position it closed, the local and exchange clocks differ
+CLOCK_SLACK = 1000
+
+
+def order_time(order: Dict[str, Any]) -> int:
+    """Last update of an order, in epoch milliseconds"""
+    return int(order.get('updateTime') or order.get('time') or 0)
+
+
+def fetch_orders(client, start_time: int, end_time: int) -> List[Dict[str, Any]]:
+    """
+    Read every order updated between two times, oldest first.
+
+    BingX serves at most MAX_ORDERS_SPAN per request and MAX_ORDERS_PAGE
+    orders per page, a full page is continued from its last update.
+    """
+    orders = {}
+    start = start_time
+    while start <= end_time:
+        end = min(start + MAX_ORDERS_SPAN, end_time)
+        page = client.get_orders(start, end, limit=MAX_ORDERS_PAGE)
+        for order in page:
+            orders[order['orderId']] = order
+        last = max((order_time(order) for order in page), default=start)
+        if len(page) >= MAX_ORDERS_PAGE and last > start:
+            start = last
+            continue
+        if len(page) >= MAX_ORDERS_PAGE:
+            logger.warning(f"More than {MAX_ORDERS_PAGE} orders updated at {start}, some were skipped")
+        start = end + 1
+    return sorted(orders.values(), key=order_time)
+
+
+def _held(positions: List[Dict[str, Any]]) -> Dict[str, Decimal]:
+    held = defaultdict(Decimal)
+    for position in positions:
+        if position.get('positionSide', 'LONG') in ('LONG', 'BOTH'):
+            held[position['symbol']] += abs(Decimal(str(position['positionAmt'])))
+    return held
+
+
+def _close(account: Optional[Account], position: Position, fill: Dict[str, Any]) -> bool:
+    """Close a position at the price of a SELL fill, unless an alert closed it meanwhile"""
+    with position_lock(account, position.ticker, position.timeframe):
+        position = Position.objects.filter(pk=position.pk, closed_at__isnull=True).first()
+        if position is None:
+            return False
+        closed_at = datetime.fromtimestamp(order_time(fill) / 1000, tz=dt_timezone.utc)
+        close_position_record(position, fill['avgPrice'], closed_at=closed_at)
+    return True
+
+
+def _diff(account: Optional[Account], demo: bool, held: Dict[str, Decimal], orders: List[Dict[str, Any]],
+          report: Dict[str, Any], dry_run: bool):
+    """Compare what an endpoint holds with the open positions opened on it, closing and flagging into report"""
+    endpoint = ' on demo' if demo else ''
+    sells = defaultdict(list)
+    for order in orders:
+        if order.get('side') == 'SELL' and Decimal(str(order.get('executedQty') or 0)) > 0:
+            sells[order['symbol']].append(order)
+    rows = defaultdict(list)
+    open_positions = Position.objects.filter(account=account, demo=demo, closed_at__isnull=True)
+    for position in open_positions.order_by('created_at'):
+        rows[position.ticker].append(position)
+    report['positions'] += sum(len(positions) for positions in rows.values())
+
+    for ticker in sorted(set(rows) | set(held)):
+        positions = rows.get(ticker, [])
+        tracked = sum((position.quantity for position in positions), Decimal(0))
+        on_exchange = held.get(ticker, Decimal(0))
+        if tracked == on_exchange:
+            continue
+        if not positions:
+            report['flagged'].append(f"{ticker}: {on_exchange} held on BingX{endpoint} without an open position")
+            continue
+        if on_exchange:
+            report['flagged'].append(
+                f"{ticker}: {tracked} in open positions but {on_exchange} held on BingX{endpoint}"
+            )
+            continue
+        opened = min(position.created_at for position in positions).timestamp() * 1000 - CLOCK_SLACK
+        closing = [order for order in sells[ticker] if order_time(order) >= opened]
+        if not closing:
+            report['flagged'].append(f"{ticker}: not held on BingX{endpoint}, no SELL found to close its positions at")
+            continue
+        fill = closing[-1]
+        for position in positions:
+            if dry_run:
+                report['closed'].append(f"{position} at {fill['avgPrice']}")
+                continue
+            try:
+                if _close(account, position, fill):
+                    report['closed'].append(f"{position} at {fill['avgPrice']}")
+            except PositionLockTimeout:
+                report['flagged'].append(f"{position}: an alert held its lock, not closed")
+
+
+def reconcile(account: Optional[Account], demos: List[bool], dry_run: bool = False,
+              lookback_hours: float = None) -> Dict[str, Any]:
+    """
+    Reconcile the open positions of an account with what it holds on the given endpoints.
+
+    Args:
+        account: Account to reconcile, None for the environment account
+        demos: Endpoints the account trades on, False for live and True for demo
+        dry_run: Only report, don't close positions, notify or move the cursors
+        lookback_hours: Read the orders this far back instead of from the cursor
+
+    Returns what was checked, closed and flagged. Exchange errors propagate and
+    leave the cursors where they were.
+    """
+    report = {
+        'account': str(account or 'environment'),
+        'positions': 0,
+        'orders': 0,
+        'closed': [],
+        'flagged': [],
+    }
+    cursors = []
+    for demo in demos:
+        client = _account_client(account, demo)
+        held = _held(client.get_positions())
+        # Read after a signed request, so the clock is synced
+        end_time = client.clock.now()
+        cursor = ReconciliationCursor.objects.filter(account=account, demo=demo).first()
+        if cursor is None or lookback_hours is not None:
+            start_time = end_time - int((lookback_hours or RECONCILE_LOOKBACK_HOURS) * 3600 * 1000)
+        else:
+            start_time = cursor.order_time - CURSOR_OVERLAP
+        orders = fetch_orders(client, start_time, end_time)
+        cursors.append((demo, cursor, end_time))
+        report['orders'] += len(orders)
+        _diff(account, demo, held, orders, report, dry_run)
+
+    if dry_run:
+        return report
+    for demo, cursor, end_time in cursors:
+        if cursor is None:
+            cursor = ReconciliationCursor(account=account, demo=demo)
+        cursor.order_time = end_time
+        cursor.save()
+    for closed in report['closed']:
+        logger.warning(f"Reconciliation of {report['account']} closed {closed}")
+    for flagged in report['flagged']:
+        logger.warning(f"Reconciliation of {report['account']}: {flagged}")
+    if report['flagged']:
+        notifier.enqueue(f"Reconciliation of {report['account']} found mismatches:\n" + "\n".join(report['flagged']))
+    return report
+
+
+def reconcile_accounts(include_demo: bool = False, dry_run: bool = False,
+                       lookback_hours: float = None) -> List[Dict[str, Any]]:
+    """
+    Reconcile every account alerts trade: the enabled accounts, or the environment account where there are none.
+
+    A failing account is reported with its error and doesn't stop the others.
+    """
+    targets = []
+    environment = []
+    for demo in ([False, True] if include_demo else [False]):
+        accounts = enabled_accounts(demo)
+        targets.extend((account, [demo]) for account in accounts)
+        if not accounts:
+            environment.append(demo)
+    if environment:
+        targets.append((None, environment))
+
+    reports = []
+    for account, demos in targets:
+        try:
+            reports.append(reconcile(account, demos, dry_run, lookback_hours))
+        except Exception as e:
+            logger.exception(f"Reconciliation of {account or 'environment'} failed")
+            reports.append({'account': str(account or 'environment'), 'error': str(e)})
+    return reports
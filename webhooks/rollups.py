@@ -0,0 +1,142 @@
+"""
+Daily P&L rollups.
+
+Closing a position adds its result to the PnlRollup row of its account, live or
+demo flag, ticker, timeframe and UTC day in the same transaction, so dashboards read a few rows
+per day instead of scanning the Position table. rebuild() recomputes the rows
+from the positions, for backfills and repairs.
+"""
+from datetime import date, timezone as dt_timezone
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from webhooks.models import PnlRollup, Position
+
+ZERO = Decimal(0)
+
+
+def close_position_record(position: Position, avg_sell_price, closed_at=None):
+    """Mark the position closed and add it to its daily rollup atomically"""
+    position.avg_sell_price = Decimal(str(avg_sell_price))
+    position.closed_at = closed_at or timezone.now()
+    with transaction.atomic():
+        position.save()
+        record_close(position)
+
+
+def record_close(position: Position):
+    """Add a closed position to its rollup row, must run inside the closing transaction"""
+    pnl = position.profit()
+    volume = position.quantity * (position.avg_buy_price + position.avg_sell_price)
+    win = 1 if pnl > 0 else 0
+    key = {
+        'account_id': position.account_id,
+        'demo': position.demo,
+        'ticker': position.ticker,
+        'timeframe': position.timeframe,
+        'day': position.closed_at.astimezone(dt_timezone.utc).date(),
+    }
+    increments = {
+        'realized_pnl': F('realized_pnl') + pnl,
+        'trades': F('trades') + 1,
+        'wins': F('wins') + win,
+        'volume': F('volume') + volume,
+    }
+    if PnlRollup.objects.filter(**key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            PnlRollup.objects.create(realized_pnl=pnl, trades=1, wins=win, volume=volume, **key)
+    except IntegrityError:
+        # Another worker created the row for this day first
+        PnlRollup.objects.filter(**key).update(**increments)
+
+
+def rebuild(since: Optional[date] = None) -> int:
+    """
+    Recompute the rollups from the closed positions, from the given day onwards.
+
+    Returns the number of rollup rows written.
+    """
+    positions = Position.objects.filter(closed_at__isnull=False, avg_sell_price__isnull=False)
+    rollups = PnlRollup.objects.all()
+    if since is not None:
+        positions = positions.filter(closed_at__date__gte=since)
+        rollups = rollups.filter(day__gte=since)
+
+    money = DecimalField(max_digits=30, decimal_places=20)
+    pnl = (F('avg_sell_price') - F('avg_buy_price')) * F('quantity')
+    rows = (
+        positions.annotate(day=TruncDate('closed_at', tzinfo=dt_timezone.utc))
+        .values('account_id', 'demo', 'ticker', 'timeframe', 'day')
+        .annotate(
+            realized_pnl=Sum(pnl, output_field=money),
+            trades=Count('pk'),
+            wins=Count('pk', filter=Q(avg_sell_price__gt=F('avg_buy_price'))),
+            volume=Sum(F('quantity') * (F('avg_buy_price') + F('avg_sell_price')), output_field=money),
+        )
+        .order_by()
+    )
+    with transaction.atomic():
+        rollups.delete()
+        created = PnlRollup.objects.bulk_create((PnlRollup(**row) for row in rows.iterator()), batch_size=1000)
+    return len(created)
+
+
+def stats(start: date, end: date, ticker: str = None, timeframe: str = None, demo: Optional[bool] = None,
+          account: str = None) -> Dict[str, Any]:
+    """
+    Realized P&L between two days, read from the rollups only.
+
+    Args:
+        start: First day
+        end: Last day, included
+        ticker: Only this ticker
+        timeframe: Only this timeframe
+        demo: Only demo or only live trading, both when None
+        account: Only this account name, '' for the account of the environment variables
+    """
+    rollups = PnlRollup.objects.filter(day__gte=start, day__lte=end)
+    if ticker:
+        rollups = rollups.filter(ticker=ticker)
+    if timeframe:
+        rollups = rollups.filter(timeframe=timeframe)
+    if demo is not None:
+        rollups = rollups.filter(demo=demo)
+    if account == '':
+        rollups = rollups.filter(account__isnull=True)
+    elif account is not None:
+        rollups = rollups.filter(account__name=account)
+
+    money = DecimalField(max_digits=30, decimal_places=20)
+    totals = {
+        'realized_pnl': Coalesce(Sum('realized_pnl'), Value(ZERO), output_field=money),
+        'trades': Coalesce(Sum('trades'), 0),
+        'wins': Coalesce(Sum('wins'), 0),
+        'volume': Coalesce(Sum('volume'), Value(ZERO), output_field=money),
+    }
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'totals': _serialize(rollups.aggregate(**totals)),
+        'days': [_serialize(row) for row in rollups.values('day').annotate(**totals).order_by('day')],
+        'symbols': [
+            _serialize(row)
+            for row in rollups.values('ticker', 'timeframe').annotate(**totals).order_by('-realized_pnl')
+        ],
+    }
+
+
+def _serialize(row: Dict[str, Any]) -> Dict[str, Any]:
+    row = dict(row)
+    row['win_rate'] = round(row['wins'] * 100 / row['trades'], 2) if row['trades'] else None
+    for name in ('realized_pnl', 'volume'):
+        row[name] = str(Decimal(row[name]).quantize(Decimal('0.00000001')))
+    if 'day' in row:
+        row['day'] = row['day'].isoformat()
+    return row
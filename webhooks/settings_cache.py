@@ -0,0 +1,190 @@
+"""
+In-process cache of the Settings table.
+
+All rows are loaded once per worker and served from memory. Saving or deleting
+a Settings row invalidates the cache of the current process immediately and,
+on Postgres, of every other worker through LISTEN/NOTIFY. Entries are also
+reloaded after SETTINGS_CACHE_TTL seconds in case a notification is missed.
+"""
+import logging
+import os
+import select
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Optional
+
+from asgiref.sync import sync_to_async
+from django.db import connection, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from webhooks.models import Settings
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'webhooks_settings'
+
+_MISSING = object()
+
+
+class TradingSettings:
+    """
+    Typed, cached access to the Settings key/value table.
+    """
+
+    def __init__(self, ttl: float = None):
+        if ttl is None:
+            ttl = float(os.getenv('SETTINGS_CACHE_TTL', '60'))
+        self.ttl = ttl
+        self._values: Optional[Dict[str, str]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def needs_reload(self) -> bool:
+        return self._values is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def reload(self) -> Dict[str, str]:
+        """Load every Settings row in one query"""
+        self._start_listener()
+        with self._lock:
+            loaded_at = time.monotonic()
+            values = dict(Settings.objects.values_list('key', 'value'))
+            self._values = values
+            self._loaded_at = loaded_at
+        return values
+
+    def invalidate(self):
+        self._values = None
+
+    def _get_values(self) -> Dict[str, str]:
+        values = self._values
+        if values is None or time.monotonic() - self._loaded_at > self.ttl:
+            values = self.reload()
+        return values
+
+    async def aload(self):
+        """Reload from an async context when needed, reads are then served from memory"""
+        if self.needs_reload():
+            await sync_to_async(self.reload)()
+
+    def get(self, key: str, default=_MISSING) -> str:
+        """
+        Return the raw value of a setting.
+
+        Raises Settings.DoesNotExist when the key is missing and no default is given.
+        """
+        value = self._get_values().get(key, default)
+        if value is _MISSING:
+            raise Settings.DoesNotExist(f"Setting {key} does not exist")
+        return value
+
+    def get_bool(self, key: str, default=_MISSING) -> bool:
+        value = self.get(key, default)
+        if isinstance(value, bool):
+            return value
+        return value == 'true'
+
+    def get_decimal(self, key: str, default=_MISSING) -> Decimal:
+        return Decimal(self.get(key, default))
+
+    @property
+    def trading_enabled(self) -> bool:
+        return self.get_bool('trading_enabled')
+
+    @property
+    def position_usdt(self) -> Decimal:
+        return self.get_decimal('position_usdt')
+
+    def get_percent(self, key: str) -> Optional[Decimal]:
+        """Fraction of a percentage setting, None when it's missing or empty"""
+        value = self.get(key, '')
+        return Decimal(value) / 100 if value else None
+
+    @property
+    def take_profit_pct(self) -> Optional[Decimal]:
+        return self.get_percent('take_profit_pct')
+
+    @property
+    def stop_loss_pct(self) -> Optional[Decimal]:
+        return self.get_percent('stop_loss_pct')
+
+    @property
+    def trailing_stop_pct(self) -> Optional[Decimal]:
+        return self.get_percent('trailing_stop_pct')
+
+    def _start_listener(self):
+        """Start the LISTEN thread of this process, Postgres only"""
+        if connection.vendor != 'postgresql' or (self._listener is not None and self._listener.is_alive()):
+            return
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            params = connection.get_connection_params()
+            self._stop.clear()
+            self._listener = threading.Thread(target=self._listen, args=(params,),
+                                              name='settings-listener', daemon=True)
+            self._listener.start()
+
+    def stop_listener(self):
+        """Stop the LISTEN thread and close its connection, e.g. before the database is dropped"""
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join()
+            self._listener = None
+
+    def _listen(self, params):
+        import psycopg2
+
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**params)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Changes may have happened while we weren't listening
+                self.invalidate()
+                while not self._stop.is_set():
+                    # Wakes up every second to notice stop_listener
+                    if select.select([conn], [], [], 1) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self.invalidate()
+            except Exception as e:
+                logger.warning(f"Settings listener disconnected: {e}")
+                self.invalidate()
+                self._stop.wait(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+trading_settings = TradingSettings()
+
+
+@receiver(post_save, sender=Settings)
+@receiver(post_delete, sender=Settings)
+def settings_changed(sender, using, **kwargs):
+    """Invalidate the cache of this process now and of all workers on commit"""
+    trading_settings.invalidate()
+    transaction.on_commit(trading_settings.invalidate, using=using)
+    if connections[using].vendor == 'postgresql':
+        # Delivered to listeners when the transaction commits
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"NOTIFY {NOTIFY_CHANNEL}")
+
+
+def _reset_listener():
+    """The listener thread doesn't survive a fork, the child starts its own"""
+    trading_settings._listener = None
+    trading_settings._lock = threading.Lock()
+    trading_settings._stop = threading.Event()
+    trading_settings.invalidate()
+
+
+os.register_at_fork(after_in_child=_reset_listener)
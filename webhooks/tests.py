@@ -1,3 +1,1415 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from signal import SIGTERM
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from ipaddress import ip_network
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from backtest import CandleStore, Candles, Signals, backtest, sweep
+import bingx_client
+import contracts
+import price_cache
+from bingx_client import AsyncBingXClient, BingXClient
+from contracts import ContractCache
+from bingx_simulator import INVALID_PARAMETERS, INVALID_TIMESTAMP, RATE_LIMITED, SIGNATURE_MISMATCH, BingXSimulator, PricePath
+from liftoff.settings import METRICS_IP_ALLOWED
+from metrics import stage
+from price_cache import FakePriceFeed, PriceCache
+from telegram_client import TelegramDispatcher
+from webhooks.audit import AuditLog, create_partitions, drop_expired, partition_name
+from webhooks.exits import ExitEngine, TriggerBook
+from webhooks.idempotency import AlertDeduplicator, alert_key
+from webhooks.jobs import claim_job, enqueue, expire_stale_jobs, process_next_job
+from webhooks.models import (Account, AlertReceipt, AuditEvent, PnlRollup, Position, ReconciliationCursor, Settings,
+                             WebhookJob)
+from webhooks.payload import InvalidPayload, Signal, parse_payload, parse_signals
+from webhooks import trading, views
+from webhooks.reconcile import fetch_orders, reconcile_accounts
+from webhooks.rollups import close_position_record, rebuild, stats
+from webhooks.settings_cache import trading_settings
+from webhooks.trading import BatchFailed, dispatch_signal, dispatch_signals, execute_signal, execute_signals
+from webhooks.warmup import warm_up, with_warm_up
+
+
+def tearDownModule():
+    # Connections left open by other threads would keep the test database from being dropped
+    trading_settings.stop_listener()
+    if connection.vendor == 'postgresql':
+        # The account fan-out pool and the audit writer keep theirs for CONN_MAX_AGE
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity"
+                           " WHERE datname = current_database() AND pid <> pg_backend_pid()")
+
+
+class StubPriceClient:
+    demo = False
+
+    def __init__(self, price):
+        self.price = Decimal(price)
+        self.calls = 0
+
+    def get_price(self, symbol):
+        self.calls += 1
+        return self.price
+
+
+class PriceCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.client = StubPriceClient('100')
+        self.feed = FakePriceFeed({'BTC-USDT': Decimal('101')})
+        self.cache = PriceCache(self.client, feed=self.feed, max_age=5, poll_interval=0)
+
+    def test_fresh_entry_is_served_from_memory(self):
+        self.cache.track('BTC-USDT')
+        self.cache.poll()
+        self.assertEqual(self.cache.get_price('BTC-USDT'), Decimal('101'))
+        self.assertEqual(self.client.calls, 0)
+
+    def test_missing_entry_falls_back_to_rest_and_is_tracked(self):
+        self.assertEqual(self.cache.get_price('BTC-USDT'), Decimal('100'))
+        self.assertEqual(self.client.calls, 1)
+        self.assertEqual(self.cache.get_price('BTC-USDT'), Decimal('100'))
+        self.assertEqual(self.client.calls, 1)
+
+        self.cache.poll()
+        self.assertEqual(self.cache.get_price('BTC-USDT'), Decimal('101'))
+
+    def test_stale_entry_falls_back_to_rest(self):
+        self.cache.update('BTC-USDT', Decimal('90'), received_at=0)
+        with mock.patch('price_cache.time.monotonic', return_value=10):
+            self.assertEqual(self.cache.get_price('BTC-USDT'), Decimal('100'))
+        self.assertEqual(self.client.calls, 1)
+
+    def test_per_symbol_max_age(self):
+        self.cache.set_max_age('BTC-USDT', 30)
+        self.cache.update('BTC-USDT', Decimal('90'), received_at=0)
+        with mock.patch('price_cache.time.monotonic', return_value=10):
+            self.assertEqual(self.cache.get_cached('BTC-USDT'), Decimal('90'))
+            self.assertIsNone(self.cache.get_cached('ETH-USDT'))
+
+
+class TradingSettingsTests(TestCase):
+    def setUp(self):
+        Settings.objects.create(key='trading_enabled', value='true')
+        Settings.objects.create(key='position_usdt', value='100')
+        trading_settings.invalidate()
+
+    def test_reads_are_served_from_memory(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(trading_settings.trading_enabled)
+            self.assertEqual(trading_settings.position_usdt, Decimal('100'))
+            self.assertTrue(trading_settings.trading_enabled)
+
+    def test_save_and_delete_invalidate(self):
+        self.assertEqual(trading_settings.position_usdt, Decimal('100'))
+        setting = Settings.objects.get(key='position_usdt')
+        setting.value = '250'
+        setting.save()
+        self.assertEqual(trading_settings.position_usdt, Decimal('250'))
+
+        setting.delete()
+        with self.assertRaises(Settings.DoesNotExist):
+            trading_settings.position_usdt
+        self.assertEqual(trading_settings.get_decimal('position_usdt', '10'), Decimal('10'))
+
+
+class AlertDeduplicatorTests(TestCase):
+    def setUp(self):
+        self.calls = 0
+
+    def execute(self):
+        self.calls += 1
+        return {'status': 'success', 'call': self.calls}, 200
+
+    def test_duplicates_get_the_original_result(self):
+        key = alert_key('BTC-USDT', 'BUY', '1h')
+        self.assertEqual(AlertDeduplicator(window=60).run(key, self.execute), ({'status': 'success', 'call': 1}, 200))
+        # A fresh deduplicator has an empty LRU, as in another worker
+        self.assertEqual(AlertDeduplicator(window=60).run(key, self.execute), ({'status': 'success', 'call': 1}, 200))
+        self.assertEqual(self.calls, 1)
+
+    def test_alert_id_takes_precedence_over_payload(self):
+        deduplicator = AlertDeduplicator(window=60)
+        deduplicator.run(alert_key('BTC-USDT', 'BUY', '1h', alert_id='a'), self.execute)
+        deduplicator.run(alert_key('BTC-USDT', 'BUY', '1h', alert_id='b'), self.execute)
+        self.assertEqual(self.calls, 2)
+
+    def test_same_signal_on_the_next_bar_runs(self):
+        deduplicator = AlertDeduplicator(window=60)
+        for bar_time in ('2026-10-18T09:00:00Z', '2026-10-18T10:00:00Z', '2026-10-18T10:00:00Z'):
+            deduplicator.run(alert_key('BTC-USDT', 'BUY', '1h', bar_time=bar_time), self.execute)
+        self.assertEqual(self.calls, 2)
+
+    def test_failed_results_are_not_stored(self):
+        deduplicator = AlertDeduplicator(window=60)
+        key = alert_key('BTC-USDT', 'BUY', '1h')
+        failed = mock.Mock(return_value=({'status': 'Another alert for this position is still running'}, 409))
+        self.assertEqual(deduplicator.run(key, failed)[1], 409)
+        self.assertFalse(AlertReceipt.objects.exists())
+        self.assertEqual(deduplicator.run(key, self.execute)[1], 200)
+        self.assertEqual(self.calls, 1)
+
+    def test_key_released_while_claiming_is_claimed_again(self):
+        def released(**kwargs):
+            # The original held the key when inserting, then failed and deleted its receipt
+            patcher.stop()
+            raise IntegrityError
+
+        patcher = mock.patch.object(AlertReceipt.objects, 'create', side_effect=released)
+        patcher.start()
+        self.assertIsNone(AlertDeduplicator(window=60).begin(alert_key('BTC-USDT', 'BUY', '1h')))
+        self.assertEqual(AlertReceipt.objects.count(), 1)
+
+    def test_alert_runs_again_after_the_window(self):
+        key = alert_key('BTC-USDT', 'BUY', '1h')
+        AlertDeduplicator(window=60).run(key, self.execute)
+        AlertReceipt.objects.update(received_at=timezone.now() - timedelta(minutes=5))
+        AlertDeduplicator(window=60).run(key, self.execute)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(AlertReceipt.objects.count(), 1)
+
+    def test_failed_alert_releases_its_key(self):
+        deduplicator = AlertDeduplicator(window=60)
+        key = alert_key('BTC-USDT', 'BUY', '1h')
+        with self.assertRaises(RuntimeError):
+            deduplicator.run(key, mock.Mock(side_effect=RuntimeError))
+        deduplicator.run(key, self.execute)
+        self.assertEqual(self.calls, 1)
+
+
+class PayloadTests(SimpleTestCase):
+    def test_yaml_and_json_decode_to_the_same_signal(self):
+        expected = Signal('BTC-USDT', 'BUY', '60')
+        self.assertEqual(parse_payload(b"ticker: BTC-USDT\nside: BUY\ntimeframe: 60\n", 'text/plain'), expected)
+        self.assertEqual(parse_payload(b'{"ticker": "BTC-USDT", "side": "BUY", "timeframe": "60"}', 'text/plain'),
+                         expected)
+
+    def test_bar_time_is_read_from_tradingview_time(self):
+        signal = parse_payload(b"ticker: BTC-USDT\nside: BUY\ntimeframe: 60\ntime: '2026-10-18T09:00:00Z'\n")
+        self.assertEqual(signal.bar_time, '2026-10-18T09:00:00+00:00')
+
+    def test_unquoted_yaml_time_matches_the_json_string(self):
+        yaml_signal = parse_payload(b"ticker: BTC-USDT\nside: BUY\ntimeframe: 60\ntime: 2026-10-18T09:00:00Z\n")
+        json_signal = parse_payload(b'{"ticker": "BTC-USDT", "side": "BUY", "timeframe": "60",'
+                                    b' "time": "2026-10-18T11:00:00+02:00"}')
+        self.assertEqual(yaml_signal.bar_time, '2026-10-18T09:00:00+00:00')
+        self.assertEqual(yaml_signal, json_signal)
+        self.assertEqual(parse_payload(b"ticker: BTC-USDT\nside: BUY\ntimeframe: 60\ntime: 1760778000000\n").bar_time,
+                         '1760778000000')
+
+    def test_invalid_signals_are_rejected(self):
+        for body in (b"ticker: BTC-USDT\nside: HOLD\ntimeframe: 1h\n",
+                     b"ticker: BTC-USDT\nside: BUY\n",
+                     b"ticker: BTC-USDT\nside: BUY\ntimeframe: 1h\nuse_demo: maybe\n",
+                     b"- BUY\n"):
+            with self.assertRaises(InvalidPayload):
+                parse_payload(body)
+
+
+class BingXSimulatorTests(SimpleTestCase):
+    def setUp(self):
+        self.simulator = BingXSimulator('key', 'secret', prices={'BTC-USDT': PricePath([100, 101, 99])})
+        self.client = self.simulator.attach(BingXClient('key', 'secret'))
+
+    def test_price_path_is_replayed(self):
+        prices = [self.client.get_price('BTC-USDT') for _ in range(4)]
+        self.assertEqual(prices, [Decimal('101'), Decimal('99'), Decimal('100'), Decimal('101')])
+
+    def test_unknown_symbols_follow_a_seeded_walk(self):
+        other = BingXSimulator('key', 'secret')
+        other_client = other.attach(BingXClient('key', 'secret'))
+        self.assertEqual(
+            [self.client.get_price('ETH-USDT') for _ in range(3)],
+            [other_client.get_price('ETH-USDT') for _ in range(3)],
+        )
+
+    def test_bad_signature_is_rejected(self):
+        client = self.simulator.attach(BingXClient('key', 'wrong'))
+        response = client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)
+        self.assertEqual(response['code'], SIGNATURE_MISMATCH)
+        self.assertFalse(response['data'])
+        self.assertEqual(self.simulator.orders, [])
+
+    def test_fills_apply_slippage_and_partial_fills(self):
+        self.simulator.slippage = Decimal('0.01')
+        self.simulator.fill_ratio = Decimal('0.5')
+        order = self.client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 2)['data']['order']
+        self.assertEqual(Decimal(order['avgPrice']), Decimal('101'))
+        self.assertEqual(Decimal(order['executedQty']), Decimal('1'))
+        self.assertEqual(order['status'], 'PARTIALLY_FILLED')
+        order = self.client.place_order('BTC-USDT', 'SELL', 'MARKET', 'LONG', 1)['data']['order']
+        self.assertEqual(Decimal(order['avgPrice']), Decimal('99'))
+
+    def test_injected_errors(self):
+        self.simulator.inject_error(status=503)
+        with self.assertRaises(requests.HTTPError):
+            self.client.get_price('BTC-USDT')
+        self.assertEqual(self.client.get_price('BTC-USDT'), Decimal('101'))
+
+    async def test_async_client(self):
+        client = self.simulator.attach(AsyncBingXClient('key', 'secret'))
+        self.assertEqual(await client.get_price('BTC-USDT'), Decimal('101'))
+        response = await client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)
+        self.assertEqual(Decimal(response['data']['order']['avgPrice']), Decimal('101'))
+        await client.close()
+
+
+class BingXClientRetryTests(SimpleTestCase):
+    def setUp(self):
+        self.simulator = BingXSimulator('key', 'secret', prices={'BTC-USDT': PricePath([100])})
+        self.client = self.simulator.attach(BingXClient('key', 'secret'))
+
+    def test_rate_limited_orders_are_retried(self):
+        self.simulator.inject_error(code=RATE_LIMITED, msg='Too many requests')
+        self.simulator.inject_error(status=429)
+        response = self.client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)
+        self.assertEqual(response['code'], 0)
+        self.assertEqual(self.simulator.requests, 3)
+        self.assertEqual(len(self.simulator.orders), 1)
+
+    def test_orders_failing_on_the_server_are_not_resent(self):
+        self.simulator.inject_error(status=503)
+        with self.assertRaises(requests.HTTPError):
+            self.client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)
+        self.assertEqual(self.simulator.requests, 1)
+
+    def test_retries_are_bounded(self):
+        client = self.simulator.attach(BingXClient('key', 'secret', max_retries=1))
+        self.simulator.inject_error(code=RATE_LIMITED, msg='Too many requests', count=3)
+        self.assertEqual(client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)['code'], RATE_LIMITED)
+        self.assertEqual(self.simulator.requests, 2)
+
+    def test_clock_is_synced_with_the_server(self):
+        simulator = BingXSimulator('key', 'secret', clock_offset=60000)
+        client = simulator.attach(BingXClient('key', 'secret'))
+        client.clock.invalidate()
+        self.assertEqual(client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)['code'], 0)
+        self.assertAlmostEqual(client.clock.offset, 60000, delta=1000)
+
+    def test_rejected_timestamp_resyncs_the_clock(self):
+        self.simulator.clock_offset = 30000
+        response = self.client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)
+        self.assertEqual(response['code'], 0)
+        # Rejected order, server time, accepted order
+        self.assertEqual(self.simulator.requests, 3)
+
+    def test_requests_are_paced_by_the_group_rate_limit(self):
+        simulator = BingXSimulator('paced', 'secret')
+        with mock.patch.dict('os.environ', {'BINGX_TRADE_RATE': '20'}):
+            client = simulator.attach(BingXClient('paced', 'secret'))
+            start = time.monotonic()
+            for _ in range(25):
+                client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)
+        # A burst of 20, then 5 more at 20 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    async def test_async_client_retries(self):
+        client = self.simulator.attach(AsyncBingXClient('key', 'secret'))
+        self.simulator.inject_error(code=INVALID_TIMESTAMP, msg='Timestamp is outside of the recvWindow')
+        response = await client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)
+        self.assertEqual(response['code'], 0)
+        self.assertEqual(len(self.simulator.orders), 1)
+        await client.close()
+
+
+class ClientRegistryTests(SimpleTestCase):
+    def setUp(self):
+        bingx_client._reset_clients()
+        self.addCleanup(bingx_client._reset_clients)
+
+    def test_clients_are_reused_per_account(self):
+        client = bingx_client.get_client(api_key='a', secret_key='s')
+        self.assertIs(bingx_client.get_client(api_key='a', secret_key='s'), client)
+        self.assertIsNot(bingx_client.get_client(demo=True, api_key='a', secret_key='s'), client)
+        self.assertIsNot(bingx_client.get_client(api_key='b', secret_key='s'), client)
+
+    def test_buckets_are_shared_per_group(self):
+        bucket = bingx_client.get_bucket('a', bingx_client.ORDER_ENDPOINT)
+        self.assertIs(bingx_client.get_bucket('a', bingx_client.BATCH_ORDERS_ENDPOINT), bucket)
+        self.assertIsNot(bingx_client.get_bucket('a', bingx_client.PRICE_ENDPOINT), bucket)
+        self.assertIsNot(bingx_client.get_bucket('b', bingx_client.ORDER_ENDPOINT), bucket)
+
+    def test_async_clients_are_reused_per_event_loop(self):
+        async def clients():
+            return [bingx_client.get_async_client(api_key='a', secret_key='s') for _ in range(2)]
+
+        first, again = asyncio.run(clients())
+        self.assertIs(first, again)
+        self.assertIsNot(asyncio.run(clients())[0], first)
+
+    @skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_child_builds_its_own_clients(self):
+        client = bingx_client.get_client(api_key='a', secret_key='s')
+        bucket = bingx_client.get_bucket('a', bingx_client.ORDER_ENDPOINT)
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                fresh = (bingx_client.get_client(api_key='a', secret_key='s') is not client
+                         and bingx_client.get_bucket('a', bingx_client.ORDER_ENDPOINT) is not bucket)
+                os.write(write, b'1' if fresh else b'0')
+            finally:
+                os._exit(0)
+        os.close(write)
+        with os.fdopen(read, 'rb') as pipe:
+            self.assertEqual(pipe.read(), b'1')
+        os.waitpid(pid, 0)
+        # The parent keeps its own
+        self.assertIs(bingx_client.get_client(api_key='a', secret_key='s'), client)
+
+
+class MetricsTests(SimpleTestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_exchange_rejections_are_counted_by_code(self):
+        simulator = BingXSimulator('key', 'secret')
+        client = simulator.attach(BingXClient('key', 'secret'))
+        labels = {'endpoint': '/openApi/swap/v2/trade/order', 'demo': 'live', 'code': '101204'}
+        before = self.sample('bingx_errors_total', **labels)
+        simulator.inject_error(code=101204, msg='Insufficient margin')
+        with self.assertLogs('metrics', 'WARNING') as logs:
+            client.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', 1)
+        self.assertEqual(self.sample('bingx_errors_total', **labels), before + 1)
+        self.assertIn('101204: Insufficient margin', logs.output[0])
+
+    def test_stage_records_errors(self):
+        labels = {'stage': 'test', 'demo': 'demo', 'outcome': 'error'}
+        before = self.sample('webhook_stage_seconds_count', **labels)
+        with self.assertRaises(ValueError):
+            with stage('test', demo=True):
+                raise ValueError
+        self.assertEqual(self.sample('webhook_stage_seconds_count', **labels), before + 1)
+
+    def test_metrics_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        METRICS_IP_ALLOWED.append('10.0.0.1')
+        self.addCleanup(METRICS_IP_ALLOWED.remove, '10.0.0.1')
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'webhook_request_seconds', response.content)
+
+
+class ClientIpTests(SimpleTestCase):
+    def client_ip(self, remote_addr, forwarded_for):
+        request = RequestFactory().get('/', REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for)
+        return views._client_ip(request)
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        self.assertEqual(self.client_ip('198.51.100.7', '52.89.214.238'), '198.51.100.7')
+
+    def test_forwarded_for_is_read_through_trusted_proxies(self):
+        with mock.patch('webhooks.views._TRUSTED_PROXIES', [ip_network('10.0.0.0/8')]):
+            self.assertEqual(self.client_ip('10.0.0.2', '52.89.214.238'), '52.89.214.238')
+            # Entries the client prepended are skipped
+            self.assertEqual(self.client_ip('10.0.0.2', '52.89.214.238, 198.51.100.7, 10.0.0.3'), '198.51.100.7')
+            self.assertEqual(self.client_ip('198.51.100.7', '52.89.214.238'), '198.51.100.7')
+
+
+class PositionPnlTests(TestCase):
+    def setUp(self):
+        self.win = self.position('BTC-USDT', '100', '110', hours=2)
+        self.loss = self.position('ETH-USDT', '100', '95', hours=4)
+        self.open = self.position('SOL-USDT', '100', None)
+
+    def position(self, ticker, buy, sell, hours=None):
+        position = Position.objects.create(
+            ticker=ticker, timeframe='1h', quantity=Decimal('2'), quantity_usdt=Decimal(buy) * 2,
+            avg_buy_price=Decimal(buy), avg_sell_price=sell,
+        )
+        if hours is not None:
+            Position.objects.filter(pk=position.pk).update(closed_at=position.created_at + timedelta(hours=hours))
+        return position
+
+    def test_annotations_match_python_methods(self):
+        for position in Position.objects.with_pnl():
+            self.assertEqual(position.pnl, position.profit())
+            self.assertEqual(position.pnl_rate, position.profit_rate())
+        self.assertEqual(Position.objects.with_pnl().get(pk=self.win.pk).holding_time, timedelta(hours=2))
+
+    def test_sorts_by_profit_in_sql(self):
+        tickers = list(Position.objects.with_pnl().filter(pnl__isnull=False).order_by('-pnl')
+                       .values_list('ticker', flat=True))
+        self.assertEqual(tickers, ['BTC-USDT', 'ETH-USDT'])
+
+    def test_summary(self):
+        with self.assertNumQueries(1):
+            summary = Position.objects.pnl_summary()
+        self.assertEqual(summary['total_pnl'], Decimal('10'))
+        self.assertEqual(summary['win_rate'], 50)
+        self.assertEqual(summary['positions'], 3)
+        self.assertEqual(summary['avg_holding_time'], timedelta(hours=3))
+
+    def test_admin_changelist_shows_summary(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        response = self.client.get('/admin/webhooks/position/', {'o': '5', 'outcome': 'win'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['pnl_summary']['total_pnl'], Decimal('20'))
+        self.assertContains(response, 'Total P&amp;L')
+
+
+class SimulatedExchangeMixin:
+    """Routes execute_signal to an in-process BingX simulator"""
+    prices = {'BTC-USDT': [100, 100, 110]}
+    contracts = {}
+
+    def setUp(self):
+        super().setUp()
+        Settings.objects.create(key='trading_enabled', value='true')
+        Settings.objects.create(key='position_usdt', value='100')
+        self.simulator = BingXSimulator(
+            'key', 'secret', prices={symbol: PricePath(path, loop=False) for symbol, path in self.prices.items()},
+            contracts=self.contracts,
+        )
+        self.exchange = self.simulator.attach(BingXClient('key', 'secret'))
+        self.price_cache = PriceCache(self.exchange, feed=FakePriceFeed(), max_age=0, poll_interval=0)
+        self.contract_cache = ContractCache(self.exchange, refresh_interval=0)
+        for target, value in (('get_client', self.exchange), ('get_price_cache', self.price_cache),
+                              ('get_contract_cache', self.contract_cache)):
+            patcher = mock.patch(f'webhooks.trading.{target}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Results remembered by an earlier test would answer this one's alerts
+        patcher = mock.patch('webhooks.views.deduplicator', AlertDeduplicator())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class PnlRollupTests(SimulatedExchangeMixin, TestCase):
+    def test_closing_updates_the_rollup(self):
+        self.assertEqual(execute_signal('BTC-USDT', 'BUY', '1h'), ({'status': 'success'}, 200))
+        self.assertEqual(execute_signal('BTC-USDT', 'SELL', '1h'), ({'status': 'success'}, 200))
+        rollup = PnlRollup.objects.get()
+        self.assertEqual((rollup.ticker, rollup.trades, rollup.wins), ('BTC-USDT', 1, 1))
+        self.assertEqual(rollup.realized_pnl, Decimal('10'))
+        self.assertEqual(rollup.volume, Decimal('210'))
+
+    def test_rebuild_matches_incremental_updates(self):
+        execute_signal('BTC-USDT', 'BUY', '1h')
+        execute_signal('BTC-USDT', 'SELL', '1h')
+        fields = ('account_id', 'demo', 'ticker', 'timeframe', 'day', 'realized_pnl', 'trades', 'wins', 'volume')
+        incremental = list(PnlRollup.objects.values(*fields))
+        PnlRollup.objects.all().delete()
+        call_command('rebuild_pnl_rollups', stdout=mock.Mock())
+        rebuilt = list(PnlRollup.objects.values(*fields))
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(rebuild(timezone.now().date() + timedelta(days=1)), 0)
+        self.assertEqual(PnlRollup.objects.count(), 1)
+
+    def test_stats_endpoint(self):
+        execute_signal('BTC-USDT', 'BUY', '1h')
+        execute_signal('BTC-USDT', 'SELL', '1h')
+        self.assertEqual(self.client.get('/stats/').status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user('staff', is_staff=True))
+        # Plus the session and the user
+        with self.assertNumQueries(5):
+            response = self.client.get('/stats/', {'ticker': 'BTC-USDT'})
+        data = response.json()
+        self.assertEqual(data['totals']['realized_pnl'], '10.00000000')
+        self.assertEqual(data['totals']['win_rate'], 100)
+        self.assertEqual(data['symbols'][0]['ticker'], 'BTC-USDT')
+        self.assertEqual(self.client.get('/stats/', {'from': 'yesterday'}).status_code, 400)
+
+    def test_accounts_and_demo_have_their_own_rollups(self):
+        account = Account.objects.create(name='main', api_key='main', secret_key='secret')
+        for owner, demo, sell in ((None, False, '110'), (None, True, '90'), (account, False, '105')):
+            position = Position.objects.create(
+                ticker='ETH-USDT', timeframe='4h', quantity=Decimal('1'), quantity_usdt=Decimal('100'),
+                avg_buy_price=Decimal('100'), account=owner, demo=demo,
+            )
+            close_position_record(position, sell)
+        rollups = {(rollup.account_id, rollup.demo): rollup.realized_pnl for rollup in PnlRollup.objects.all()}
+        self.assertEqual(rollups, {(None, False): 10, (None, True): -10, (account.pk, False): 5})
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PnlRollup.objects.create(account=account, ticker='ETH-USDT', timeframe='4h', day=timezone.now().date())
+
+        today = timezone.now().date()
+        self.assertEqual(stats(today, today)['totals']['realized_pnl'], '5.00000000')
+        self.assertEqual(stats(today, today, demo=False)['totals']['realized_pnl'], '15.00000000')
+        self.assertEqual(stats(today, today, demo=True)['totals']['trades'], 1)
+        self.assertEqual(stats(today, today, account='main')['totals']['realized_pnl'], '5.00000000')
+        self.assertEqual(stats(today, today, account='', demo=False)['totals']['realized_pnl'], '10.00000000')
+
+        self.client.force_login(get_user_model().objects.create_user('staff', is_staff=True))
+        response = self.client.get('/stats/', {'account': 'main', 'demo': 'false'})
+        self.assertEqual(response.json()['totals']['trades'], 1)
+        self.assertEqual(self.client.get('/stats/', {'demo': 'yes'}).status_code, 400)
+
+
+class BatchSignalTests(SimulatedExchangeMixin, TestCase):
+    prices = {f'S{i}-USDT': [100, 100, 110] for i in range(7)}
+
+    def signals(self, side, count=7):
+        return [Signal(f'S{i}-USDT', side, '1h') for i in range(count)]
+
+    def test_batch_uses_one_price_request_and_batched_orders(self):
+        results = execute_signals(self.signals('BUY'))
+        self.assertEqual(results, [({'status': 'success'}, 200)] * 7)
+        # One bulk price request, one bulk contracts request and two batchOrders requests of 5 and 2 orders
+        self.assertEqual(self.simulator.requests, 4)
+        self.assertEqual(Position.objects.filter(closed_at__isnull=True).count(), 7)
+
+        results = execute_signals(self.signals('SELL'))
+        self.assertEqual(results, [({'status': 'success'}, 200)] * 7)
+        self.assertEqual(Position.objects.filter(avg_sell_price=Decimal('110')).count(), 7)
+
+    def test_results_map_back_to_each_signal(self):
+        execute_signal('S0-USDT', 'BUY', '1h')
+        signals = [Signal('S0-USDT', 'BUY', '1h'), Signal('S1-USDT', 'SELL', '1h'), Signal('S2-USDT', 'BUY', '1h'),
+                   Signal('S2-USDT', 'BUY', '1h')]
+        statuses = [payload['status'] for payload, _ in execute_signals(signals)]
+        self.assertEqual(statuses, ['Position already exists', 'Position does not exist', 'success',
+                                    'Duplicate signal in batch'])
+
+    def test_list_payload_through_the_webhook(self):
+        body = b'[{"ticker": "S0-USDT", "side": "BUY", "timeframe": "1h"},' \
+               b' {"ticker": "S1-USDT", "side": "SELL", "timeframe": "1h"}]'
+        response = self.client.post('/webhook/', body, content_type='application/json',
+                                    REMOTE_ADDR='52.89.214.238')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['code'] for result in response.json()['results']], [200, 400])
+
+    def test_failed_chunk_only_releases_its_own_signals(self):
+        place_batch_orders = self.exchange.place_batch_orders
+        chunks = []
+
+        def second_chunk_fails(batch):
+            chunks.append(batch)
+            if len(chunks) == 2:
+                raise requests.ConnectionError('Connection reset')
+            return place_batch_orders(batch)
+
+        with mock.patch.object(self.exchange, 'place_batch_orders', side_effect=second_chunk_fails):
+            with self.assertRaises(BatchFailed):
+                views.run_batch(self.signals('BUY'))
+        self.assertEqual(AlertReceipt.objects.filter(status=200).count(), 5)
+        self.assertEqual(AlertReceipt.objects.count(), 5)
+
+        # The resent batch places the two orders that didn't go out
+        self.assertEqual(views.run_batch(self.signals('BUY')), [({'status': 'success'}, 200)] * 7)
+        self.assertEqual(len(self.simulator.orders), 7)
+
+    def test_invalid_signal_in_batch(self):
+        with self.assertRaisesMessage(InvalidPayload, 'Signal 1'):
+            parse_signals(b'[{"ticker": "A", "side": "BUY", "timeframe": "1h"}, {"ticker": "B"}]')
+
+
+class ContractRulesTests(SimulatedExchangeMixin, TestCase):
+    prices = {'BTC-USDT': [100, 100, 110], 'ODD-USDT': [3], 'BIG-USDT': [100]}
+    contracts = {'ODD-USDT': {'quantityPrecision': 2}, 'BIG-USDT': {'tradeMinUSDT': '500'}}
+
+    def test_quantity_is_rounded_down_to_the_step_size(self):
+        self.assertEqual(execute_signal('ODD-USDT', 'BUY', '1h'), ({'status': 'success'}, 200))
+        self.assertEqual(self.simulator.orders[-1]['origQty'], '33.33')
+
+    def test_orders_below_the_minimum_are_not_sent(self):
+        payload, status = execute_signal('BIG-USDT', 'BUY', '1h')
+        self.assertEqual((payload['status'], status), ('Invalid order', 400))
+        self.assertEqual(self.simulator.orders, [])
+
+    def test_closing_quantity_is_quantized(self):
+        Position.objects.create(ticker='BTC-USDT', timeframe='1h', quantity=Decimal('1.23456789'),
+                                quantity_usdt=Decimal('123.456789'), avg_buy_price=100)
+        self.assertEqual(execute_signal('BTC-USDT', 'SELL', '1h'), ({'status': 'success'}, 200))
+        self.assertEqual(self.simulator.orders[-1]['origQty'], '1.2345')
+
+    def test_invalid_order_does_not_sink_the_batch(self):
+        results = execute_signals([Signal('BIG-USDT', 'BUY', '1h'), Signal('ODD-USDT', 'BUY', '1h')])
+        self.assertEqual([status for _, status in results], [400, 200])
+
+    def test_rules_are_loaded_in_bulk_once(self):
+        for symbol in ('BTC-USDT', 'ODD-USDT', 'BIG-USDT', 'BTC-USDT'):
+            self.contract_cache.get(symbol)
+        self.assertEqual(self.simulator.requests, 1)
+        self.assertEqual(self.contract_cache.get('ODD-USDT').step_size, Decimal('0.01'))
+
+    def test_simulator_rejects_off_step_quantities(self):
+        response = self.exchange.place_order('ODD-USDT', 'BUY', 'MARKET', 'LONG', Decimal('33.333'))
+        self.assertEqual(response['code'], INVALID_PARAMETERS)
+
+
+class ContractCacheTests(SimpleTestCase):
+    contract = {'symbol': 'BTC-USDT', 'quantityPrecision': 4, 'pricePrecision': 1}
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.cache = ContractCache(self.client, refresh_interval=0, retry_interval=30, miss_ttl=60)
+
+    def at(self, seconds):
+        return mock.patch('contracts.time.monotonic', return_value=seconds)
+
+    def test_failed_load_is_retried_after_a_while(self):
+        self.client.get_contracts.side_effect = requests.ConnectionError('down')
+        with self.at(0):
+            self.assertIsNone(self.cache.get('BTC-USDT'))
+            self.assertIsNone(self.cache.get('BTC-USDT'))
+        # The bulk load and the symbol's own request, neither retried right away
+        self.assertEqual(self.client.get_contracts.call_count, 2)
+
+        self.client.get_contracts.side_effect = None
+        self.client.get_contracts.return_value = [self.contract]
+        with self.at(31):
+            self.assertEqual(self.cache.get('BTC-USDT').step_size, Decimal('0.0001'))
+
+    def test_empty_load_is_a_failure(self):
+        self.client.get_contracts.return_value = []
+        with self.assertRaises(ValueError):
+            self.cache.load()
+        self.assertTrue(self.cache.stale())
+
+    def test_unknown_symbols_are_remembered_briefly(self):
+        self.client.get_contracts.side_effect = lambda symbol=None: [] if symbol else [self.contract]
+        with self.at(0):
+            self.assertIsNone(self.cache.get('NOPE-USDT'))
+            self.assertIsNone(self.cache.get('NOPE-USDT'))
+        self.assertEqual(self.client.get_contracts.call_count, 2)
+        with self.at(61):
+            self.cache.get('NOPE-USDT')
+        self.assertEqual(self.client.get_contracts.call_count, 3)
+
+
+class AsyncWebhookTests(SimulatedExchangeMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('webhooks.trading.get_async_client',
+                             return_value=self.simulator.attach(AsyncBingXClient('key', 'secret')))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        trading_settings.invalidate()
+        self.tradingview = AsyncClient(client=['52.89.214.238', 0])
+
+    async def alert(self, side, ticker='BTC-USDT', client=None):
+        body = f"ticker: {ticker}\nside: {side}\ntimeframe: 1h\n"
+        return await (client or self.tradingview).post('/webhook/async/', body, content_type='text/plain')
+
+    async def test_alerts_open_and_close_a_position(self):
+        response = await self.alert('BUY')
+        self.assertEqual((response.status_code, response.json()), (200, {'status': 'success'}))
+        position = await Position.objects.aget(ticker='BTC-USDT', closed_at__isnull=True)
+        self.assertEqual(position.avg_buy_price, Decimal('100'))
+
+        self.assertEqual((await self.alert('SELL')).status_code, 200)
+        await position.arefresh_from_db()
+        self.assertIsNotNone(position.closed_at)
+        self.assertEqual([order['side'] for order in self.simulator.orders], ['BUY', 'SELL'])
+
+    async def test_duplicate_alert_is_answered_with_the_original_result(self):
+        responses = [await self.alert('BUY') for _ in range(2)]
+        self.assertEqual([response.json() for response in responses], [{'status': 'success'}] * 2)
+        self.assertEqual(len(self.simulator.orders), 1)
+
+    async def test_batch_payload(self):
+        body = b'[{"ticker": "BTC-USDT", "side": "BUY", "timeframe": "1h"},' \
+               b' {"ticker": "BTC-USDT", "side": "SELL", "timeframe": "4h"}]'
+        response = await self.tradingview.post('/webhook/async/', body, content_type='application/json')
+        self.assertEqual([result['code'] for result in response.json()['results']], [200, 400])
+
+    async def test_rejected_alerts(self):
+        self.assertEqual((await self.alert('BUY', client=self.async_client)).status_code, 403)
+        self.assertEqual((await self.tradingview.get('/webhook/async/')).status_code, 405)
+
+        response = await self.tradingview.post('/webhook/async/', b'{"ticker": ', content_type='application/json')
+        self.assertEqual((response.status_code, response.json()), (400, {'status': 'Invalid JSON format'}))
+        response = await self.alert('HOLD')
+        self.assertEqual((response.status_code, response.json()), (400, {'status': 'Invalid data format'}))
+
+        response = await self.alert('SELL')
+        self.assertEqual((response.status_code, response.json()), (400, {'status': 'Position does not exist'}))
+
+        await Settings.objects.filter(key='trading_enabled').aupdate(value='false')
+        trading_settings.invalidate()
+        response = await self.alert('BUY', ticker='ETH-USDT')
+        self.assertEqual((response.status_code, response.json()), (400, {'status': 'Trading is not enabled'}))
+        self.assertEqual(self.simulator.orders, [])
+
+
+class WarmUpTests(SimulatedExchangeMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('webhooks.warmup.get_contract_cache', return_value=self.contract_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_warm_up_loads_settings_contracts_and_syncs_the_clock(self):
+        self.exchange.clock.invalidate()
+        with mock.patch('webhooks.trading.telegram_client.get_me') as get_me:
+            timings = warm_up()
+        self.assertEqual(list(timings), ['urls', 'database', 'settings', 'exchange', 'contracts', 'telegram'])
+        self.assertFalse(self.exchange.clock.stale())
+        self.assertIsNotNone(self.contract_cache.get('BTC-USDT'))
+        # Server time and contracts, nothing left to fetch on the first alert
+        self.assertEqual(self.simulator.requests, 2)
+        self.assertEqual(get_me.called, trading.telegram_client.configured)
+
+    def test_failed_steps_do_not_stop_the_worker(self):
+        self.simulator.inject_error(status=503, count=10)
+        self.assertIn('contracts', warm_up())
+
+    async def test_lifespan_startup_completes_after_warm_up(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        with mock.patch('webhooks.warmup.awarm_up') as awarm_up:
+            await with_warm_up(None)({'type': 'lifespan'}, receive, send)
+        awarm_up.assert_awaited_once()
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+class AccountFanOutTests(SimulatedExchangeMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.accounts = [Account.objects.create(name=name, api_key=name, secret_key='secret') for name in ('a', 'b')]
+        Account.objects.create(name='off', api_key='off', secret_key='secret', enabled=False)
+        self.simulators = {name: BingXSimulator(name, 'secret', latency=0.3) for name in ('a', 'b')}
+        clients = {name: simulator.attach(BingXClient(name, 'secret')) for name, simulator in self.simulators.items()}
+        patcher = mock.patch('webhooks.trading.get_client', side_effect=lambda demo, api_key=None, secret_key=None:
+                             clients.get(api_key, self.exchange))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_signal_runs_on_every_account_concurrently(self):
+        start = time.monotonic()
+        payload, status = dispatch_signal('BTC-USDT', 'BUY', '1h')
+        self.assertLess(time.monotonic() - start, 0.55)
+        self.assertEqual(status, 200)
+        self.assertEqual(set(payload['accounts']), {'a', 'b'})
+        self.assertEqual(Position.objects.filter(account__in=self.accounts).count(), 2)
+        self.assertEqual([len(simulator.orders) for simulator in self.simulators.values()], [1, 1])
+
+    def test_each_account_reports_its_own_result(self):
+        Position.objects.create(account=self.accounts[0], ticker='BTC-USDT', timeframe='1h', quantity=1,
+                                quantity_usdt=100, avg_buy_price=100)
+        self.simulators['b'].latency = 0
+        [(payload, status)] = dispatch_signals([Signal('BTC-USDT', 'BUY', '1h')])
+        self.assertEqual(status, 207)
+        self.assertEqual(payload['accounts']['a'], {'status': 'Position already exists', 'code': 400})
+        self.assertEqual(payload['accounts']['b'], {'status': 'success', 'code': 200})
+
+    def test_admin_never_shows_the_secret_key(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+        account = self.accounts[0]
+        Account.objects.filter(pk=account.pk).update(secret_key='stored-secret')
+        url = f'/admin/webhooks/account/{account.pk}/change/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'stored-secret')
+        data = {'name': 'a', 'api_key': 'a', 'enabled': 'on', 'secret_key': ''}
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        account.refresh_from_db()
+        self.assertEqual(account.secret_key, 'stored-secret')
+        self.client.post(url, {**data, 'secret_key': 'rotated'})
+        account.refresh_from_db()
+        self.assertEqual(account.secret_key, 'rotated')
+
+        response = self.client.post('/admin/webhooks/account/add/', {**data, 'name': 'c'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Account.objects.filter(name='c').exists())
+
+    def test_without_accounts_the_environment_account_trades(self):
+        Account.objects.update(enabled=False)
+        self.assertEqual(dispatch_signal('BTC-USDT', 'BUY', '1h'), ({'status': 'success'}, 200))
+        self.assertTrue(Position.objects.filter(account__isnull=True).exists())
+
+
+class AccountCredentialsTests(TestCase):
+    def setUp(self):
+        Settings.objects.create(key='trading_enabled', value='true')
+        Settings.objects.create(key='position_usdt', value='100')
+        trading_settings.invalidate()
+        self.account = Account.objects.create(name='main', api_key='main', secret_key='secret')
+        environ = mock.patch.dict(os.environ)
+        environ.start()
+        self.addCleanup(environ.stop)
+        for name in ('API_KEY', 'SECRET_KEY'):
+            os.environ.pop(name, None)
+        for reset in (bingx_client._reset_clients, contracts._reset_caches, price_cache._reset_caches):
+            reset()
+            self.addCleanup(reset)
+        # Cleanups run last in first, the poller stops before its cache is dropped
+        self.addCleanup(lambda: [cache.stop() for cache in price_cache._caches.values()])
+        # Only the transport is swapped, the clients and caches come from the real factories
+        self.simulator = BingXSimulator('main', 'secret', prices={'BTC-USDT': PricePath([100])})
+        self.simulator.attach(bingx_client.get_market_client())
+        self.simulator.attach(bingx_client.get_client(api_key='main', secret_key='secret'))
+
+    def test_account_trades_without_environment_keys(self):
+        with self.assertRaises(ValueError):
+            bingx_client.get_client()
+        with self.assertRaises(ValueError):
+            bingx_client.get_market_client().get_positions()
+        self.assertEqual(execute_signal('BTC-USDT', 'BUY', '1h', account=self.account), ({'status': 'success'}, 200))
+        self.assertEqual(dispatch_signal('BTC-USDT', 'SELL', '1h')[1], 200)
+        self.assertEqual([order['side'] for order in self.simulator.orders], ['BUY', 'SELL'])
+
+
+class PositionLockTests(SimulatedExchangeMixin, TransactionTestCase):
+    def fire(self, alerts):
+        def run(alert):
+            try:
+                return execute_signal(*alert)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(alerts)) as pool:
+            return list(pool.map(run, alerts))
+
+    def test_conflicting_buys_place_one_order(self):
+        self.simulator.latency = 0.05
+        results = self.fire([('BTC-USDT', 'BUY', '1h')] * 6)
+        statuses = sorted(payload['status'] for payload, _ in results)
+        self.assertEqual(statuses, ['Position already exists'] * 5 + ['success'])
+        self.assertEqual(len(self.simulator.orders), 1)
+
+    def test_conflicting_sells_close_once(self):
+        execute_signal('BTC-USDT', 'BUY', '1h')
+        self.simulator.latency = 0.05
+        results = self.fire([('BTC-USDT', 'SELL', '1h')] * 4)
+        self.assertEqual(sum(status == 200 for _, status in results), 1)
+        self.assertEqual([order['side'] for order in self.simulator.orders], ['BUY', 'SELL'])
+
+    def test_unrelated_tickers_run_in_parallel(self):
+        self.simulator.latency = 0.2
+        start = time.monotonic()
+        results = self.fire([(f'S{i}-USDT', 'BUY', '1h') for i in range(4)])
+        # Sequentially this takes 4 alerts x 2 round trips x 0.2s
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual([status for _, status in results], [200] * 4)
+
+
+class WebhookJobTests(SimulatedExchangeMixin, TransactionTestCase):
+    prices = {f'S{i}-USDT': [100] for i in range(3)}
+
+    def enqueue(self, *tickers):
+        return [enqueue(b'', Signal(ticker, 'BUY', '1h')) for ticker in tickers]
+
+    def test_queued_endpoint_stores_the_alert(self):
+        body = b'{"ticker": "S0-USDT", "side": "BUY", "timeframe": "1h"}'
+        responses = [self.client.post('/webhook/queued/', body, content_type='application/json',
+                                      REMOTE_ADDR='52.89.214.238') for _ in range(2)]
+        self.assertEqual([response.status_code for response in responses], [202, 202])
+        job = WebhookJob.objects.get()
+        # The duplicate gets the original answer instead of a second job
+        self.assertEqual([response.json() for response in responses], [{'status': 'queued', 'job_id': job.pk}] * 2)
+        self.assertEqual((job.status, job.body, job.signal['ticker']), (WebhookJob.PENDING, body.decode(), 'S0-USDT'))
+        self.assertEqual(self.simulator.orders, [])
+
+    def test_jobs_are_claimed_once_oldest_first(self):
+        first, second = self.enqueue('S0-USDT', 'S1-USDT')
+        self.assertEqual([claim_job().pk, claim_job().pk, claim_job()], [first.pk, second.pk, None])
+        self.assertEqual(set(WebhookJob.objects.values_list('status', flat=True)), {WebhookJob.RUNNING})
+
+    @skipUnless(connection.vendor == 'postgresql', 'SKIP LOCKED needs PostgreSQL')
+    def test_locked_jobs_are_skipped(self):
+        first, second = self.enqueue('S0-USDT', 'S1-USDT')
+        with transaction.atomic():
+            WebhookJob.objects.select_for_update().get(pk=first.pk)
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                claimed = pool.submit(lambda: (claim_job(), connection.close())[0]).result()
+        self.assertEqual(claimed.pk, second.pk)
+
+    def test_failed_jobs_are_recorded(self):
+        job, = self.enqueue('S0-USDT')
+        with mock.patch('webhooks.jobs.dispatch_signal', side_effect=RuntimeError('exchange down')):
+            self.assertTrue(process_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (WebhookJob.FAILED, {'status': 'error', 'error': 'exchange down'}))
+
+        job, = self.enqueue('S1-USDT')
+        # Losing the connection while saving the result
+        with mock.patch('webhooks.jobs.run_job', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            process_next_job()
+        job.refresh_from_db()
+        self.assertEqual(job.status, WebhookJob.FAILED)
+
+    def test_stale_jobs_are_failed(self):
+        job, = self.enqueue('S0-USDT')
+        claim_job()
+        self.assertEqual(expire_stale_jobs(lease=60), 0)
+        WebhookJob.objects.update(claimed_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(expire_stale_jobs(lease=60), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, WebhookJob.FAILED)
+
+    def test_workers_drain_the_queue(self):
+        self.enqueue('S0-USDT', 'S1-USDT', 'S2-USDT')
+        call_command('process_webhooks', '--once', '--workers', '2', stdout=io.StringIO())
+        self.assertEqual(list(WebhookJob.objects.values_list('status', 'result_status')),
+                         [(WebhookJob.DONE, 200)] * 3)
+        self.assertEqual(Position.objects.filter(closed_at__isnull=True).count(), 3)
+
+    def test_sigterm_stops_the_workers(self):
+        self.enqueue('S0-USDT')
+        stdout = io.StringIO()
+        timer = threading.Timer(0.5, os.kill, (os.getpid(), SIGTERM))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        call_command('process_webhooks', '--workers', '2', '--poll-interval', '0.05', stdout=stdout)
+        self.assertIn('Stopping webhook workers on SIGTERM', stdout.getvalue())
+        self.assertEqual(WebhookJob.objects.get().status, WebhookJob.DONE)
+
+
+
+class PositionMigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('webhooks', target)])
+        return executor.loader.project_state([('webhooks', target)]).apps.get_model('webhooks', 'Position')
+
+    def test_duplicate_open_positions_are_merged_before_the_constraint(self):
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(
+            MigrationExecutor(connection).loader.graph.leaf_nodes()))
+        OldPosition = self.migrate('0005_settings_key_unique')
+        for timeframe, quantity, price in (('1h', 1, 100), ('1h', 3, 120), ('4h', 1, 100)):
+            OldPosition.objects.create(ticker='BTC-USDT', timeframe=timeframe, quantity=quantity,
+                                       quantity_usdt=quantity * price, avg_buy_price=price)
+
+        NewPosition = self.migrate('0006_position_indexes')
+        merged = NewPosition.objects.get(timeframe='1h')
+        self.assertEqual((merged.quantity, merged.quantity_usdt, merged.avg_buy_price),
+                         (Decimal('4'), Decimal('460'), Decimal('115')))
+        self.assertEqual(NewPosition.objects.count(), 2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            NewPosition.objects.create(ticker='BTC-USDT', timeframe='1h', quantity=1, quantity_usdt=100,
+                                       avg_buy_price=100)
+
+
+class BacktestTests(SimpleTestCase):
+    prices = [100, 105, 95, 110, 110, 120, 130]
+
+    def setUp(self):
+        minutes = [i * 60 for i in range(len(self.prices))]
+        self.candles = {'BTC-USDT': Candles([m * 1000 for m in minutes], self.prices, self.prices, self.prices,
+                                            self.prices)}
+        sides = ['BUY', 'BUY', 'SELL', 'SELL', 'SELL', 'BUY']
+        self.signals = Signals.from_records((m, 'BTC-USDT', side, '1h') for m, side in zip(minutes, sides))
+
+    def test_replays_the_trading_rules(self):
+        result = backtest(self.candles, self.signals, position_usdt=100)
+        first, second = result.records()
+        # The second BUY is ignored, the SELL at 95 holds the position until the one at 110
+        self.assertEqual((first['avg_buy_price'], first['avg_sell_price']), (Decimal('100.0'), Decimal('110.0')))
+        self.assertEqual(first['closed_at'] - first['created_at'], timedelta(minutes=3))
+        self.assertEqual((second['avg_buy_price'], second['closed_at']), (Decimal('120.0'), None))
+        summary = result.summary()
+        self.assertEqual((summary['positions'], summary['closed'], summary['wins']), (2, 1, 1))
+        self.assertAlmostEqual(summary['total_pnl'], 10)
+        self.assertAlmostEqual(summary['unrealized_pnl'], 100 / 120 * 10)
+
+    def test_slippage_fees_and_selling_below_buy(self):
+        result = backtest(self.candles, self.signals, position_usdt=100, slippage=0.01, fee_rate=0.001,
+                          sell_below_buy=True)
+        summary = result.summary()
+        self.assertEqual(summary['closed'], 1)
+        # Bought at 101, sold at 95 x 0.99, fees on both fills
+        fees = 0.001 * (101 + 95 * 0.99)
+        self.assertAlmostEqual(summary['total_pnl'], 95 * 0.99 - 101 - fees)
+        self.assertAlmostEqual(summary['max_drawdown'], -summary['total_pnl'])
+
+    def test_sweep_runs_on_a_process_pool(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(f'{directory}/ETH-USDT.csv', 'w') as f:
+            f.write('timestamp,open,high,low,close,volume\n')
+            for i in range(400):
+                price = 100 + 10 * ((i // 25) % 2) + i % 25 * 0.1
+                f.write(f'{1_700_000_000 + i * 60},{price},{price},{price},{price},1\n')
+        store = CandleStore.build(f'{directory}/store', {'ETH-USDT': f'{directory}/ETH-USDT.csv'})
+        grid = {'fast': [2, 5], 'slow': [10, 20], 'slippage': [0, 0.001]}
+        results = sweep(store, grid, workers=2, position_usdt=100)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(results, sweep(store, grid, workers=1, position_usdt=100))
+        totals = [summary['total_pnl'] for _, summary in results]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+        self.assertGreater(results[0][1]['positions'], 0)
+
+
+class AuditLogTests(SimulatedExchangeMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Written from the test thread by flush, inside the test transaction
+        self.audit_log = AuditLog(enabled=True)
+        self.audit_log._ensure_started = lambda: None
+        for target in ('webhooks.trading.audit_log', 'webhooks.views.audit_log'):
+            patcher = mock.patch(target, self.audit_log)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_alert_and_order_are_recorded(self):
+        body = b'{"ticker": "BTC-USDT", "side": "BUY", "timeframe": "1h"}'
+        response = self.client.post('/webhook/', body, content_type='application/json',
+                                    REMOTE_ADDR='52.89.214.238')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AuditEvent.objects.count(), 0)
+        self.audit_log.flush()
+
+        order, alert = AuditEvent.objects.order_by('created_at')
+        self.assertEqual((alert.kind, alert.source, alert.status, alert.outcome), ('alert', 'webhook', 200, 'ok'))
+        self.assertEqual((alert.ticker, alert.side, alert.request), ('BTC-USDT', 'BUY', body.decode()))
+        self.assertEqual(alert.response, {'status': 'success'})
+        self.assertEqual((order.kind, order.status, order.outcome), ('order', 0, 'ok'))
+        self.assertEqual(Decimal(order.request['quantity']), 1)
+        self.assertEqual(Decimal(order.response['data']['order']['avgPrice']), 100)
+        self.assertGreater(alert.duration_ms, order.duration_ms)
+
+    def test_full_queue_drops_events(self):
+        audit_log = AuditLog(enabled=True, max_queue=2)
+        audit_log._ensure_started = lambda: None
+        for _ in range(3):
+            audit_log.record(AuditEvent.ALERT, 'ok', source='webhook')
+        audit_log.flush()
+        self.assertEqual(AuditEvent.objects.count(), 2)
+
+    def test_expired_events_are_deleted(self):
+        AuditEvent.objects.create(kind=AuditEvent.ALERT, outcome='ok', created_at=timezone.now() - timedelta(days=40))
+        AuditEvent.objects.create(kind=AuditEvent.ALERT, outcome='ok')
+        call_command('audit_partitions', retention_days=30, stdout=open(os.devnull, 'w'))
+        self.assertEqual(AuditEvent.objects.count(), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning needs PostgreSQL')
+    def test_monthly_partition_receives_its_events_until_expired(self):
+        month = (timezone.now() - timedelta(days=100)).date().replace(day=1)
+        name = partition_name(month)
+        table = AuditEvent._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+            self.assertEqual(cursor.fetchone(), ('p',))
+
+            early = AuditEvent.objects.create(kind=AuditEvent.ALERT, outcome='ok',
+                                              created_at=datetime(month.year, month.month, 2, tzinfo=dt_timezone.utc))
+            self.assertEqual(create_partitions(months_ahead=0, today=month), [name])
+            late = AuditEvent.objects.create(kind=AuditEvent.ALERT, outcome='ok',
+                                             created_at=datetime(month.year, month.month, 20, tzinfo=dt_timezone.utc))
+            cursor.execute(f'SELECT id FROM "{name}" ORDER BY id')
+            self.assertEqual(cursor.fetchall(), [(early.id,), (late.id,)])
+            cursor.execute(f'SELECT count(*) FROM "{table}_default"')
+            self.assertEqual(cursor.fetchone(), (0,))
+
+            self.assertEqual(drop_expired(retention_days=40), {'dropped': [name], 'deleted': 0})
+            cursor.execute("SELECT to_regclass(%s)", [name])
+            self.assertEqual(cursor.fetchone(), (None,))
+        self.assertFalse(AuditEvent.objects.exists())
+
+
+class AuditWriterTests(SimpleTestCase):
+    def test_background_writer_batches_inserts(self):
+        audit_log = AuditLog(enabled=True, batch_size=3, flush_interval=0.2)
+        # Patched on this log only, the shared one may be writing from its own thread
+        with mock.patch.object(audit_log, '_write') as write:
+            for _ in range(5):
+                audit_log.record(AuditEvent.ALERT, 'ok', source='webhook')
+            audit_log._queue.join()
+        self.assertEqual([len(call.args[0]) for call in write.call_args_list], [3, 2])
+
+
+class ReconciliationTests(SimulatedExchangeMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('webhooks.reconcile.notifier')
+        self.notifier = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_position_closed_by_hand_is_closed_at_its_fill(self):
+        execute_signal('BTC-USDT', 'BUY', '1h')
+        sold = self.simulator.close_by_hand('BTC-USDT')
+
+        report, = reconcile_accounts(dry_run=True)
+        self.assertEqual(len(report['closed']), 1)
+        self.assertIsNone(Position.objects.get().closed_at)
+        self.assertFalse(ReconciliationCursor.objects.exists())
+
+        report, = reconcile_accounts()
+        self.assertEqual((report['orders'], len(report['closed']), report['flagged']), (2, 1, []))
+        position = Position.objects.get()
+        self.assertEqual(position.avg_sell_price, Decimal(sold['avgPrice']))
+        self.assertEqual(PnlRollup.objects.get().trades, 1)
+        cursor = ReconciliationCursor.objects.get(account=None, demo=False)
+
+        # The next pass starts from the cursor and finds nothing left to do
+        report, = reconcile_accounts()
+        self.assertEqual((report['positions'], report['closed'], report['flagged']), (0, [], []))
+        self.assertGreaterEqual(ReconciliationCursor.objects.get().order_time, cursor.order_time)
+        self.notifier.enqueue.assert_not_called()
+
+    def test_other_mismatches_are_flagged(self):
+        self.exchange.place_order('ETH-USDT', 'BUY', 'MARKET', 'LONG', Decimal('1'))
+        Position.objects.create(ticker='SOL-USDT', timeframe='1h', quantity=1, quantity_usdt=100, avg_buy_price=100)
+        execute_signal('BTC-USDT', 'BUY', '1h')
+        self.simulator.positions['BTC-USDT'] = (Decimal('0.5'), Decimal('100'))
+
+        report, = reconcile_accounts()
+        self.assertEqual(report['closed'], [])
+        self.assertEqual([flag.split(':')[0] for flag in report['flagged']], ['BTC-USDT', 'ETH-USDT', 'SOL-USDT'])
+        self.assertEqual(Position.objects.filter(closed_at__isnull=True).count(), 2)
+        self.notifier.enqueue.assert_called_once()
+
+    def test_endpoints_are_compared_with_their_own_positions(self):
+        execute_signal('BTC-USDT', 'BUY', '1h')
+        # Opened on demo, the live endpoint holding nothing for it isn't a mismatch
+        Position.objects.create(ticker='ETH-USDT', timeframe='1h', quantity=1, quantity_usdt=100, avg_buy_price=100,
+                                demo=True)
+        report, = reconcile_accounts()
+        self.assertEqual((report['positions'], report['closed'], report['flagged']), (1, [], []))
+
+    def test_order_history_is_paged(self):
+        for _ in range(5):
+            self.simulator.clock_offset += 10
+            self.exchange.place_order('BTC-USDT', 'BUY', 'MARKET', 'LONG', Decimal('1'))
+        now = self.simulator.now()
+        requests_before = self.simulator.requests
+        with mock.patch('webhooks.reconcile.MAX_ORDERS_PAGE', 2):
+            orders = fetch_orders(self.exchange, now - 3600 * 1000, now)
+        self.assertEqual([order['orderId'] for order in orders], [1, 2, 3, 4, 5])
+        # Each full page is continued from its last update, the boundary order is read twice
+        self.assertEqual(self.simulator.requests - requests_before, 5)
+
+
+class PositionExportTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        for ticker, sell in (('BTC-USDT', '110'), ('ETH-USDT', '95'), ('BTC-USDT', None)):
+            Position.objects.create(ticker=ticker, timeframe='1h', quantity=Decimal('2'), quantity_usdt=Decimal('200'),
+                                    avg_buy_price=Decimal('100'), avg_sell_price=sell,
+                                    closed_at=timezone.now() if sell else None)
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_streams_csv_in_chunks(self):
+        with mock.patch('webhooks.export.EXPORT_CHUNK_SIZE', 1):
+            response = self.client.get('/export/positions/', {'ticker': 'BTC-USDT'})
+            self.assertTrue(response.streaming)
+            chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 2)
+        header, closed, still_open = b''.join(chunks).decode().splitlines()
+        self.assertTrue(header.startswith('id,account,ticker,timeframe'))
+        self.assertIn(',100,110,20,10,', closed)
+        self.assertIn(',100,,,,', still_open)
+
+    def test_parquet_round_trip(self):
+        import pyarrow.parquet as pq
+
+        today = timezone.now().date().isoformat()
+        content = self.content(self.client.get('/export/positions/', {'format': 'parquet', 'from': today, 'to': today}))
+        table = pq.read_table(io.BytesIO(content))
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.column('profit').to_pylist()[:2], [Decimal('20'), Decimal('-10')])
+        self.assertEqual(table.column('profit_rate').to_pylist()[1], Decimal('-5'))
+
+    def test_filters_and_access(self):
+        yesterday = (timezone.now() - timedelta(days=1)).date().isoformat()
+        content = self.content(self.client.get('/export/positions/', {'to': yesterday}))
+        self.assertEqual(len(content.decode().splitlines()), 1)
+        self.assertEqual(self.client.get('/export/positions/', {'format': 'xlsx'}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get('/export/positions/').status_code, 302)
+
+    def test_admin_action(self):
+        ids = Position.objects.filter(ticker='ETH-USDT').values_list('pk', flat=True)
+        response = self.client.post('/admin/webhooks/position/', {
+            'action': 'export_csv', '_selected_action': list(ids),
+        })
+        rows = self.content(response).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertIn('ETH-USDT', rows[1])
+
+
+class TriggerBookTests(SimpleTestCase):
+    def test_take_profit_and_stop_loss(self):
+        book = TriggerBook()
+        for position_id in range(100):
+            book.add(position_id, 'BTC-USDT', Decimal(100), take_profit=Decimal(110 + position_id),
+                     stop_loss=Decimal(90 - position_id))
+        self.assertEqual(book.on_price('BTC-USDT', Decimal(100)), [])
+        self.assertEqual(book.on_price('ETH-USDT', Decimal(1)), [])
+        fired = book.on_price('BTC-USDT', Decimal(112))
+        self.assertEqual([(exit.position_id, exit.reason) for exit in fired], [(0, 'take_profit'), (1, 'take_profit'),
+                                                                               (2, 'take_profit')])
+        # Fired positions and discarded ones aren't watched anymore, the highest stop-loss fires first
+        book.discard(3)
+        fired = book.on_price('BTC-USDT', Decimal(85))
+        self.assertEqual([(exit.position_id, exit.reason, exit.level) for exit in fired],
+                         [(4, 'stop_loss', Decimal(86)), (5, 'stop_loss', Decimal(85))])
+        self.assertEqual(len(book), 94)
+
+    def test_trailing_stops_follow_the_highest_price(self):
+        book = TriggerBook()
+        book.add(1, 'BTC-USDT', Decimal(100), trailing_stop=Decimal('0.1'))
+        book.add(2, 'BTC-USDT', Decimal(100), trailing_stop=Decimal('0.05'))
+        book.add(3, 'BTC-USDT', Decimal(105), trailing_stop=Decimal('0.05'), stop_loss=Decimal(80))
+        for price in (101, 110, 130, 125):
+            self.assertEqual(book.on_price('BTC-USDT', Decimal(price)), [])
+        # Every group below the new highs was merged into one
+        self.assertEqual(len(book._tickers['BTC-USDT'].groups), 1)
+        fired = book.on_price('BTC-USDT', Decimal('123'))
+        self.assertEqual(sorted((exit.position_id, exit.level) for exit in fired),
+                         [(2, Decimal('123.50')), (3, Decimal('123.50'))])
+        self.assertEqual([exit.reason for exit in fired], ['trailing_stop'] * 2)
+        self.assertEqual([exit.position_id for exit in book.on_price('BTC-USDT', Decimal(79))], [1])
+        self.assertEqual(len(book), 0)
+        book.compact()
+        self.assertEqual(book._tickers, {})
+
+
+class ExitEngineTests(SimulatedExchangeMixin, TestCase):
+    prices = {'BTC-USDT': [100, 100, 90]}
+
+    def setUp(self):
+        super().setUp()
+        Settings.objects.create(key='stop_loss_pct', value='5')
+        patcher = mock.patch('webhooks.exits.get_price_cache', return_value=self.price_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.engine = ExitEngine(sync_interval=0)
+
+    def test_stop_loss_sells_below_the_buy_price(self):
+        self.assertEqual(execute_signal('BTC-USDT', 'BUY', '1h'), ({'status': 'success'}, 200))
+        position = Position.objects.get()
+        self.assertEqual((position.stop_loss, position.take_profit, position.demo), (Decimal(95), None, False))
+        # A SELL alert is refused below the buy price
+        self.assertEqual(execute_signal('BTC-USDT', 'SELL', '1h')[1], 400)
+
+        self.engine.sync()
+        self.price_cache.update('BTC-USDT', Decimal(96))
+        self.assertEqual(self.engine.run_fired(), [])
+        self.price_cache.update('BTC-USDT', Decimal(94))
+        (exit, result), = self.engine.run_fired()
+        self.assertEqual((exit.reason, result), ('stop_loss', ({'status': 'success'}, 200)))
+        position.refresh_from_db()
+        self.assertEqual(position.avg_sell_price, Decimal(90))
+        self.assertIsNotNone(position.closed_at)
+
+    def test_sync_follows_edits_and_closes(self):
+        execute_signal('BTC-USDT', 'BUY', '1h')
+        position = Position.objects.get()
+        self.engine.sync()
+        position.stop_loss = None
+        position.take_profit = Decimal(120)
+        position.save()
+        self.engine.sync()
+        self.price_cache.update('BTC-USDT', Decimal(80))
+        self.assertEqual(self.engine.run_fired(), [])
+        self.assertIn(position.pk, self.engine.books[False])
+
+        close_position_record(position, '110')
+        self.engine.sync()
+        self.assertNotIn(position.pk, self.engine.books[False])
+
+    def test_sync_keeps_the_trailing_high(self):
+        execute_signal('BTC-USDT', 'BUY', '1h')
+        position = Position.objects.get()
+        position.trailing_stop = Decimal('0.1')
+        position.save()
+        book = self.engine.books[False]
+        self.engine.sync()
+        self.price_cache.update('BTC-USDT', Decimal(120))
+        # Unchanged positions read again aren't re-added, edited ones keep their high
+        self.engine.sync()
+        self.assertEqual(book.high_of(position.pk), Decimal(120))
+        position.take_profit = Decimal(200)
+        position.save()
+        self.engine.sync()
+        self.assertEqual(book.high_of(position.pk), Decimal(120))
+        self.price_cache.update('BTC-USDT', Decimal(107))
+        (exit, _), = self.engine.run_fired()
+        self.assertEqual((exit.reason, exit.level), ('trailing_stop', Decimal(108)))
+
+    def test_fired_exit_is_not_rearmed_before_it_closes(self):
+        execute_signal('BTC-USDT', 'BUY', '1h')
+        self.engine.sync()
+        self.price_cache.update('BTC-USDT', Decimal(94))
+        self.engine.sync()
+        self.price_cache.update('BTC-USDT', Decimal(93))
+        self.assertEqual(len(self.engine.run_fired()), 1)
+
+
+class StubResponse:
+    def __init__(self, status_code=200, body=b'{"ok": true}'):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = body.decode()
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class StubTelegramClient:
+    configured = True
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent = []
+
+    def post_message(self, text):
+        self.sent.append(text)
+        response = self.responses.pop(0) if self.responses else StubResponse()
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TelegramDispatcherTests(SimpleTestCase):
+    def dispatcher(self, client, **kwargs):
+        return TelegramDispatcher(client, **{'coalesce_window': 0.05, 'rate': 1000, 'burst': 10, **kwargs})
+
+    def test_burst_is_coalesced_into_one_message(self):
+        client = StubTelegramClient()
+        dispatcher = self.dispatcher(client, coalesce_window=0.2)
+        for i in range(3):
+            dispatcher.enqueue(f'message {i}')
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(client.sent, ['message 0\n\nmessage 1\n\nmessage 2'])
+
+    def test_rate_limited_message_is_retried(self):
+        # A 429 with a body that isn't JSON falls back to the backoff delay
+        client = StubTelegramClient(StubResponse(429, b'{"parameters": {"retry_after": 0.01}}'),
+                                    StubResponse(429, b'Too Many Requests'))
+        dispatcher = self.dispatcher(client)
+        dispatcher.enqueue('hello')
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(client.sent, ['hello'] * 3)
+
+    def test_worker_survives_errors_and_restarts(self):
+        client = StubTelegramClient(RuntimeError('unexpected'))
+        dispatcher = self.dispatcher(client)
+        dispatcher.enqueue('lost')
+        self.assertTrue(dispatcher.flush(timeout=5))
+        dispatcher.enqueue('delivered')
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(client.sent, ['lost', 'delivered'])
+        self.assertTrue(dispatcher._thread.is_alive())
+
+        # A worker that died anyway is replaced by the next enqueue
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        dispatcher._thread = dead
+        dispatcher.enqueue('again')
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(client.sent[-1], 'again')
@@ -0,0 +1,600 @@
+"""
+Trading logic shared by the webhook views.
+
+Each function returns a ``(payload, status)`` tuple that the views turn into a
+JsonResponse, so the same rules run on the WSGI and ASGI paths. The dispatch
+functions mirror a signal to every enabled Account concurrently, or trade the
+environment account when none is configured.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from bingx_client import MAX_BATCH_ORDERS, get_async_client, get_client
+from contracts import ContractSpec, InvalidOrder, get_contract_cache
+from metrics import stage
+from price_cache import get_price_cache
+from telegram_client import TelegramClient, TelegramDispatcher
+from webhooks.audit import audit_log
+from webhooks.locks import PositionLockTimeout, aposition_lock, position_lock, position_locks
+from webhooks.models import Account, AuditEvent, Position
+from webhooks.payload import Signal
+from webhooks.rollups import close_position_record
+from webhooks.settings_cache import trading_settings
+
+logger = logging.getLogger(__name__)
+telegram_client = TelegramClient(settings.TELEGRAM_BOT_TOKEN, settings.TELEGRAM_CHAT_ID)
+notifier = TelegramDispatcher(telegram_client)
+
+Result = Tuple[Dict[str, Any], int]
+
+
+class BatchFailed(Exception):
+    """
+    A batch failed part way, results holds one entry per signal, None for those that didn't get one.
+
+    Orders placed before the failure stand, their signals must not be sent again.
+    """
+
+    def __init__(self, message: str, results: List[Optional[Result]]):
+        super().__init__(message)
+        self.results = results
+
+SUCCESS = ({'status': 'success'}, 200)
+
+# Threads placing orders for different accounts at the same time
+ACCOUNT_FANOUT_WORKERS = int(os.getenv('ACCOUNT_FANOUT_WORKERS', '8'))
+
+
+def _order_failed(response: Dict[str, Any], ticker: str, time_frame: str) -> Result:
+    error_message = response['msg']
+    logger.warning(f"Failed to place order for {ticker} {time_frame}: {error_message}")
+    return {'status': 'Failed to place order', 'error': error_message}, 400
+
+
+def _lock_timeout(ticker: str, time_frame: str) -> Result:
+    logger.warning(f"Another alert for {ticker} {time_frame} is still running")
+    return {'status': 'Another alert for this position is still running'}, 409
+
+
+def _invalid_order(error: InvalidOrder, ticker: str, time_frame: str) -> Result:
+    logger.warning(f"Not placing order for {ticker} {time_frame}: {error}")
+    return {'status': 'Invalid order', 'error': str(error)}, 400
+
+
+def _order_quantity(spec: Optional[ContractSpec], quantity: Decimal, price: Decimal, opening: bool) -> Decimal:
+    """Quantize and check an order against its contract, unchanged when the rules are unknown"""
+    if spec is None:
+        return quantity
+    return spec.order_quantity(quantity, price, opening)
+
+
+def _below_buy_price(ticker: str, time_frame: str) -> Result:
+    logger.warning(f"Price is less than average buy price for {ticker} {time_frame}")
+    return {'status': 'Price is less than average buy price'}, 400
+
+
+def _account_client(account: Optional[Account], demo: bool):
+    if account is None:
+        return get_client(demo=demo)
+    return get_client(demo=account.demo, api_key=account.api_key, secret_key=account.secret_key)
+
+
+def _async_account_client(account: Optional[Account], demo: bool):
+    if account is None:
+        return get_async_client(demo=demo)
+    return get_async_client(demo=account.demo, api_key=account.api_key, secret_key=account.secret_key)
+
+
+def _position_usdt(account: Optional[Account]) -> Decimal:
+    if account is not None and account.position_usdt is not None:
+        return account.position_usdt
+    return trading_settings.position_usdt
+
+
+def _exit_levels(avg_price: Decimal) -> Dict[str, Optional[Decimal]]:
+    """Exit levels of a new position from the take_profit_pct, stop_loss_pct and trailing_stop_pct settings"""
+    take_profit = trading_settings.take_profit_pct
+    stop_loss = trading_settings.stop_loss_pct
+    return {
+        'take_profit': avg_price * (1 + take_profit) if take_profit is not None else None,
+        'stop_loss': avg_price * (1 - stop_loss) if stop_loss is not None else None,
+        'trailing_stop': trading_settings.trailing_stop_pct,
+    }
+
+
+def _market_order(ticker: str, side: str, quantity: Decimal) -> Dict[str, Any]:
+    return {'symbol': ticker, 'side': side, 'order_type': 'MARKET', 'positionSide': 'LONG', 'quantity': quantity}
+
+
+def _place_order(client, account: Optional[Account], order: Dict[str, Any]) -> Dict[str, Any]:
+    """Place an order and record it with the exchange response in the audit log"""
+    with stage('order', client.demo):
+        start = time.perf_counter()
+        try:
+            response = client.place_order(**order)
+        except Exception as e:
+            audit_log.order(AuditEvent.ORDER, client.demo, account, order, None, start, error=e)
+            raise
+    audit_log.order(AuditEvent.ORDER, client.demo, account, order, response, start)
+    return response
+
+
+async def _aplace_order(client, account: Optional[Account], order: Dict[str, Any]) -> Dict[str, Any]:
+    with stage('order', client.demo):
+        start = time.perf_counter()
+        try:
+            response = await client.place_order(**order)
+        except Exception as e:
+            audit_log.order(AuditEvent.ORDER, client.demo, account, order, None, start, error=e)
+            raise
+    audit_log.order(AuditEvent.ORDER, client.demo, account, order, response, start)
+    return response
+
+
+def execute_signal(ticker: str, side: str, time_frame: str, use_demo: bool = False,
+                   account: Account = None) -> Result:
+    """
+    Run a validated BUY/SELL signal against the exchange and the Position table.
+
+    Trades the given account, or the environment account when None.
+    """
+    with stage('settings', use_demo):
+        trading_enabled = trading_settings.trading_enabled
+    if not trading_enabled:
+        logger.warning("Trading is not enabled")
+        return {'status': 'Trading is not enabled'}, 400
+
+    client = _account_client(account, use_demo)
+
+    # The position check, the order and the Position write must not interleave with another alert
+    try:
+        with position_lock(account, ticker, time_frame):
+            if side == 'BUY':
+                return open_position(client, ticker, time_frame, account)
+            elif side == 'SELL':
+                return close_position(client, ticker, time_frame, account)
+    except PositionLockTimeout:
+        return _lock_timeout(ticker, time_frame)
+    return SUCCESS
+
+
+def open_position(client, ticker: str, time_frame: str, account: Account = None) -> Result:
+    # Only one position can be open at a time
+    with stage('position_lookup', client.demo):
+        exists = Position.objects.filter(
+            account=account, ticker=ticker, timeframe=time_frame, closed_at__isnull=True
+        ).exists()
+    if exists:
+        logger.warning(f"Position already exists for {ticker} {time_frame}")
+        return {'status': 'Position already exists'}, 400
+
+    with stage('price', client.demo):
+        price = get_price_cache(client.demo).get_price(ticker)
+    with stage('contract', client.demo):
+        spec = get_contract_cache(client.demo).get(ticker)
+    try:
+        quantity = _order_quantity(spec, _position_usdt(account) / price, price, opening=True)
+    except InvalidOrder as e:
+        return _invalid_order(e, ticker, time_frame)
+    response = _place_order(client, account, _market_order(ticker, 'BUY', quantity))
+    if not response['data']:
+        return _order_failed(response, ticker, time_frame)
+
+    avg_price = Decimal(response['data']['order']['avgPrice'])
+    executed_quantity = Decimal(response['data']['order']['executedQty'])
+    executed_quantity_usdt = avg_price * executed_quantity
+    with stage('position_write', client.demo):
+        Position.objects.create(
+            account=account,
+            ticker=ticker,
+            timeframe=time_frame,
+            avg_buy_price=avg_price,
+            quantity=executed_quantity,
+            quantity_usdt=executed_quantity_usdt,
+            demo=client.demo,
+            **_exit_levels(avg_price),
+        )
+    return SUCCESS
+
+
+def close_position(client, ticker: str, time_frame: str, account: Account = None, below_buy: bool = False) -> Result:
+    """Sell an open position, refused below its average buy price unless below_buy, e.g. for a stop-loss"""
+    try:
+        with stage('position_lookup', client.demo):
+            position = Position.objects.get(account=account, ticker=ticker, timeframe=time_frame,
+                                            closed_at__isnull=True)
+    except Position.DoesNotExist:
+        logger.warning(f"Position does not exist for {ticker} {time_frame}")
+        return {'status': 'Position does not exist'}, 400
+
+    with stage('price', client.demo):
+        price = get_price_cache(client.demo).get_price(ticker)
+    if price < position.avg_buy_price and not below_buy:
+        with stage('notify', client.demo):
+            notifier.enqueue(f"Price is less than average buy price for {ticker} {time_frame}")
+        return _below_buy_price(ticker, time_frame)
+
+    with stage('contract', client.demo):
+        spec = get_contract_cache(client.demo).get(ticker)
+    try:
+        quantity = _order_quantity(spec, position.quantity, price, opening=False)
+    except InvalidOrder as e:
+        return _invalid_order(e, ticker, time_frame)
+    response = _place_order(client, account, _market_order(ticker, 'SELL', quantity))
+    if not response['data']:
+        return _order_failed(response, ticker, time_frame)
+
+    avg_price = response['data']['order']['avgPrice']
+    with stage('position_write', client.demo):
+        close_position_record(position, avg_price)
+    return SUCCESS
+
+
+def execute_signals(signals: List[Signal], account: Account = None) -> List[Result]:
+    """
+    Run a batch of signals, returning one result per signal in the same order.
+
+    Open positions are looked up in one query, prices come from one bulk
+    request and orders go out through batchOrders, MAX_BATCH_ORDERS at a time.
+    """
+    with stage('settings'):
+        trading_enabled = trading_settings.trading_enabled
+    if not trading_enabled:
+        logger.warning("Trading is not enabled")
+        return [({'status': 'Trading is not enabled'}, 400)] * len(signals)
+
+    results: List[Optional[Result]] = [None] * len(signals)
+    try:
+        with position_locks(account, ((signal.ticker, signal.timeframe) for signal in signals)):
+            for demo in sorted({signal.use_demo for signal in signals}):
+                indexes = [index for index, signal in enumerate(signals) if signal.use_demo == demo]
+                _execute_batch(_account_client(account, demo), signals, indexes, results, account)
+    except PositionLockTimeout:
+        logger.warning("Another alert for a position of the batch is still running")
+        return [({'status': 'Another alert for this position is still running'}, 409)] * len(signals)
+    except Exception as e:
+        raise BatchFailed(str(e), results) from e
+    return results
+
+
+def _execute_batch(client, signals: List[Signal], indexes: List[int], results: List[Optional[Result]],
+                   account: Optional[Account]):
+    seen = set()
+    candidates = []
+    for index in indexes:
+        signal = signals[index]
+        if (signal.ticker, signal.timeframe) in seen:
+            results[index] = {'status': 'Duplicate signal in batch'}, 400
+        else:
+            seen.add((signal.ticker, signal.timeframe))
+            candidates.append(index)
+
+    with stage('position_lookup', client.demo):
+        positions = {
+            (position.ticker, position.timeframe): position
+            for position in Position.objects.filter(
+                account=account, closed_at__isnull=True, ticker__in={signals[index].ticker for index in candidates}
+            )
+        }
+
+    pending = []
+    for index in candidates:
+        signal = signals[index]
+        position = positions.get((signal.ticker, signal.timeframe))
+        if signal.side == 'BUY' and position is not None:
+            logger.warning(f"Position already exists for {signal.ticker} {signal.timeframe}")
+            results[index] = {'status': 'Position already exists'}, 400
+        elif signal.side == 'SELL' and position is None:
+            logger.warning(f"Position does not exist for {signal.ticker} {signal.timeframe}")
+            results[index] = {'status': 'Position does not exist'}, 400
+        else:
+            pending.append(index)
+    if not pending:
+        return
+
+    with stage('price', client.demo):
+        prices = get_price_cache(client.demo).get_prices({signals[index].ticker for index in pending})
+    with stage('contract', client.demo):
+        contract_cache = get_contract_cache(client.demo)
+        specs = {ticker: contract_cache.get(ticker) for ticker in prices}
+    position_usdt = _position_usdt(account)
+
+    orders = []
+    for index in pending:
+        signal = signals[index]
+        price = prices[signal.ticker]
+        if signal.side == 'BUY':
+            quantity = position_usdt / price
+        else:
+            position = positions[(signal.ticker, signal.timeframe)]
+            if price < position.avg_buy_price:
+                with stage('notify', client.demo):
+                    notifier.enqueue(f"Price is less than average buy price for {signal.ticker} {signal.timeframe}")
+                results[index] = _below_buy_price(signal.ticker, signal.timeframe)
+                continue
+            quantity = position.quantity
+        # BingX rejects a batch as a whole, an invalid order must not take the others down
+        try:
+            quantity = _order_quantity(specs[signal.ticker], quantity, price, opening=signal.side == 'BUY')
+        except InvalidOrder as e:
+            results[index] = _invalid_order(e, signal.ticker, signal.timeframe)
+            continue
+        order = _market_order(signal.ticker, signal.side, quantity)
+        orders.append((index, {**order, 'clientOrderID': uuid.uuid4().hex}))
+
+    for offset in range(0, len(orders), MAX_BATCH_ORDERS):
+        chunk = orders[offset:offset + MAX_BATCH_ORDERS]
+        with stage('order', client.demo):
+            start = time.perf_counter()
+            batch = [order for _, order in chunk]
+            try:
+                response = client.place_batch_orders(batch)
+            except Exception as e:
+                audit_log.order(AuditEvent.BATCH_ORDER, client.demo, account, batch, None, start, error=e)
+                raise
+        audit_log.order(AuditEvent.BATCH_ORDER, client.demo, account, batch, response, start)
+        if not response['data']:
+            for index, _ in chunk:
+                results[index] = _order_failed(response, signals[index].ticker, signals[index].timeframe)
+            continue
+
+        fills = {fill.get('clientOrderID'): fill for fill in response['data']['orders']}
+        for index, order in chunk:
+            signal = signals[index]
+            fill = fills.get(order['clientOrderID'])
+            if fill is None:
+                results[index] = _order_failed(
+                    {'msg': 'Order missing from the batch response'}, signal.ticker, signal.timeframe
+                )
+                continue
+            with stage('position_write', client.demo):
+                if signal.side == 'BUY':
+                    avg_price = Decimal(fill['avgPrice'])
+                    executed_quantity = Decimal(fill['executedQty'])
+                    Position.objects.create(
+                        account=account,
+                        ticker=signal.ticker,
+                        timeframe=signal.timeframe,
+                        avg_buy_price=avg_price,
+                        quantity=executed_quantity,
+                        quantity_usdt=avg_price * executed_quantity,
+                        demo=client.demo,
+                        **_exit_levels(avg_price),
+                    )
+                else:
+                    close_position_record(positions[(signal.ticker, signal.timeframe)], fill['avgPrice'])
+            results[index] = SUCCESS
+
+
+async def aexecute_signal(ticker: str, side: str, time_frame: str, use_demo: bool = False,
+                          account: Account = None) -> Result:
+    """
+    Async counterpart of execute_signal, using the async BingX client and async ORM calls.
+    """
+    with stage('settings', use_demo):
+        await trading_settings.aload()
+        trading_enabled = trading_settings.trading_enabled
+    if not trading_enabled:
+        logger.warning("Trading is not enabled")
+        return {'status': 'Trading is not enabled'}, 400
+
+    client = _async_account_client(account, use_demo)
+
+    try:
+        async with aposition_lock(account, ticker, time_frame):
+            if side == 'BUY':
+                return await aopen_position(client, ticker, time_frame, account)
+            elif side == 'SELL':
+                return await aclose_position(client, ticker, time_frame, account)
+    except PositionLockTimeout:
+        return _lock_timeout(ticker, time_frame)
+    return SUCCESS
+
+
+async def aopen_position(client, ticker: str, time_frame: str, account: Account = None) -> Result:
+    # Only one position can be open at a time
+    with stage('position_lookup', client.demo):
+        exists = await Position.objects.filter(
+            account=account, ticker=ticker, timeframe=time_frame, closed_at__isnull=True
+        ).aexists()
+    if exists:
+        logger.warning(f"Position already exists for {ticker} {time_frame}")
+        return {'status': 'Position already exists'}, 400
+
+    with stage('price', client.demo):
+        price = await get_price_cache(client.demo).aget_price(ticker, client)
+    with stage('contract', client.demo):
+        spec = await get_contract_cache(client.demo).aget(ticker, client)
+    try:
+        quantity = _order_quantity(spec, _position_usdt(account) / price, price, opening=True)
+    except InvalidOrder as e:
+        return _invalid_order(e, ticker, time_frame)
+    response = await _aplace_order(client, account, _market_order(ticker, 'BUY', quantity))
+    if not response['data']:
+        return _order_failed(response, ticker, time_frame)
+
+    avg_price = Decimal(response['data']['order']['avgPrice'])
+    executed_quantity = Decimal(response['data']['order']['executedQty'])
+    executed_quantity_usdt = avg_price * executed_quantity
+    with stage('position_write', client.demo):
+        await Position.objects.acreate(
+            account=account,
+            ticker=ticker,
+            timeframe=time_frame,
+            avg_buy_price=avg_price,
+            quantity=executed_quantity,
+            quantity_usdt=executed_quantity_usdt,
+            demo=client.demo,
+            **_exit_levels(avg_price),
+        )
+    return SUCCESS
+
+
+async def aclose_position(client, ticker: str, time_frame: str, account: Account = None) -> Result:
+    try:
+        with stage('position_lookup', client.demo):
+            position = await Position.objects.aget(account=account, ticker=ticker, timeframe=time_frame,
+                                                   closed_at__isnull=True)
+    except Position.DoesNotExist:
+        logger.warning(f"Position does not exist for {ticker} {time_frame}")
+        return {'status': 'Position does not exist'}, 400
+
+    with stage('price', client.demo):
+        price = await get_price_cache(client.demo).aget_price(ticker, client)
+    if price < position.avg_buy_price:
+        with stage('notify', client.demo):
+            notifier.enqueue(f"Price is less than average buy price for {ticker} {time_frame}")
+        return _below_buy_price(ticker, time_frame)
+
+    with stage('contract', client.demo):
+        spec = await get_contract_cache(client.demo).aget(ticker, client)
+    try:
+        quantity = _order_quantity(spec, position.quantity, price, opening=False)
+    except InvalidOrder as e:
+        return _invalid_order(e, ticker, time_frame)
+    response = await _aplace_order(client, account, _market_order(ticker, 'SELL', quantity))
+    if not response['data']:
+        return _order_failed(response, ticker, time_frame)
+
+    avg_price = response['data']['order']['avgPrice']
+    with stage('position_write', client.demo):
+        await sync_to_async(close_position_record)(position, avg_price)
+    return SUCCESS
+
+
+_fanout_pool: Optional[ThreadPoolExecutor] = None
+_fanout_lock = threading.Lock()
+
+
+def _get_fanout_pool() -> ThreadPoolExecutor:
+    global _fanout_pool
+    if _fanout_pool is None:
+        with _fanout_lock:
+            if _fanout_pool is None:
+                _fanout_pool = ThreadPoolExecutor(max_workers=ACCOUNT_FANOUT_WORKERS, thread_name_prefix='account')
+    return _fanout_pool
+
+
+def _reset_fanout_pool():
+    """The pool's threads don't survive a fork, start a new one in the child"""
+    global _fanout_pool, _fanout_lock
+    _fanout_pool = None
+    _fanout_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_fanout_pool)
+
+
+def enabled_accounts(demo: bool) -> List[Account]:
+    return list(Account.objects.filter(enabled=True, demo=demo).order_by('name'))
+
+
+def _run_for_account(func: Callable[[Account], Any], account: Account):
+    # Pool threads outlive requests, so they manage their connections like a request would
+    close_old_connections()
+    try:
+        return func(account)
+    finally:
+        close_old_connections()
+
+
+def _fan_out(accounts: List[Account], func: Callable[[Account], Any]) -> Dict[str, Any]:
+    """Call func for every account on the pool, returns the results or exceptions by account name"""
+    if len(accounts) == 1:
+        futures = None
+    else:
+        pool = _get_fanout_pool()
+        futures = [pool.submit(_run_for_account, func, account) for account in accounts]
+
+    results = {}
+    for position, account in enumerate(accounts):
+        try:
+            results[account.name] = func(account) if futures is None else futures[position].result()
+        except Exception as e:
+            logger.exception(f"Signal failed on account {account.name}")
+            results[account.name] = e
+    return results
+
+
+def _account_result(result) -> Dict[str, Any]:
+    if isinstance(result, Exception):
+        return {'status': 'error', 'error': str(result), 'code': 500}
+    payload, status = result
+    return {**payload, 'code': status}
+
+
+def _combine(results: Dict[str, Any]) -> Result:
+    """Merge per-account results into one, 207 when some accounts failed"""
+    accounts = {name: _account_result(result) for name, result in results.items()}
+    if all(result['code'] == 200 for result in accounts.values()):
+        return {'status': 'success', 'accounts': accounts}, 200
+    return {'status': 'Failed on some accounts', 'accounts': accounts}, 207
+
+
+def dispatch_signal(ticker: str, side: str, time_frame: str, use_demo: bool = False) -> Result:
+    """
+    Run a signal on every enabled account matching use_demo, concurrently.
+    """
+    accounts = enabled_accounts(use_demo)
+    if not accounts:
+        return execute_signal(ticker, side, time_frame, use_demo)
+    return _combine(_fan_out(
+        accounts, lambda account: execute_signal(ticker, side, time_frame, account.demo, account)
+    ))
+
+
+def dispatch_signals(signals: List[Signal]) -> List[Result]:
+    """
+    Batch counterpart of dispatch_signal, one result per signal in the same order.
+    """
+    results: List[Optional[Result]] = [None] * len(signals)
+    for demo in sorted({signal.use_demo for signal in signals}):
+        indexes = [index for index, signal in enumerate(signals) if signal.use_demo == demo]
+        group = [signals[index] for index in indexes]
+        accounts = enabled_accounts(demo)
+        if not accounts:
+            try:
+                executed = execute_signals(group)
+            except BatchFailed as e:
+                for index, result in zip(indexes, e.results):
+                    results[index] = result
+                raise BatchFailed(str(e), results) from e
+            for index, result in zip(indexes, executed):
+                results[index] = result
+            continue
+
+        by_account = _fan_out(accounts, lambda account: execute_signals(group, account))
+        for position, index in enumerate(indexes):
+            results[index] = _combine({
+                name: result if isinstance(result, Exception) else result[position]
+                for name, result in by_account.items()
+            })
+    return results
+
+
+async def adispatch_signal(ticker: str, side: str, time_frame: str, use_demo: bool = False) -> Result:
+    """
+    Async counterpart of dispatch_signal, accounts run as concurrent tasks.
+    """
+    accounts = [account async for account in Account.objects.filter(enabled=True, demo=use_demo).order_by('name')]
+    if not accounts:
+        return await aexecute_signal(ticker, side, time_frame, use_demo)
+    results = await asyncio.gather(
+        *(aexecute_signal(ticker, side, time_frame, account.demo, account) for account in accounts),
+        return_exceptions=True,
+    )
+    for account, result in zip(accounts, results):
+        if isinstance(result, Exception):
+            logger.error(f"Signal failed on account {account.name}: {result}")
+    return _combine({account.name: result for account, result in zip(accounts, results)})
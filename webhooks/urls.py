@@ -5,4 +5,9 @@ app_name = 'webhooks'
 
 urlpatterns = [
     path('webhook/', views.webhook_handler, name='webhook_handler'),
+    path('webhook/async/', views.async_webhook_handler, name='async_webhook_handler'),
+    path('webhook/queued/', views.queued_webhook_handler, name='queued_webhook_handler'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('stats/', views.stats_view, name='stats'),
+    path('export/positions/', views.export_positions_view, name='export_positions'),
 ]
@@ -1,147 +1,337 @@
-from django.http import JsonResponse
+from asyncio import iscoroutinefunction
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from functools import wraps
+import ipaddress
+import json
 import logging
+import time
+from datetime import date, timedelta
 import yaml
-from bingx_client import BingXClient
-from liftoff.settings import WEBHOOK_IP_ALLOWED
-from webhooks.models import Position, Settings
+from django.utils import timezone
+from liftoff.settings import METRICS_IP_ALLOWED, TRUSTED_PROXIES, WEBHOOK_IP_ALLOWED
 from decimal import Decimal
-from datetime import datetime
-from telegram_client import TelegramClient
-from django.conf import settings
+import metrics
+from metrics import WEBHOOK_SECONDS, demo_label, stage
+from webhooks import jobs
+from webhooks.export import FORMATS, filter_positions, stream_positions
+from webhooks.audit import audit_log
+from webhooks.idempotency import alert_key, deduplicator
+from webhooks.payload import Signal, parse_signals
+from webhooks import rollups
+from webhooks.trading import BatchFailed, adispatch_signal, dispatch_signal, dispatch_signals
+from asgiref.sync import sync_to_async
 
 POSITION_USDT = Decimal(100)
 
 logger = logging.getLogger(__name__)
-telegram_client = TelegramClient(settings.TELEGRAM_BOT_TOKEN, settings.TELEGRAM_CHAT_ID)
 
 
-def ip_whitelist(allowed_ips):
+_TRUSTED_PROXIES = [ipaddress.ip_network(proxy, strict=False) for proxy in TRUSTED_PROXIES]
+
+
+def _trusted_proxy(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in _TRUSTED_PROXIES)
+
+
+def _client_ip(request):
     """
-    Decorator to restrict access to specific IP addresses.
+    Address of the client, read from X-Forwarded-For on requests from a trusted proxy.
+
+    The header is read from the right, skipping the trusted proxies, the
+    entries on its left are whatever the client sent.
+    """
+    client_ip = request.META.get('REMOTE_ADDR')
+    if not _trusted_proxy(client_ip):
+        return client_ip
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    for ip in reversed(forwarded):
+        client_ip = ip
+        if not _trusted_proxy(ip):
+            break
+    return client_ip
+
+
+def ip_whitelist(allowed_ips, staff=False):
+    """
+    Decorator to restrict access to specific IP addresses, nobody gets in when there's none.
+    Works with both sync and async views.
+
+    Args:
+        allowed_ips: Client addresses allowed in
+        staff: Also let logged in staff users in, wherever they connect from
     """
+    def is_allowed(request):
+        client_ip = _client_ip(request)
+        if client_ip in allowed_ips:
+            return True
+        if staff and request.user.is_active and request.user.is_staff:
+            return True
+        logger.warning(f"Unauthorized access attempt to {request.path} from IP: {client_ip}")
+        return False
+
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # Loading the user hits the database
+                allowed = await sync_to_async(is_allowed)(request) if staff else is_allowed(request)
+                if not allowed:
+                    return JsonResponse({'status': 'Unauthorized'}, status=403)
+                return await view_func(request, *args, **kwargs)
+            return async_wrapper
+
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
-            x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-            if x_forwarded_for:
-                client_ip = x_forwarded_for.split(',')[0].strip()
-            else:
-                client_ip = request.META.get('REMOTE_ADDR')
-            
-            if not allowed_ips:
-                return view_func(request, *args, **kwargs)
-            
-            if client_ip not in allowed_ips:
-                logger.warning(f"Unauthorized webhook access attempt from IP: {client_ip}")
+            if not is_allowed(request):
                 return JsonResponse({'status': 'Unauthorized'}, status=403)
-            
             return view_func(request, *args, **kwargs)
         return wrapper
     return decorator
 
 
+def async_csrf_exempt(view_func):
+    """
+    csrf_exempt for async views, Django 4.2 wraps views in a sync function.
+    """
+    @wraps(view_func)
+    async def wrapper_view(*args, **kwargs):
+        return await view_func(*args, **kwargs)
+    wrapper_view.csrf_exempt = True
+    return wrapper_view
+
+
+def async_require_http_methods(request_method_list):
+    """
+    require_http_methods for async views.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def inner(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                return HttpResponseNotAllowed(request_method_list)
+            return await view_func(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+def parse_signal(request):
+    """
+    Decode and validate the webhook body into a Signal, or a list of them for batch payloads.
+
+    Returns a JsonResponse instead when the body is invalid.
+    """
+    data = request.body
+    with stage('parse') as timer:
+        try:
+            signal = parse_signals(data, request.content_type or '')
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON format: {data} - {e}")
+            timer.outcome = 'invalid'
+            return JsonResponse({'status': 'Invalid JSON format'}, status=400)
+        except yaml.YAMLError as e:
+            logger.error(f"Invalid YAML format: {data} - {e}")
+            timer.outcome = 'invalid'
+            return JsonResponse({'status': 'Invalid YAML format'}, status=400)
+        except Exception as e:
+            logger.error(f"Invalid data format: {data} - {e}")
+            timer.outcome = 'invalid'
+            return JsonResponse({'status': 'Invalid data format'}, status=400)
+        if isinstance(signal, Signal):
+            timer.demo = signal.use_demo
+    return signal
+
+
+def observe_request(view, request, signal, response, start):
+    audit_log.alert(view, request.body, signal, response, start)
+    if isinstance(signal, Signal):
+        side, demo = signal.side, signal.use_demo
+    elif isinstance(signal, list):
+        side, demo = 'batch', any(item.use_demo for item in signal)
+    else:
+        side, demo = 'invalid', False
+    WEBHOOK_SECONDS.labels(view, side, demo_label(demo), str(response.status_code)).observe(
+        time.perf_counter() - start
+    )
+    return response
+
+
+def signal_key(signal):
+    return alert_key(signal.ticker, signal.side, signal.timeframe, signal.use_demo, signal.alert_id, signal.bar_time)
+
+
+def batch_response(results, status=200):
+    return JsonResponse({'results': [{**payload, 'code': code} for payload, code in results]}, status=status)
+
+
+def run_batch(signals):
+    """
+    Execute a list payload in one batch, signals already seen get their stored result.
+    """
+    keys = [signal_key(signal) for signal in signals]
+    results = [deduplicator.begin(key) for key in keys]
+    pending = [index for index, result in enumerate(results) if result is None]
+    if pending:
+        try:
+            executed = dispatch_signals([signals[index] for index in pending])
+        except Exception as e:
+            # Signals whose order went out before the failure keep their result, the others can be sent again
+            partial = e.results if isinstance(e, BatchFailed) else [None] * len(pending)
+            for index, result in zip(pending, partial):
+                if result is None:
+                    deduplicator.abandon(keys[index])
+                else:
+                    deduplicator.finish(keys[index], result)
+            raise
+        for index, result in zip(pending, executed):
+            deduplicator.finish(keys[index], result)
+            results[index] = result
+    return results
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 @ip_whitelist(WEBHOOK_IP_ALLOWED)
 def webhook_handler(request):
     """
     Handle incoming webhook POST requests.
-    
-    This view processes webhook data in YAML format and can be extended to handle
+
+    This view processes webhook data in JSON or YAML format and can be extended to handle
     different types of webhook events based on your needs.
     """
+    start = time.perf_counter()
+    data = request.body
+    logger.info(f"Webhook received: {data}")
+    signal = parse_signal(request)
+    if isinstance(signal, JsonResponse):
+        return observe_request('webhook', request, signal, signal, start)
+    if isinstance(signal, list):
+        return observe_request('webhook', request, signal, batch_response(run_batch(signal)), start)
+
+    payload, status = deduplicator.run(
+        signal_key(signal),
+        lambda: dispatch_signal(signal.ticker, signal.side, signal.timeframe, signal.use_demo),
+    )
+    return observe_request('webhook', request, signal, JsonResponse(payload, status=status), start)
+
+
+@async_csrf_exempt
+@async_require_http_methods(["POST"])
+@ip_whitelist(WEBHOOK_IP_ALLOWED)
+async def async_webhook_handler(request):
+    """
+    Async version of webhook_handler, served natively when running under ASGI.
+
+    Exchange round trips don't block a worker, so a single process can keep
+    many orders in flight during an alert storm.
+    """
+    start = time.perf_counter()
+    data = request.body
+    logger.info(f"Webhook received: {data}")
+    signal = parse_signal(request)
+    if isinstance(signal, JsonResponse):
+        return observe_request('async_webhook', request, signal, signal, start)
+    if isinstance(signal, list):
+        results = await sync_to_async(run_batch)(signal)
+        return observe_request('async_webhook', request, signal, batch_response(results), start)
+
+    payload, status = await deduplicator.arun(
+        signal_key(signal),
+        lambda: adispatch_signal(signal.ticker, signal.side, signal.timeframe, signal.use_demo),
+    )
+    return observe_request('async_webhook', request, signal, JsonResponse(payload, status=status), start)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@ip_whitelist(WEBHOOK_IP_ALLOWED)
+def queued_webhook_handler(request):
+    """
+    Validate and store the alert, then answer 202 right away.
+
+    The order is placed by the process_webhooks workers.
+    """
+    start = time.perf_counter()
     data = request.body
     logger.info(f"Webhook received: {data}")
+    signal = parse_signal(request)
+    if isinstance(signal, JsonResponse):
+        return observe_request('queued_webhook', request, signal, signal, start)
+
+    def enqueue(signal):
+        job = jobs.enqueue(data, signal)
+        return {'status': 'queued', 'job_id': job.pk}, 202
+
+    if isinstance(signal, list):
+        # Batches are queued one job per signal, workers execute them independently
+        results = [deduplicator.run(signal_key(item), lambda: enqueue(item)) for item in signal]
+        return observe_request('queued_webhook', request, signal, batch_response(results, status=202), start)
+
+    payload, status = deduplicator.run(signal_key(signal), lambda: enqueue(signal))
+    return observe_request('queued_webhook', request, signal, JsonResponse(payload, status=status), start)
+
+
+@require_http_methods(["GET"])
+@ip_whitelist(METRICS_IP_ALLOWED, staff=True)
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint.
+    """
+    content, content_type = metrics.render()
+    return HttpResponse(content, content_type=content_type)
+
+
+@require_http_methods(["GET"])
+@ip_whitelist(METRICS_IP_ALLOWED, staff=True)
+def stats_view(request):
+    """
+    Realized P&L totals, per day and per ticker, read from the daily rollups.
+
+    Accepts from and to (YYYY-MM-DD, default the last 30 days), ticker, timeframe,
+    demo (true or false, default both) and account (an account name, empty for
+    the account of the environment variables, default all of them).
+    """
     try:
-        # Parse YAML data
-        yaml_data = yaml.safe_load(data.decode('utf-8'))
-        
-        # Extract required fields from YAML
-        ticker = yaml_data.get('ticker')
-        side = yaml_data.get('side')
-        time_frame = yaml_data.get('timeframe')
-        use_demo = yaml_data.get('use_demo', False)
-        
-        # Validate required fields
-        if not all([ticker, side, time_frame]):
-            raise ValueError("Missing required fields: ticker, side, timeframe")
-            
-    except yaml.YAMLError as e:
-        logger.error(f"Invalid YAML format: {data} - {e}")
-        return JsonResponse({'status': 'Invalid YAML format'}, status=400)
-    except Exception as e:
-        logger.error(f"Invalid data format: {data} - {e}")
-        return JsonResponse({'status': 'Invalid data format'}, status=400)
-
-    trading_enabled = Settings.objects.get(key='trading_enabled').value == 'true'
-    if not trading_enabled:
-        logger.warning("Trading is not enabled")
-        return JsonResponse({'status': 'Trading is not enabled'}, status=400)
-
-    client = BingXClient(demo=use_demo)
-
-    if side == 'BUY':
-        # Only one position can be open at a time
-        if Position.objects.filter(ticker=ticker, timeframe=time_frame, closed_at__isnull=True).exists():
-            logger.warning(f"Position already exists for {ticker} {time_frame}")
-            return JsonResponse({'status': 'Position already exists'}, status=400)
-
-        price = client.get_price(ticker)
-        position_usdt = Decimal(Settings.objects.get(key='position_usdt').value)
-        quantity = position_usdt / price
-        response = client.place_order(
-            symbol=ticker,
-            side='BUY',
-            order_type='MARKET',
-            positionSide='LONG',
-            quantity=quantity
-        )
-        if not response['data']:
-            error_message = response['msg']
-            logger.warning(f"Failed to place order for {ticker} {time_frame}: {error_message}")
-            return JsonResponse({'status': 'Failed to place order', 'error': error_message}, status=400)
-
-        avg_price = Decimal(response['data']['order']['avgPrice'])
-        executed_quantity = Decimal(response['data']['order']['executedQty'])
-        executed_quantity_usdt = avg_price * executed_quantity
-        Position.objects.create(
-            ticker=ticker,
-            timeframe=time_frame,
-            avg_buy_price=avg_price,
-            quantity=executed_quantity,
-            quantity_usdt=executed_quantity_usdt
-        )
-    elif side == 'SELL':
-        try:
-            position = Position.objects.get(ticker=ticker, timeframe=time_frame, closed_at__isnull=True)
-        except Position.DoesNotExist:
-            logger.warning(f"Position does not exist for {ticker} {time_frame}")
-            return JsonResponse({'status': 'Position does not exist'}, status=400)
-
-        price = client.get_price(ticker)
-        if price < position.avg_buy_price:
-            logger.warning(f"Price is less than average buy price for {ticker} {time_frame}")
-            telegram_client.send_message(f"Price is less than average buy price for {ticker} {time_frame}")
-            return JsonResponse({'status': 'Price is less than average buy price'}, status=400)
-
-        response = client.place_order(
-            symbol=ticker,
-            side='SELL',
-            order_type='MARKET',
-            positionSide='LONG',
-            quantity=position.quantity
-        )
-        if not response['data']:
-            error_message = response['msg']
-            logger.warning(f"Failed to place order for {ticker} {time_frame}: {error_message}")
-            return JsonResponse({'status': 'Failed to place order', 'error': error_message}, status=400)
-
-        avg_price = response['data']['order']['avgPrice']
-        position.avg_sell_price = avg_price
-        position.closed_at = datetime.now()
-        position.save()
-
-    return JsonResponse({'status': 'success'})
\ No newline at end of file
+        end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else timezone.now().date()
+        start = date.fromisoformat(request.GET['from']) if request.GET.get('from') else end - timedelta(days=29)
+    except ValueError:
+        return JsonResponse({'status': 'Invalid date, expected YYYY-MM-DD'}, status=400)
+    demo = request.GET.get('demo')
+    if demo not in (None, 'true', 'false'):
+        return JsonResponse({'status': 'Invalid demo, expected true or false'}, status=400)
+    return JsonResponse(rollups.stats(
+        start, end, request.GET.get('ticker'), request.GET.get('timeframe'),
+        demo=None if demo is None else demo == 'true', account=request.GET.get('account'),
+    ))
+
+
+@require_http_methods(["GET"])
+@staff_member_required
+def export_positions_view(request):
+    """
+    Stream the position history with profit and profit rate, for staff users.
+
+    Accepts format (csv or parquet, default csv), from and to (YYYY-MM-DD, UTC days
+    the positions were opened on, default unbounded), ticker and timeframe.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        return JsonResponse({'status': f'Invalid format, expected one of {", ".join(FORMATS)}'}, status=400)
+    try:
+        start = date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+    except ValueError:
+        return JsonResponse({'status': 'Invalid date, expected YYYY-MM-DD'}, status=400)
+    positions = filter_positions(
+        start=start, end=end, ticker=request.GET.get('ticker'), timeframe=request.GET.get('timeframe'),
+    )
+    try:
+        return stream_positions(request, positions, fmt)
+    except ImportError as e:
+        return JsonResponse({'status': str(e)}, status=501)
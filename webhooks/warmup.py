@@ -0,0 +1,157 @@
+"""
+Warm-up of a freshly started worker.
+
+Runs before the worker accepts requests (see gunicorn.conf.py and
+liftoff/asgi.py), so the first alert it handles doesn't pay for importing the
+views, connecting to the database, loading the settings and contract rules or
+the TLS handshakes with BingX and Telegram. Every step is best effort: a
+failure is logged, the worker starts anyway and the step happens lazily on the
+first alert as before.
+"""
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.urls import get_resolver
+
+from contracts import get_contract_cache
+from webhooks.audit import audit_log
+from webhooks.models import Account
+
+logger = logging.getLogger(__name__)
+
+# Set to false to start workers cold
+WARM_UP = os.getenv('WARM_UP', 'true') == 'true'
+
+# Also warm the demo (VST) endpoint, for deployments trading on it
+WARM_UP_DEMO = os.getenv('WARM_UP_DEMO', 'false') == 'true'
+
+
+def _demos() -> List[bool]:
+    return [False, True] if WARM_UP_DEMO else [False]
+
+
+def _load_urls():
+    # Imports the views and, through them, the trading module and its clients
+    get_resolver().url_patterns
+
+
+def _load_settings():
+    from webhooks.settings_cache import trading_settings
+
+    trading_settings.reload()
+
+
+def _exchange_accounts() -> List[Tuple[Optional[Account], bool]]:
+    """The enabled accounts, or the environment account (None) when there are none, with their endpoint"""
+    from webhooks.trading import enabled_accounts
+
+    return [(account, demo) for demo in _demos() for account in enabled_accounts(demo) or [None]]
+
+
+def _connect_exchange():
+    from webhooks.trading import _account_client
+
+    for account, demo in _exchange_accounts():
+        _account_client(account, demo).sync_clock()
+
+
+def _load_contracts():
+    for demo in _demos():
+        get_contract_cache(demo).load()
+
+
+def _connect_telegram():
+    from webhooks.trading import telegram_client
+
+    if telegram_client.configured:
+        telegram_client.get_me().raise_for_status()
+
+
+STEPS = (
+    ('urls', _load_urls),
+    ('database', connection.ensure_connection),
+    ('settings', _load_settings),
+    ('exchange', _connect_exchange),
+    ('contracts', _load_contracts),
+    ('telegram', _connect_telegram),
+)
+
+# Under ASGI every request gets its own database connection and async BingX clients
+ASYNC_STEPS = tuple((name, step) for name, step in STEPS if name not in ('database', 'exchange'))
+
+
+def warm_up(steps=STEPS) -> Dict[str, float]:
+    """Run the warm-up steps, returns the seconds each one took"""
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {e}")
+        timings[name] = time.perf_counter() - start
+    logger.info("Worker warmed up: " + ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items()))
+    return timings
+
+
+def _warm_up_in_thread() -> Tuple[Dict[str, float], List[Tuple[Optional[Account], bool]]]:
+    try:
+        timings = warm_up(ASYNC_STEPS)
+        try:
+            accounts = _exchange_accounts()
+        except Exception as e:
+            logger.warning(f"Warm-up failed to list the accounts: {e}")
+            accounts = []
+        return timings, accounts
+    finally:
+        # The thread is discarded, don't leave its connection behind
+        connection.close()
+
+
+async def awarm_up() -> Dict[str, float]:
+    """
+    Warm-up for ASGI workers, on their event loop.
+
+    The sync steps run in a thread, the async BingX clients are cached per
+    event loop so their connections are opened here.
+    """
+    from webhooks.trading import _async_account_client
+
+    timings, accounts = await sync_to_async(_warm_up_in_thread, thread_sensitive=False)()
+    start = time.perf_counter()
+    for account, demo in accounts:
+        try:
+            await _async_account_client(account, demo).sync_clock()
+        except Exception as e:
+            logger.warning(f"Warm-up step async_exchange failed: {e}")
+    timings['async_exchange'] = time.perf_counter() - start
+    return timings
+
+
+def with_warm_up(application):
+    """
+    Wrap an ASGI application to warm up during the lifespan startup, and to
+    write the queued audit events on shutdown.
+
+    Servers such as uvicorn only accept connections once startup completed.
+    Django itself doesn't speak the lifespan protocol, other scopes are passed through.
+    """
+    async def app(scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if WARM_UP:
+                    await awarm_up()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await sync_to_async(audit_log.flush, thread_sensitive=False)()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    return app